@@ -0,0 +1,84 @@
+import math
+import statistics
+import time
+from array import array
+from typing import List
+
+from discord.opus import Encoder
+
+from jingler.mixer import JingleMixer, MIXING_AVAILABLE, FRAME_SAMPLES, FRAME_CHANNELS
+from jingler.opus import OPUS_FRAME_LENGTH_SECONDS
+
+# Measures how long JingleMixer takes to produce a 20 ms frame (decoding, mixing, limiting)
+# and how long discord.py then takes to encode it, for 1 to 8 jingles playing at once.
+# Requires numpy and libopus.
+
+MAX_STREAMS = 8
+STREAM_SECONDS = 10
+FRAME_BUDGET_MS = OPUS_FRAME_LENGTH_SECONDS * 1000
+
+
+def generate_stream(frequency: float, encoder: Encoder) -> List[bytes]:
+    frame_count = int(STREAM_SECONDS / OPUS_FRAME_LENGTH_SECONDS)
+    sample_rate = FRAME_SAMPLES / OPUS_FRAME_LENGTH_SECONDS
+
+    packets: List[bytes] = []
+    for frame_index in range(frame_count):
+        pcm = array("h")
+        for sample_index in range(FRAME_SAMPLES):
+            t = (frame_index * FRAME_SAMPLES + sample_index) / sample_rate
+            # Loud enough that several streams together make the limiter work
+            sample = int(20000 * math.sin(2 * math.pi * frequency * t))
+            pcm.extend([sample] * FRAME_CHANNELS)
+
+        packets.append(encoder.encode(pcm.tobytes(), FRAME_SAMPLES))
+
+    return packets
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+if not MIXING_AVAILABLE:
+    raise SystemExit("numpy is not installed, can't benchmark the mixer.")
+
+print("---- JINGLE MIXER BENCHMARK ----")
+print(f"Generating {MAX_STREAMS} streams of {STREAM_SECONDS} seconds...")
+
+encoder = Encoder()
+streams = [generate_stream(220 * (index + 1), encoder) for index in range(MAX_STREAMS)]
+
+print(f"{'Streams':>7} | {'Mix avg.':>10} | {'Mix p99':>10} | {'Encode avg.':>12} | {'Frame budget used':>17}")
+for stream_count in range(1, MAX_STREAMS + 1):
+    mixer = JingleMixer(max_streams=MAX_STREAMS)
+    for packets in streams[:stream_count]:
+        mixer.add(packets)
+
+    mix_ms: List[float] = []
+    encode_ms: List[float] = []
+    while True:
+        start = time.perf_counter()
+        frame = mixer.read()
+        mixed_at = time.perf_counter()
+        if not frame:
+            break
+
+        # What discord.py does with the frame next
+        encoder.encode(frame, FRAME_SAMPLES)
+        encoded_at = time.perf_counter()
+
+        mix_ms.append((mixed_at - start) * 1000)
+        encode_ms.append((encoded_at - mixed_at) * 1000)
+
+    mix_average = statistics.mean(mix_ms)
+    encode_average = statistics.mean(encode_ms)
+    budget_used = (mix_average + encode_average) / FRAME_BUDGET_MS * 100
+
+    print(
+        f"{stream_count:>7} | {mix_average:>7.3f} ms | {percentile(mix_ms, 0.99):>7.3f} ms | "
+        f"{encode_average:>9.3f} ms | {budget_used:>16.1f}%"
+    )
+
+print("DONE")
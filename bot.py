@@ -10,6 +10,7 @@ from discord.ext.commands import Bot, when_mentioned_or, Context, CheckFailure
 from jingler.database.db import Database
 from jingler.configuration import config
 from jingler.jingles import JingleManager
+from jingler.transcoding import TranscodingService
 
 from jingler.cogs.guild_settings import GuildSettingsCog
 from jingler.cogs.jingle_player import JinglePlayerCog
@@ -18,11 +19,31 @@ from jingler.cogs.user_settings import UserSettingsCog
 
 log = logging.getLogger(__name__)
 
-bot = Bot(
+
+class JinglerBot(Bot):
+    async def close(self):
+        if self.is_closed():
+            return
+
+        await super().close()
+
+        # Runs while the event loop is still alive (unlike anything after bot.run()),
+        # so the final play history batch and any queued database writes can still complete
+        # noinspection PyBroadException
+        try:
+            await database.flush_play_history()
+        except Exception as e:
+            log.error(f"Could not write play history on shutdown: {e}")
+
+        database.close()
+
+
+bot = JinglerBot(
     command_prefix=when_mentioned_or(config.PREFIX)
 )
 database = Database()
 jingle_manager = JingleManager()
+transcoding_service = TranscodingService()
 
 
 @bot.event
@@ -51,4 +72,7 @@ bot.add_cog(JinglePlayerCog(bot))
 bot.add_cog(MiscCog(bot))
 bot.add_cog(UserSettingsCog(bot))
 
+# Closing the bot also finishes any queued database writes (see JinglerBot.close)
 bot.run(config.BOT_TOKEN)
+
+transcoding_service.close()
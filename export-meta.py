@@ -0,0 +1,33 @@
+import pathlib
+from json import dump
+
+from jingler.catalog import JingleCatalog
+from jingler.jingles import JINGLES_DIR
+
+# The catalog is the authoritative store of jingle metadata,
+# this writes it back out as .meta files (e.g. for older Jingler versions or other tools)
+
+catalog = JingleCatalog()
+
+print("---- JINGLE METADATA EXPORTER ----")
+
+exported = 0
+for entry in catalog.entries.values():
+    if entry.filename is None:
+        print(f"Skipping {entry.id}, the catalog doesn't know its filename (run Jingler once to upgrade it).")
+        continue
+
+    meta_path: pathlib.Path = JINGLES_DIR / (entry.filename + ".meta")
+    if meta_path.exists():
+        continue
+
+    print(f"Saving into {meta_path}")
+    with open(str(meta_path), "w", encoding="utf8") as meta_file:
+        dump({
+            "id": entry.id,
+            "title": entry.title,
+            "length": entry.duration,
+        }, meta_file, indent=2, ensure_ascii=False)
+    exported += 1
+
+print(f"DONE, exported {exported} .meta files")
@@ -37,7 +37,7 @@ jingle_id = generate_id()
 jingle_title = input("Enter title: ")
 
 audio = mutagen.File(str(target_audio_path))
-jingle_length = round(audio.info.length, 1) + 0.2
+jingle_length = round(audio.info.length, 1)
 print(f"Length: {jingle_length}s")
 
 print(f"Saving into {target_meta_path}")
@@ -48,4 +48,4 @@ with open(str(target_meta_path), "w", encoding="utf8") as target_meta_file:
         "length": jingle_length,
     }, target_meta_file, indent=2, ensure_ascii=False)
 
-print("DONE")
+print("DONE, use the .reloadjingles command (or the jingles directory watcher) to make it available")
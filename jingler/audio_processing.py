@@ -0,0 +1,181 @@
+import json
+import logging
+import math
+import re
+import subprocess
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+from jingler.opus import transcode_to_opus_packets, OpusTranscodeError
+
+log = logging.getLogger(__name__)
+
+# Jingles are normalised to this integrated loudness (EBU R128)
+TARGET_LOUDNESS_LUFS = -16.0
+# ... unless that would push the true peak above this
+MAX_TRUE_PEAK_DBTP = -1.5
+# Quiet jingles aren't boosted by more than this, so noise doesn't get blown up
+MAX_GAIN_DB = 20.0
+
+# Anything quieter than this for at least MIN_SILENCE_SECONDS at the start or the end is trimmed
+SILENCE_THRESHOLD_DB = -50
+MIN_SILENCE_SECONDS = 0.05
+# Kept in front of and after the audio, so the first and last sounds aren't cut off
+SILENCE_PADDING_SECONDS = 0.02
+
+# Silence ending at most this close to the end of the stream is trailing silence
+# (FFmpeg 5 and newer log a silence_end at the end of the stream, older versions don't)
+END_OF_STREAM_TOLERANCE_SECONDS = 0.05
+
+_SILENCE_EVENT = re.compile(r"silence_(start|end): (-?[0-9.]+)")
+# Progress stats ("... time=00:01:02.50 bitrate=..."), the last one is printed once the whole input has been read
+_PROGRESS_TIME = re.compile(r"time=(\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+
+
+class AudioAnalysis:
+    """
+    Loudness and silence measurements of a jingle, and the processing derived from them.
+    """
+    __slots__ = (
+        "integrated_loudness", "true_peak", "start", "end"
+    )
+
+    def __init__(self, integrated_loudness: float, true_peak: float, start: float, end: Optional[float]):
+        """
+        :param integrated_loudness: Integrated loudness in LUFS (-inf for silence).
+        :param true_peak: True peak in dBTP.
+        :param start: Where the audio starts after the leading silence, in seconds.
+        :param end: Where the trailing silence starts, in seconds (None if there is no trailing silence).
+        """
+        self.integrated_loudness = integrated_loudness
+        self.true_peak = true_peak
+        self.start = start
+        self.end = end
+
+    @property
+    def gain(self) -> float:
+        """
+        Gain (in dB) that brings the jingle to the target loudness without exceeding the true peak limit.
+        """
+        if not math.isfinite(self.integrated_loudness) or not math.isfinite(self.true_peak):
+            return 0.0
+
+        gain = min(TARGET_LOUDNESS_LUFS - self.integrated_loudness, MAX_TRUE_PEAK_DBTP - self.true_peak)
+        return round(max(-MAX_GAIN_DB, min(MAX_GAIN_DB, gain)), 2)
+
+    def get_audio_filter(self) -> str:
+        """
+        :return: FFmpeg filter graph that trims the silence and applies the gain.
+        """
+        trim = f"atrim=start={self.start:.3f}"
+        if self.end is not None:
+            trim += f":end={self.end:.3f}"
+
+        return f"{trim},asetpts=PTS-STARTPTS,volume={self.gain}dB"
+
+    def __str__(self):
+        end = f"{self.end:.2f} s" if self.end is not None else "end"
+        return f"{self.integrated_loudness} LUFS, {self.true_peak} dBTP, gain {self.gain} dB, " \
+               f"audio from {self.start:.2f} s to {end}"
+
+
+def _parse_duration(ffmpeg_output: str) -> Optional[float]:
+    """
+    :param ffmpeg_output: FFmpeg's log output (with stats enabled).
+    :return: Duration of the processed stream in seconds, None if FFmpeg didn't print any stats.
+    """
+    progress = _PROGRESS_TIME.findall(ffmpeg_output)
+    if not progress:
+        return None
+
+    hours, minutes, seconds = progress[-1]
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def _parse_silence(ffmpeg_output: str, duration: Optional[float]) -> Tuple[float, Optional[float]]:
+    """
+    Find where the audio starts and ends, from silencedetect's output.
+    :param ffmpeg_output: FFmpeg's log output.
+    :param duration: Duration of the stream in seconds (see _parse_duration), if known.
+    :return: Tuple of (start, end) in seconds, end is None if there is no trailing silence.
+    """
+    # silencedetect logs "silence_start: <t>" and "silence_end: <t>" pairs
+    silences: List[List[Optional[float]]] = []
+    for event, timestamp in _SILENCE_EVENT.findall(ffmpeg_output):
+        if event == "start":
+            silences.append([max(0.0, float(timestamp)), None])
+        elif silences:
+            silences[-1][1] = float(timestamp)
+
+    def lasts_until_end(silence: List[Optional[float]]) -> bool:
+        # Depending on the version, silence at the end of the stream has no end or ends with the stream
+        return silence[1] is None or (duration is not None and silence[1] >= duration - END_OF_STREAM_TOLERANCE_SECONDS)
+
+    start = 0.0
+    end: Optional[float] = None
+
+    if silences and silences[0][0] <= SILENCE_PADDING_SECONDS:
+        if lasts_until_end(silences[0]):
+            # Nothing but silence, leave it be
+            return start, end
+
+        start = max(0.0, silences[0][1] - SILENCE_PADDING_SECONDS)
+
+    if silences and lasts_until_end(silences[-1]):
+        end = silences[-1][0] + SILENCE_PADDING_SECONDS
+
+    return start, end
+
+
+def analyse_audio(audio: Union[Path, bytes], executable: str = "ffmpeg") -> AudioAnalysis:
+    """
+    Measure the loudness and the leading/trailing silence of audio (a single FFmpeg pass, nothing is encoded).
+    :param audio: Path to the source audio file, or the contents of one (piped into FFmpeg).
+    :param executable: FFmpeg executable to use.
+    :return: AudioAnalysis with the measurements.
+    """
+    input_data: Optional[bytes] = audio if isinstance(audio, bytes) else None
+
+    ffmpeg_process = subprocess.run(
+        [
+            executable,
+            # Stats stay enabled, they report the duration of the stream
+            "-hide_banner",
+            "-i", "pipe:0" if input_data is not None else str(audio.absolute()),
+            "-af", f"silencedetect=noise={SILENCE_THRESHOLD_DB}dB:duration={MIN_SILENCE_SECONDS},"
+                   f"loudnorm=print_format=json",
+            "-f", "null",
+            "-",
+        ],
+        input=input_data if input_data is not None else b"",
+        capture_output=True,
+    )
+
+    output = ffmpeg_process.stderr.decode(errors="replace")
+    if ffmpeg_process.returncode != 0:
+        raise OpusTranscodeError(f"FFmpeg exited with code {ffmpeg_process.returncode}: {output}")
+
+    # loudnorm prints its measurements as a JSON object at the very end
+    try:
+        measurements = json.loads(output[output.rindex("{"):output.rindex("}") + 1])
+        integrated_loudness = float(measurements["input_i"])
+        true_peak = float(measurements["input_tp"])
+    except (ValueError, KeyError) as e:
+        raise OpusTranscodeError(f"Could not read loudness measurements from FFmpeg: {e}")
+
+    start, end = _parse_silence(output, _parse_duration(output))
+    return AudioAnalysis(integrated_loudness, true_peak, start, end)
+
+
+def process_to_opus_packets(audio: Union[Path, bytes], executable: str = "ffmpeg") -> List[bytes]:
+    """
+    Normalise the loudness of audio, trim its leading and trailing silence and transcode it to Opus packets.
+    Everything is baked into the packets, nothing has to be processed when the jingle is played.
+    :param audio: Path to the source audio file, or the contents of one (piped into FFmpeg).
+    :param executable: FFmpeg executable to use.
+    :return: A list of Opus packets.
+    """
+    analysis = analyse_audio(audio, executable)
+    log.debug(f"Processing {audio if isinstance(audio, Path) else 'uploaded audio'}: {analysis}")
+
+    return transcode_to_opus_packets(audio, executable, audio_filter=analysis.get_audio_filter())
@@ -0,0 +1,382 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Sequence
+
+from jingler.configuration import DATA_DIR
+from jingler.opus import OpusPacket, OPUS_FRAME_LENGTH_SECONDS, encode_packet_records, split_packet_records
+
+log = logging.getLogger(__name__)
+
+CATALOG_FILE = DATA_DIR / "jingles.catalog"
+
+#####
+# File layout (all integers little-endian):
+#   header:  magic "JNGC", format version (uint16), padding (uint16),
+#            index offset (uint64), entry count (uint32)
+#   frames:  concatenated Opus frames of every entry, each as <uint16 length><packet bytes>
+#   index:   located by the header's index offset, one record per entry:
+#            frame offset (uint64), frame count (uint32), frame data length (uint32), duration (float32),
+#            .meta file mtime (int64, ns), .meta file size (int64),
+#            source file mtime (int64, ns), source file size (int64),
+#            ID (uint8 length + UTF-8), title (uint16 length + UTF-8), source filename (uint16 length + UTF-8)
+#
+# Older versions are still read, writing upgrades them:
+#   version 1 records only have the source file mtime (float64, seconds) after the duration,
+#   no file fingerprint and no filename, so the .meta files are imported once (see JingleManager)
+#   version 2 records have the source file mtime (float64, seconds) in front of the fingerprint
+#
+# The catalog is the authoritative store of jingle metadata: the index is read with a single sequential pass
+# on startup, .meta files are only read when (re)importing.
+#
+# Appending writes the new frames and a new index to the end of the file and only then updates the header,
+# so the file only ever grows, a crash mid-append leaves the old index intact
+# and already handed out memoryviews stay valid. Stale frames and indexes are dropped by rebuilding.
+#
+# Rebuilding writes a complete new file under the next generation's name ("jingles.catalog.1", ...),
+# the file that is currently mapped is never replaced (Windows doesn't allow that). The newest generation is
+# the current catalog, older ones are deleted once nothing maps them any more.
+#####
+CATALOG_MAGIC = b"JNGC"
+CATALOG_VERSION = 3
+
+_HEADER = struct.Struct("<4sHxxQI")
+_INDEX_RECORD_V1 = struct.Struct("<QIIfd")
+_INDEX_RECORD_V2 = struct.Struct("<QIIfdqqqq")
+_INDEX_RECORD = struct.Struct("<QIIfqqqq")
+_ID_LENGTH = struct.Struct("<B")
+_TITLE_LENGTH = struct.Struct("<H")
+_FILENAME_LENGTH = struct.Struct("<H")
+
+# (.meta file mtime, .meta file size, source file mtime, source file size), mtimes in nanoseconds
+FileFingerprint = Tuple[int, int, int, int]
+EMPTY_FINGERPRINT: FileFingerprint = (0, 0, 0, 0)
+
+# Source file size of entries read from a version 1 catalog, which only stored the source file mtime
+UNKNOWN_SIZE = -1
+# ... and only as float seconds, which is precise to well under a microsecond
+_V1_MTIME_TOLERANCE_NS = 1000
+
+
+class CatalogError(Exception):
+    pass
+
+
+class CatalogEntry:
+    __slots__ = (
+        "id", "title", "filename", "fingerprint",
+        "offset", "frame_count", "data_length", "duration"
+    )
+
+    def __init__(
+            self, id_: str, title: str, filename: Optional[str], fingerprint: FileFingerprint,
+            offset: int, frame_count: int, data_length: int, duration: float
+    ):
+        self.id = id_
+        self.title = title
+        # None for entries read from a version 1 catalog
+        self.filename = filename
+        self.fingerprint = fingerprint
+        self.offset = offset
+        self.frame_count = frame_count
+        self.data_length = data_length
+        self.duration = duration
+
+    def has_source(self, mtime_ns: int, size: int) -> bool:
+        """
+        Check whether the entry's frames were encoded from a source file with this mtime and size.
+        :param mtime_ns: Source file mtime in nanoseconds.
+        :param size: Source file size.
+        :return: Boolean indicating whether the source file is unchanged.
+        """
+        _, _, source_mtime_ns, source_size = self.fingerprint
+        if source_size == UNKNOWN_SIZE:
+            return abs(source_mtime_ns - mtime_ns) < _V1_MTIME_TOLERANCE_NS
+
+        return source_mtime_ns == mtime_ns and source_size == size
+
+
+class CatalogUpdate:
+    """
+    A new or changed jingle to write into the catalog. If packets is None, the existing frames are kept
+    (only the metadata changed).
+    """
+    __slots__ = (
+        "id", "title", "filename", "fingerprint", "packets"
+    )
+
+    def __init__(
+            self, id_: str, title: str, filename: str, fingerprint: FileFingerprint,
+            packets: Optional[Sequence[OpusPacket]]
+    ):
+        self.id = id_
+        self.title = title
+        self.filename = filename
+        self.fingerprint = fingerprint
+        self.packets = packets
+
+
+class JingleCatalog:
+    """
+    A single packed file containing the pre-encoded Opus frames of every jingle.
+    The file is memory-mapped and packets are handed out as zero-copy memoryview slices.
+    """
+    def __init__(self, catalog_file: Path = CATALOG_FILE):
+        # Name of the first generation, rebuilt generations are named after it (see _get_generation_file)
+        self.catalog_file = catalog_file
+        self.generation: int = self._find_latest_generation()
+        self.entries: Dict[str, CatalogEntry] = {}
+        # Format version of the file as it currently is on disk, writing always upgrades it to CATALOG_VERSION
+        self.version: int = CATALOG_VERSION
+
+        self._mmap: Optional[mmap.mmap] = None
+        # Keeps entries and the mapping they point into consistent while the catalog is being reopened on another thread
+        self._lock = threading.Lock()
+
+        if not self.path.exists():
+            self._write_empty()
+
+        self._open()
+        self._remove_stale_generations()
+
+    def __contains__(self, jingle_id: str) -> bool:
+        return jingle_id in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def path(self) -> Path:
+        """
+        Path of the current generation of the catalog file.
+        """
+        return self._get_generation_file(self.generation)
+
+    @property
+    def file_size(self) -> int:
+        return self._mmap.size() if self._mmap is not None else 0
+
+    @property
+    def data_size(self) -> int:
+        """
+        Total size of the frames that are still referenced by the index.
+        """
+        return sum(entry.data_length for entry in self.entries.values())
+
+    def get_entry(self, jingle_id: str) -> Optional[CatalogEntry]:
+        return self.entries.get(jingle_id)
+
+    def get_packets(self, jingle_id: str) -> List[memoryview]:
+        """
+        Return the Opus packets of a jingle as memoryview slices into the mapped catalog file.
+        :param jingle_id: Jingle ID to get the packets for.
+        :return: A list of memoryviews, one per Opus packet.
+        """
+        with self._lock:
+            entry = self.entries.get(jingle_id)
+            mapping = self._mmap
+        if entry is None:
+            raise KeyError(jingle_id)
+
+        frames = memoryview(mapping)[entry.offset:entry.offset + entry.data_length]
+        return split_packet_records(frames, entry.frame_count)
+
+    def append(self, updates: Iterable[CatalogUpdate]):
+        """
+        Append (or replace) jingles in the catalog.
+        Replaced entries leave their old frames behind until the catalog is rebuilt.
+        :param updates: Iterable of CatalogUpdates.
+        """
+        entries: Dict[str, CatalogEntry] = dict(self.entries)
+
+        with open(str(self.path), "r+b") as catalog:
+            catalog.seek(0, os.SEEK_END)
+
+            appended = 0
+            encoded = 0
+            for update in updates:
+                if update.packets is not None:
+                    offset, frame_count, data_length = self._write_frames(catalog, update.packets)
+                    encoded += 1
+                else:
+                    old_entry = entries.get(update.id)
+                    if old_entry is None:
+                        raise CatalogError(f"Can't update the metadata of \"{update.id}\", it has no frames.")
+
+                    offset, frame_count, data_length = old_entry.offset, old_entry.frame_count, old_entry.data_length
+
+                entries[update.id] = CatalogEntry(
+                    update.id, update.title, update.filename, update.fingerprint,
+                    offset, frame_count, data_length, round(frame_count * OPUS_FRAME_LENGTH_SECONDS, 2)
+                )
+                appended += 1
+
+            if appended == 0:
+                return
+
+            self._write_index_and_header(catalog, entries)
+
+        log.info(f"Updated {appended} jingles in the catalog ({encoded} with new audio).")
+        self._open()
+
+    def rebuild(self, keep_ids: Iterable[str]):
+        """
+        Rewrite the catalog with only the specified jingles, dropping any unreferenced frames.
+        The new catalog is written to a temporary file and then moved to the next generation's name.
+        :param keep_ids: Jingle IDs to keep.
+        """
+        next_generation = self.generation + 1
+        temporary_file = self.catalog_file.with_name(self.catalog_file.name + ".tmp")
+        entries: Dict[str, CatalogEntry] = {}
+
+        with open(str(temporary_file), "wb") as catalog:
+            catalog.write(_HEADER.pack(CATALOG_MAGIC, CATALOG_VERSION, _HEADER.size, 0))
+
+            for jingle_id in keep_ids:
+                old_entry = self.entries.get(jingle_id)
+                if old_entry is None:
+                    continue
+
+                offset, frame_count, data_length = self._write_frames(catalog, self.get_packets(jingle_id))
+                entries[jingle_id] = CatalogEntry(
+                    old_entry.id, old_entry.title, old_entry.filename, old_entry.fingerprint,
+                    offset, frame_count, data_length, old_entry.duration
+                )
+
+            self._write_index_and_header(catalog, entries)
+
+        # Nothing has the new name mapped, so this works on Windows as well
+        os.replace(str(temporary_file), str(self._get_generation_file(next_generation)))
+        self.generation = next_generation
+        log.info(f"Rebuilt the catalog with {len(entries)} jingles.")
+
+        self._open()
+        self._remove_stale_generations()
+
+    #####
+    # Private
+    #####
+    def _get_generation_file(self, generation: int) -> Path:
+        if generation == 0:
+            return self.catalog_file
+        return self.catalog_file.with_name(f"{self.catalog_file.name}.{generation}")
+
+    def _find_latest_generation(self) -> int:
+        prefix = self.catalog_file.name + "."
+        generations = [
+            int(file.name[len(prefix):])
+            for file in self.catalog_file.parent.glob(prefix + "*")
+            if file.name[len(prefix):].isdigit()
+        ]
+        return max(generations, default=0)
+
+    def _remove_stale_generations(self):
+        for generation in range(self.generation):
+            stale_file = self._get_generation_file(generation)
+            try:
+                stale_file.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # On Windows, packets handed out from the old mapping keep the file open, try again next time
+                log.debug(f"Could not remove the old catalog file \"{stale_file}\" yet: {e}")
+
+    def _write_empty(self):
+        self.catalog_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(str(self.path), "wb") as catalog:
+            catalog.write(_HEADER.pack(CATALOG_MAGIC, CATALOG_VERSION, _HEADER.size, 0))
+
+    @staticmethod
+    def _write_frames(catalog, packets: Sequence[OpusPacket]) -> Tuple[int, int, int]:
+        offset = catalog.tell()
+        data = encode_packet_records(packets)
+        catalog.write(data)
+
+        return offset, len(packets), len(data)
+
+    def _write_index_and_header(self, catalog, entries: Dict[str, CatalogEntry]):
+        index_offset = catalog.tell()
+
+        for entry in entries.values():
+            encoded_id = entry.id.encode("utf8")
+            encoded_title = entry.title.encode("utf8")
+
+            encoded_filename = (entry.filename or "").encode("utf8")
+
+            catalog.write(_INDEX_RECORD.pack(
+                entry.offset, entry.frame_count, entry.data_length, entry.duration, *entry.fingerprint
+            ))
+            catalog.write(_ID_LENGTH.pack(len(encoded_id)))
+            catalog.write(encoded_id)
+            catalog.write(_TITLE_LENGTH.pack(len(encoded_title)))
+            catalog.write(encoded_title)
+            catalog.write(_FILENAME_LENGTH.pack(len(encoded_filename)))
+            catalog.write(encoded_filename)
+
+        catalog.flush()
+        os.fsync(catalog.fileno())
+
+        # Only point the header at the new index once it has been fully written
+        catalog.seek(0)
+        catalog.write(_HEADER.pack(CATALOG_MAGIC, CATALOG_VERSION, index_offset, len(entries)))
+        catalog.flush()
+        os.fsync(catalog.fileno())
+
+    def _open(self):
+        with open(str(self.path), "rb") as catalog:
+            # Packets handed out earlier keep the previous mapping alive until they are released
+            mapping = mmap.mmap(catalog.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, index_offset, entry_count = _HEADER.unpack_from(mapping, 0)
+        if magic != CATALOG_MAGIC:
+            raise CatalogError(f"\"{self.path}\" is not a jingle catalog.")
+        if version not in (1, 2, CATALOG_VERSION):
+            raise CatalogError(f"Unsupported catalog version: {version}.")
+
+        entries: Dict[str, CatalogEntry] = {}
+        position = index_offset
+        for _ in range(entry_count):
+            if version == 1:
+                offset, frame_count, data_length, duration, source_mtime = \
+                    _INDEX_RECORD_V1.unpack_from(mapping, position)
+                fingerprint = (0, 0, round(source_mtime * 1e9), UNKNOWN_SIZE)
+                position += _INDEX_RECORD_V1.size
+            elif version == 2:
+                # The float source mtime is also part of the fingerprint
+                offset, frame_count, data_length, duration, _, *fingerprint = \
+                    _INDEX_RECORD_V2.unpack_from(mapping, position)
+                fingerprint = tuple(fingerprint)
+                position += _INDEX_RECORD_V2.size
+            else:
+                offset, frame_count, data_length, duration, *fingerprint = _INDEX_RECORD.unpack_from(mapping, position)
+                fingerprint = tuple(fingerprint)
+                position += _INDEX_RECORD.size
+
+            (id_length,) = _ID_LENGTH.unpack_from(mapping, position)
+            position += _ID_LENGTH.size
+            jingle_id = mapping[position:position + id_length].decode("utf8")
+            position += id_length
+
+            (title_length,) = _TITLE_LENGTH.unpack_from(mapping, position)
+            position += _TITLE_LENGTH.size
+            title = mapping[position:position + title_length].decode("utf8")
+            position += title_length
+
+            filename: Optional[str] = None
+            if version != 1:
+                (filename_length,) = _FILENAME_LENGTH.unpack_from(mapping, position)
+                position += _FILENAME_LENGTH.size
+                filename = mapping[position:position + filename_length].decode("utf8")
+                position += filename_length
+
+            entries[jingle_id] = CatalogEntry(
+                jingle_id, title, filename, fingerprint, offset, frame_count, data_length, duration
+            )
+
+        with self._lock:
+            self._mmap = mapping
+            self.entries = entries
+            self.version = version
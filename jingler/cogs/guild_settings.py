@@ -1,6 +1,6 @@
 import asyncio
 import logging
-from typing import Optional
+from typing import Optional, List
 
 from discord import Message
 from discord.ext.commands import Cog, Bot, command, Context
@@ -10,6 +10,7 @@ from jingler.database.db import Database
 from jingler.emojis import Emoji
 from jingler.jingles import JingleManager, Jingle, format_jingles_for_pagination, JingleMode
 from jingler.pagination import is_reaction_author, Pagination
+from jingler.search import SEARCH_RESULT_LIMIT
 from jingler.utilities import sanitize_jingle_code
 
 log = logging.getLogger(__name__)
@@ -23,6 +24,7 @@ HELP_SET_JINGLE_MODE: str = \
     "\tdisabled - do not play any jingles\n" \
     "\tsingle - play a specific jingle\n" \
     "\trandom - play a completely random jingle each time\n" \
+    "\tshuffle - play a random jingle each time, but play every jingle once before repeating any\n" \
     "Note that personal theme songs override this setting, unless the theme song mode is set to \"disabled\"."
 
 
@@ -35,10 +37,10 @@ class GuildSettingsCog(Cog, name="ServerSettings"):
         help="Displays the jingle mode for the current server."
     )
     async def cmd_get_jingle_mode(self, ctx: Context):
-        jingle_mode: JingleMode = database.guild_get_jingle_mode(ctx.guild.id)
+        jingle_mode: JingleMode = await database.guild_get_jingle_mode(ctx.guild.id)
 
         if jingle_mode == JingleMode.SINGLE:
-            default_jingle_id: Optional[str] = database.guild_get_default_jingle_id(ctx.guild.id)
+            default_jingle_id: Optional[str] = await database.guild_get_default_jingle_id(ctx.guild.id)
             default_jingle: Jingle = jingle_manager.get_jingle_by_id(default_jingle_id)
 
             # Warn the user if somehow the default jingle is unset
@@ -63,6 +65,12 @@ class GuildSettingsCog(Cog, name="ServerSettings"):
                 f"{Emoji.GAME_DIE} Jingle mode is set to `random` - "
                 "upon joining a voice channel a random jingle will be played."
             )
+        elif jingle_mode == JingleMode.SHUFFLE:
+            await ctx.send(
+                f"{Emoji.GAME_DIE} Jingle mode is set to `shuffle` - "
+                "upon joining a voice channel a random jingle will be played, "
+                "but every jingle is played once before any of them repeat."
+            )
         elif jingle_mode == JingleMode.DISABLED:
             await ctx.send(
                 f"{Emoji.DETECTIVE} Jingle mode is set to `disabled` - "
@@ -71,22 +79,22 @@ class GuildSettingsCog(Cog, name="ServerSettings"):
         else:
             await ctx.send(
                 f"{Emoji.EXCLAMATION} Something went wrong, the jingle mode is invalid. "
-                f"Please set it using `{config.PREFIX}setjinglemode [disabled/single/random]`"
+                f"Please set it using `{config.PREFIX}setjinglemode [disabled/single/random/shuffle]`"
             )
             raise ValueError(f"Invalid JingleMode: {jingle_mode}")
 
     @command(
         name="setjinglemode",
         help=HELP_SET_JINGLE_MODE,
-        usage="[disabled/single/random]"
+        usage="[disabled/single/random/shuffle]"
     )
     async def cmd_set_jingle_mode(self, ctx: Context, mode_set: Optional[str] = None):
         requested_mode = None if mode_set is None else mode_set.strip().lower()
 
-        if requested_mode is None or mode_set not in ["single", "random", "disabled"]:
+        if requested_mode is None or requested_mode not in ["single", "random", "shuffle", "disabled"]:
             # Show help message
             await ctx.send(
-                f"Usage: `{config.PREFIX}setjinglemode [disabled/single/random]`\n"
+                f"Usage: `{config.PREFIX}setjinglemode [disabled/single/random/shuffle]`\n"
                 + HELP_SET_JINGLE_MODE
             )
             return
@@ -95,22 +103,23 @@ class GuildSettingsCog(Cog, name="ServerSettings"):
             "disabled": JingleMode.DISABLED,
             "single": JingleMode.SINGLE,
             "random": JingleMode.RANDOM,
+            "shuffle": JingleMode.SHUFFLE,
         }.get(requested_mode)
 
         if mode_enum == JingleMode.SINGLE:
             # Reject until the default jingle is set
-            if database.guild_get_default_jingle_id(ctx.guild.id) is None:
+            if await database.guild_get_default_jingle_id(ctx.guild.id) is None:
                 await ctx.send(f"{Emoji.WARNING} Please set a default jingle first"
                                f" using the `{config.PREFIX}setdefault` command.")
                 return
 
-        database.guild_set_jingle_mode(ctx.guild.id, mode_enum)
+        await database.guild_set_jingle_mode(ctx.guild.id, mode_enum)
         if mode_enum == JingleMode.DISABLED:
             await ctx.send(
                 f"{Emoji.CHECKERED_FLAG} Guild jingle mode has been set to `disabled` - no jingles will be played."
             )
         elif mode_enum == JingleMode.SINGLE:
-            default_jingle_id: Optional[str] = database.guild_get_default_jingle_id(ctx.guild.id)
+            default_jingle_id: Optional[str] = await database.guild_get_default_jingle_id(ctx.guild.id)
             default_jingle: Jingle = jingle_manager.get_jingle_by_id(default_jingle_id)
             await ctx.send(
                 f"{Emoji.CHECKERED_FLAG} Guild jingle mode has been set to `single` "
@@ -121,13 +130,19 @@ class GuildSettingsCog(Cog, name="ServerSettings"):
                 f"{Emoji.CHECKERED_FLAG} Guild jingle mode has been set to `random` - "
                 "a random jingle will be played each time a member joins a voice channel."
             )
+        elif mode_enum == JingleMode.SHUFFLE:
+            await ctx.send(
+                f"{Emoji.CHECKERED_FLAG} Guild jingle mode has been set to `shuffle` - "
+                "a random jingle will be played each time a member joins a voice channel, "
+                "every jingle is played once before any of them repeat."
+            )
 
     @command(
         name="getdefault",
         help="Displays the default jingle for this server."
     )
     async def cmd_getdefault(self, ctx: Context):
-        default_jingle_id: Optional[str] = database.guild_get_default_jingle_id(ctx.guild.id)
+        default_jingle_id: Optional[str] = await database.guild_get_default_jingle_id(ctx.guild.id)
         default_jingle: Jingle = jingle_manager.get_jingle_by_id(default_jingle_id)
 
         if default_jingle is None:
@@ -141,27 +156,34 @@ class GuildSettingsCog(Cog, name="ServerSettings"):
         help="Sets the default jingle for this server. "
              "If the server jingle mode isn't set to \"single\", this will have no effect. "
              "If you know the jingle code already, you can pass it immediately. "
+             "You can also pass a search query (part of the title or filename). "
              "If not, you'll have a chance to pick one interactively.",
-        usage="(jingle code)"
+        usage="(jingle code/search query)"
     )
-    async def cmd_setdefault(self, ctx: Context, prefilled_jingle_id: Optional[str] = None):
-        if prefilled_jingle_id is not None:
-            # User already supplied the new default, check if the code is valid and update
+    async def cmd_setdefault(self, ctx: Context, *, prefilled_jingle_id: Optional[str] = None):
+        new_default_jingle_id: Optional[str] = None
+        matching_jingles: Optional[List[Jingle]] = None
 
-            prefilled_jingle_id = sanitize_jingle_code(prefilled_jingle_id)
-            if prefilled_jingle_id not in jingle_manager.jingles_by_id:
-                await ctx.send(f"{Emoji.WARNING} Invalid jingle code.")
-                return
+        if prefilled_jingle_id is not None:
+            # User already supplied the new default (or a search query for it), check if it's unambiguous
+            found_jingle: Optional[Jingle] = jingle_manager.find_jingle(prefilled_jingle_id)
+            if found_jingle is not None:
+                new_default_jingle_id = found_jingle.id
+            else:
+                matching_jingles = jingle_manager.search_jingles(prefilled_jingle_id, limit=SEARCH_RESULT_LIMIT)
+                if not matching_jingles:
+                    await ctx.send(f"{Emoji.WARNING} Invalid jingle code, no jingles match `{prefilled_jingle_id}`.")
+                    return
 
-            new_default_jingle_id: str = prefilled_jingle_id
-        else:
+        if new_default_jingle_id is None:
             # User did not yet choose a jingle, do this interactively
-            # List available jingles and allow the user to pick
+            # List available (or matching) jingles and allow the user to pick
             pagination = Pagination(
                 channel=ctx.channel,
                 client=self._bot,
-                beginning_content=f"{Emoji.DIVIDERS} Available jingles:",
-                item_list=format_jingles_for_pagination(jingle_manager),
+                beginning_content=f"{Emoji.DIVIDERS} Available jingles:" if matching_jingles is None
+                else f"{Emoji.MAG} Jingles matching `{prefilled_jingle_id}`:",
+                item_list=format_jingles_for_pagination(jingle_manager, matching_jingles),
                 item_max_per_page=10,
                 end_content=f"\nPick a jingle to set as the default on this server and reply with its code. "
                             f"If the \"single\" mode is active this jingle will be played each time "
@@ -183,7 +205,7 @@ class GuildSettingsCog(Cog, name="ServerSettings"):
                 await ctx.send(f"{Emoji.ALARM_CLOCK} Timed out (`2 minutes`), try again.")
                 return
 
-            new_default_jingle_id: str = sanitize_jingle_code(response.content)
+            new_default_jingle_id = sanitize_jingle_code(response.content)
             if new_default_jingle_id not in jingle_manager.jingles_by_id or len(new_default_jingle_id) != 5:
                 await ctx.send(f"{Emoji.WARNING} Invalid jingle code.")
                 return
@@ -195,7 +217,8 @@ class GuildSettingsCog(Cog, name="ServerSettings"):
             await ctx.send(f"{Emoji.WARNING} Something went wrong: the jingle was picked but does not exist.")
             return
 
-        database.guild_set_default_jingle_id(ctx.guild.id, new_default_jingle_id)
+        await database.guild_set_default_jingle_id(ctx.guild.id, new_default_jingle_id)
+        jingle_manager.prioritise_guild_default_jingle(ctx.guild.id, new_default_jingle_id)
         await ctx.send(
             f"{Emoji.BALLOT_BOX_WITH_CHECK} Default jingle set to `{new_default_jingle}`."
         )
@@ -205,7 +228,7 @@ class GuildSettingsCog(Cog, name="ServerSettings"):
         help="Check your current theme song mode in the server."
     )
     async def cmd_get_theme_song_mode(self, ctx: Context):
-        theme_song_mode: bool = database.guild_get_theme_songs_mode(ctx.guild.id)
+        theme_song_mode: bool = await database.guild_get_theme_songs_mode(ctx.guild.id)
         if theme_song_mode is True:
             await ctx.send(
                 f"{Emoji.PLACARD} Theme songs are currently **enabled**. If a member has their own theme song, "
@@ -242,7 +265,7 @@ class GuildSettingsCog(Cog, name="ServerSettings"):
             )
             return
 
-        database.guild_set_theme_songs_mode(ctx.guild.id, theme_song_option)
+        await database.guild_set_theme_songs_mode(ctx.guild.id, theme_song_option)
         if theme_song_option is True:
             await ctx.send(
                 f"{Emoji.PLACARD} Theme songs are now **enabled** - if a member has "
@@ -1,54 +1,67 @@
 import asyncio
 import logging
-from pathlib import Path
-from typing import Optional
+import time
+from typing import Optional, List, Tuple
 
-from discord import VoiceState, VoiceChannel, Message, Attachment, Member
-from discord.ext.commands import Cog, Bot, command, Context
+from discord import VoiceState, VoiceChannel, Message, Attachment, Member, Guild
+from discord.ext.commands import Cog, Bot, command, Context, is_owner
 
 from jingler.configuration import config
-from jingler.database.db import Database
+from jingler.database.db import Database, JoinContext
 from jingler.emojis import UnicodeEmoji, Emoji
-from jingler.jingles import JingleManager, JINGLES_DIR, save_jingle_meta, get_audio_file_length, JingleMode, \
-    sanitize_jingle_path
+from jingler.ingest import ingest_jingle, reprocess_jingles, is_supported_upload, IngestError, \
+    SUPPORTED_UPLOAD_EXTENSIONS
+from jingler.jingles import JingleManager, JingleMode, format_jingles_for_pagination
 from jingler.pagination import Pagination, is_reaction_author
-from jingler.player import get_guild_jingle, play_jingle
-from jingler.utilities import truncate_string, generate_jingle_id
+from jingler.player import get_guild_jingle, play_jingle, guild_join_limiter, member_join_limiter
+from jingler.rate_limit import try_consume_all
+from jingler.scheduler import PlaybackPriority
+from jingler.search import SEARCH_RESULT_LIMIT
+from jingler.voice_sessions import VoiceSessionManager
+from jingler.utilities import truncate_string, generate_jingle_id, sanitize_jingle_code
 from jingler.voice_state_diff import get_voice_state_change, VoiceStateAction
 
 log = logging.getLogger(__name__)
 
 database = Database()
 jingle_manager = JingleManager()
+voice_sessions = VoiceSessionManager()
 
 
 class JinglePlayerCog(Cog, name="Jingles"):
     def __init__(self, bot: Bot):
         self._bot = bot
+        self._reprocess_lock = asyncio.Lock()
 
     @command(
         name="playrandom",
         help="Manually play a random jingle in your current voice channel."
     )
     async def cmd_play(self, ctx: Context):
+        requested_at = time.monotonic()
+
         # Find member's voice channel
         voice_channel: Optional[VoiceChannel] = ctx.author.voice.channel if ctx.author.voice else None
         if not voice_channel:
             await ctx.send(f"{Emoji.WARNING} You're currently not in a voice channel.")
             return
 
-        if ctx.guild.voice_client is not None:
-            # Already playing somewhere
-            await ctx.reply(
-                f"{Emoji.RECEIPT} Already playing a jingle, please try again in a few moments."
-            )
-            return
-
         jingle = await get_guild_jingle(ctx.guild, JingleMode.RANDOM)
+        if jingle is None:
+            await ctx.send(f"{Emoji.WARNING} There are no jingles available.")
+            return
 
-        playing_msg = await ctx.reply(f"{Emoji.MEGA} Playing `{jingle}` in `#{voice_channel.name}`.")
+        if voice_sessions.is_busy(ctx.guild):
+            # Already playing somewhere, the jingle will be queued
+            playing_msg = await ctx.reply(
+                f"{Emoji.RECEIPT} Already playing a jingle, `{jingle}` will be played in `#{voice_channel.name}` next."
+            )
+        else:
+            playing_msg = await ctx.reply(f"{Emoji.MEGA} Playing `{jingle}` in `#{voice_channel.name}`.")
 
-        did_play = await play_jingle(voice_channel, jingle)
+        did_play = await play_jingle(
+            voice_channel, jingle, priority=PlaybackPriority.MANUAL, requested_at=requested_at
+        )
         if did_play:
             await playing_msg.add_reaction(UnicodeEmoji.BALLOT_BOX_WITH_CHECK)
         else:
@@ -60,7 +73,7 @@ class JinglePlayerCog(Cog, name="Jingles"):
              "React with appropriate arrows below the message to browse different pages."
     )
     async def cmd_list_jingles(self, ctx: Context):
-        listed_jingles = list(jingle_manager.jingles_by_id.values())
+        listed_jingles = jingle_manager.snapshot.jingles
         formatted_jingle_list = [
             f"[{jingle.id}]({jingle.path.name}) {jingle.title}" for index, jingle in enumerate(listed_jingles)
         ]
@@ -77,20 +90,77 @@ class JinglePlayerCog(Cog, name="Jingles"):
             begin_pagination_immediately=True,
         )
 
+    @command(
+        name="searchjingle",
+        help="Search jingles by code, title or filename.",
+        usage="[search query]"
+    )
+    async def cmd_search_jingle(self, ctx: Context, *, query: Optional[str] = None):
+        if query is None or not query.strip():
+            await ctx.send(f"Usage: `{config.PREFIX}searchjingle [search query]`")
+            return
+
+        matching_jingles = jingle_manager.search_jingles(query, limit=SEARCH_RESULT_LIMIT)
+        if not matching_jingles:
+            await ctx.send(f"{Emoji.MAG} No jingles match `{query}`.")
+            return
+
+        formatted_jingle_list = "\n".join(format_jingles_for_pagination(jingle_manager, matching_jingles))
+        await ctx.send(
+            f"{Emoji.MAG} Jingles matching `{query}`:\n"
+            f"```md\n{formatted_jingle_list}```"
+        )
+
     @command(
         name="reloadjingles",
         help="Reload available jingles. This is generally unnecessary."
     )
     async def cmd_reload_jingles(self, ctx: Context):
-        jingle_manager.reload_available_jingles()
+        await jingle_manager.reload_available_jingles_async()
         await ctx.send(
             f"{Emoji.BALLOT_BOX_WITH_CHECK} Jingles reloaded, **{len(jingle_manager.jingles_by_id)}** available."
         )
 
+    @command(
+        name="reprocessjingles",
+        help="Normalise the loudness and trim the silence of all jingles (or just one) again. "
+             "Only needed for jingles added before this was done automatically. Only for the bot's owner.",
+        usage="(jingle code)"
+    )
+    @is_owner()
+    async def cmd_reprocess_jingles(self, ctx: Context, jingle_code: Optional[str] = None):
+        # Keeps the transcoding workers busy for a while, so only one run at a time
+        if self._reprocess_lock.locked():
+            await ctx.send(f"{Emoji.WARNING} Already reprocessing jingles, try again once that's done.")
+            return
+
+        if jingle_code is not None:
+            jingle = jingle_manager.get_jingle_by_id(sanitize_jingle_code(jingle_code))
+            if jingle is None:
+                await ctx.send(f"{Emoji.WARNING} No such jingle: `{jingle_code}`.")
+                return
+
+            jingles = [jingle]
+        else:
+            jingles = list(jingle_manager.snapshot.jingles)
+
+        async with self._reprocess_lock:
+            response = await ctx.send(f"{Emoji.LEVEL_SLIDER} Reprocessing `{len(jingles)}` jingles...")
+
+            async def show_progress(status: str):
+                await response.edit(content=f"{Emoji.LEVEL_SLIDER} {status}")
+
+            reprocessed, failed = await reprocess_jingles(jingles, show_progress)
+
+        await response.edit(
+            content=f"{Emoji.BALLOT_BOX_WITH_CHECK} Reprocessed **{reprocessed}** jingles"
+                    + (f", **{failed}** failed (see the logs)." if failed else ".")
+        )
+
     @command(
         name="addjingle",
-        help="Interactively add a new jingle. Give it a title and upload the .mp3 file. "
-             "Note: MP3 files are limited to 1 MB and 10 seconds."
+        help="Interactively add a new jingle. Give it a title and upload an .mp3, .ogg, .wav, .flac or .m4a file. "
+             "Note: files are limited to 1 MB and 10 seconds."
     )
     async def cmd_add_jingle(self, ctx: Context):
         # Request a title from the user
@@ -127,7 +197,9 @@ class JinglePlayerCog(Cog, name="Jingles"):
         # Request an upload from the user
         await ctx.send(
             f"{Emoji.FILE_FOLDER} Cool, the title will be `{jingle_title}`!\n"
-            f"Please upload an `.mp3` file to finish adding a new jingle.\n"
+            f"Please upload an audio file "
+            f"({', '.join(f'`{extension}`' for extension in SUPPORTED_UPLOAD_EXTENSIONS)}) "
+            f"to finish adding a new jingle.\n"
             f"Make sure the file is smaller than `{config.MAX_JINGLE_FILESIZE_MB} MB` "
             f"and shorter than `{config.MAX_JINGLE_LENGTH_SECONDS} seconds`."
         )
@@ -136,7 +208,7 @@ class JinglePlayerCog(Cog, name="Jingles"):
             def ensure_upload(m: Message):
                 return m.author.id == ctx.author.id \
                        and len(m.attachments) == 1 \
-                       and m.attachments[0].filename.endswith(".mp3")
+                       and is_supported_upload(m.attachments[0].filename)
 
             user_upload_message: Message = await self._bot.wait_for("message", check=ensure_upload, timeout=240)
         except asyncio.TimeoutError:
@@ -145,53 +217,96 @@ class JinglePlayerCog(Cog, name="Jingles"):
 
         attachment: Attachment = user_upload_message.attachments[0]
 
-        # Make sure the file size limit is respected
-        if attachment.size >= (1024 * 1024 * config.MAX_JINGLE_FILESIZE_MB):
-            await ctx.send(f"{Emoji.X} File is too big.")
-            return
-
-        # Download the file into "jingles"
-        output_jingle_path: Path = sanitize_jingle_path(JINGLES_DIR, attachment.filename)
-        if output_jingle_path.exists():
-            await ctx.send(f"{Emoji.WARNING} A file with this name already exists, please rename and try again.")
-            return
-
-        response = await ctx.send(f"{Emoji.YARN} Saving...")
-        await attachment.save(str(output_jingle_path))
-
         log.info(
             f"User \"{ctx.author}\" ({ctx.author.id}) is adding a new jingle: "
-            f"title=\"{jingle_title}\", filepath=\"{str(output_jingle_path)}\", ID=\"{jingle_id}\"."
+            f"title=\"{jingle_title}\", filename=\"{attachment.filename}\", ID=\"{jingle_id}\"."
         )
 
-        # Make sure the audio file length limit is respected
-        if jingle_length := get_audio_file_length(output_jingle_path) > config.MAX_JINGLE_LENGTH_SECONDS:
-            await ctx.send(f"{Emoji.WARNING} File is too long (`{jingle_length} s`), please shorten and try again.")
+        # Download, check, transcode and save the jingle, then add it to the catalog
+        response = await ctx.send(f"{Emoji.YARN} Saving...")
+
+        async def show_progress(status: str):
+            await response.edit(content=f"{Emoji.YARN} {status}")
 
-            # Don't forget to delete the file!
-            if output_jingle_path.exists():
-                output_jingle_path.unlink()
+        try:
+            await ingest_jingle(attachment, jingle_id, jingle_title, show_progress)
+        except IngestError as e:
+            await response.edit(content=f"{Emoji.WARNING} {e}")
             return
 
-        # If everything checks out, generate the .meta file, reload available jingles
-        # and inform the user the new jingle has been successfully added
-        save_jingle_meta(output_jingle_path, jingle_title, jingle_id)
-
-        jingle_manager.reload_available_jingles()
         await response.edit(
             content=f"{Emoji.YARN} Jingle `{jingle_title}` saved and available with code `{jingle_id}`."
                     f"\n`{len(jingle_manager.jingles_by_id)}` jingles now available."
         )
 
+    @command(
+        name="jinglestats",
+        help="Show the most played jingles in this server and across all servers."
+    )
+    async def cmd_jingle_stats(self, ctx: Context, count: int = 5):
+        count = max(1, min(count, 20))
+
+        def format_most_played(most_played: List[Tuple[str, int]]) -> str:
+            if not most_played:
+                return "No jingles have been played yet."
+
+            lines = []
+            for place, (jingle_id, plays) in enumerate(most_played, start=1):
+                jingle = jingle_manager.get_jingle_by_id(jingle_id)
+                title = jingle.title if jingle is not None else "(removed)"
+                lines.append(f"{place}. [{jingle_id}] {title} - {plays} plays")
+            return "\n".join(lines)
+
+        guild_most_played = await database.get_most_played_jingles(ctx.guild.id, count)
+        guild_total_plays = await database.get_total_plays(ctx.guild.id)
+        global_most_played = await database.get_most_played_jingles(None, count)
+        global_total_plays = await database.get_total_plays(None)
+
+        await ctx.send(
+            f"{Emoji.BAR_CHART} Most played jingles in this server (`{guild_total_plays}` plays):\n"
+            f"```md\n{format_most_played(guild_most_played)}```"
+            f"Most played jingles overall (`{global_total_plays}` plays):\n"
+            f"```md\n{format_most_played(global_most_played)}```"
+        )
+
+    async def _preload_settings(self, guilds: List[Guild]):
+        if config.USE_SERVER_WHITELIST:
+            guilds = [guild for guild in guilds if guild.id in config.SERVER_WHITELIST]
+
+        # Members already in voice are the ones most likely to hop channels soon
+        user_ids = [
+            member.id
+            for guild in guilds
+            for channel in guild.voice_channels
+            for member in channel.members
+            if not member.bot
+        ]
+
+        cached_guilds, cached_users = await database.preload([guild.id for guild in guilds], user_ids)
+        log.info(f"Preloaded settings of {cached_guilds} guild(s) and {cached_users} user(s).")
+
+    @Cog.listener(name="on_ready")
+    async def jingles_on_ready(self):
+        if config.WATCH_JINGLES_DIRECTORY:
+            jingle_manager.start_watching()
+
+        # Also fires after reconnecting, in which case only guilds we haven't seen yet are loaded
+        await self._preload_settings(self._bot.guilds)
+
+        if jingle_manager.needs_import:
+            log.info("Importing jingle metadata from .meta files into the catalog.")
+            await jingle_manager.reload_available_jingles_async()
+
+    @Cog.listener()
+    async def on_guild_join(self, guild: Guild):
+        await self._preload_settings([guild])
+
     @Cog.listener()
     async def on_voice_state_update(self, member: Member, state_before: VoiceState, state_after: VoiceState):
+        joined_at = time.monotonic()
         if member.id == self._bot.user.id or member.bot:
             return
 
-        guild_jingle_mode: JingleMode = database.guild_get_jingle_mode(member.guild.id)
-        if guild_jingle_mode == JingleMode.DISABLED:
-            return
-
         # Make sure we only trigger this on whitelisted servers
         guild_id = member.guild.id
         if config.USE_SERVER_WHITELIST and guild_id not in config.SERVER_WHITELIST:
@@ -201,14 +316,25 @@ class JinglePlayerCog(Cog, name="Jingles"):
         if get_voice_state_change(state_before, state_after) != VoiceStateAction.JOINED:
             return
 
+        # Guild settings and the member's theme song are resolved in a single query (or from the cache)
+        join_context: JoinContext = await database.get_join_context(guild_id, member.id)
+        if join_context.jingle_mode == JingleMode.DISABLED:
+            return
+
+        # Channel hopping counts as joining as well, so rate limit members and guilds.
+        # A join only uses up tokens if neither limit drops it.
+        if not try_consume_all([(member_join_limiter, (guild_id, member.id)), (guild_join_limiter, guild_id)]):
+            log.debug(f"Join jingle for \"{member.name}\" ({member.id}) in guild {guild_id} was rate limited.")
+            return
+
         target_voice_channel: VoiceChannel = state_after.channel
 
         # If this user has a theme song (and they are enabled on the server), play that one
         # Otherwise pick a guild jingle (random/default, depending on setting)
-        user_theme_song_id: Optional[str] = database.user_get_theme_song_jingle_id(member.id)
-        guild_theme_songs_enabled: bool = database.guild_get_theme_songs_mode(guild_id)
+        user_theme_song_id: Optional[str] = join_context.theme_song_jingle_id
+        jingle_manager.prioritise_theme_song(member.id, user_theme_song_id)
 
-        if guild_theme_songs_enabled is True \
+        if join_context.theme_songs_enabled is True \
            and user_theme_song_id is not None \
            and user_theme_song_id in jingle_manager.jingles_by_id:
             jingle = jingle_manager.get_jingle_by_id(user_theme_song_id)
@@ -216,9 +342,12 @@ class JinglePlayerCog(Cog, name="Jingles"):
                 f"User \"{member.name}\" ({member.id}) has theme song: \"{jingle.title}\" ({jingle.path.name})"
             )
         else:
-            jingle = await get_guild_jingle(member.guild)
+            jingle = await get_guild_jingle(member.guild, join_context=join_context)
             log.info(
                 f"User \"{member.name}\" ({member.id}) picked from guild: \"{jingle}\"."
             )
 
-        await play_jingle(target_voice_channel, jingle)
+        if jingle is None:
+            return
+
+        await play_jingle(target_voice_channel, jingle, requested_at=joined_at)
@@ -10,11 +10,14 @@ from discord.ext.commands import Bot, Cog, command, Context
 from jingler.configuration import pyproject, BASE_DIR
 from jingler.database.db import Database
 from jingler.emojis import Emoji
+from jingler.jingles import JingleManager
+from jingler.player import playback_queue, voice_sessions, guild_join_limiter, member_join_limiter, latency_stats
 
 STARTUP_TIME = time.time()
 
 log = logging.getLogger(__name__)
 db = Database()
+jingle_manager = JingleManager()
 
 
 class MiscCog(Cog, name="Misc"):
@@ -43,13 +46,27 @@ class MiscCog(Cog, name="Misc"):
             git_info: str = ""
 
         # Database
-        db_total_changes = db.con.total_changes
+        db_total_changes = await db.get_total_changes()
+
+        # Packet cache
+        packet_cache = jingle_manager.packet_cache
+        packet_cache_usage = f"{round(packet_cache.size / 1024)}/{round(packet_cache.max_bytes / 1024)} KB"
+
+        # Voice
+        voice_scheduler = voice_sessions.scheduler
 
         await ctx.send(
             f"{Emoji.TRUMPET} I'm alive!\n"
             f"Version: `{pyproject.VERSION}{git_info}`.\n"
             f"Uptime: `{str(uptime_delta)}`\n"
-            f"Database: `{db_total_changes}` changes since startup"
+            f"Database: `{db_total_changes}` changes since startup, `{db.writer_stats}`\n"
+            f"Packet cache: `{len(packet_cache)}` jingles, `{packet_cache_usage}`, `{packet_cache.stats}`\n"
+            f"Playback queue: `{playback_queue.depth}` pending, `{playback_queue.stats}`\n"
+            f"Playback latency: `{latency_stats}` over `{latency_stats.samples}` jingles\n"
+            f"Voice sessions: `{voice_scheduler.active}/{voice_scheduler.max_slots}` active, "
+            f"`{voice_scheduler.waiting}` waiting, `{voice_scheduler.stats}`\n"
+            f"Rate limited join jingles: `{guild_join_limiter.limited}` (server), "
+            f"`{member_join_limiter.limited}` (member)"
         )
 
     @Cog.listener(name="on_ready")
@@ -1,5 +1,5 @@
 import asyncio
-from typing import Optional
+from typing import Optional, List
 
 from discord import Message
 from discord.ext.commands import Cog, Bot, command, Context
@@ -9,6 +9,7 @@ from jingler.database.db import Database
 from jingler.emojis import Emoji
 from jingler.jingles import Jingle, JingleManager, format_jingles_for_pagination
 from jingler.pagination import is_reaction_author, Pagination
+from jingler.search import SEARCH_RESULT_LIMIT
 from jingler.utilities import sanitize_jingle_code
 
 jingle_manager = JingleManager()
@@ -24,7 +25,7 @@ class UserSettingsCog(Cog, name="UserSettings"):
         help="Check what your current theme song is, if you have one."
     )
     async def cmd_get_theme_song(self, ctx: Context):
-        theme_song_id: Optional[str] = db.user_get_theme_song_jingle_id(ctx.author.id)
+        theme_song_id: Optional[str] = await db.user_get_theme_song_jingle_id(ctx.author.id)
         theme_song: Optional[Jingle] = jingle_manager.get_jingle_by_id(theme_song_id)
 
         if theme_song is None:
@@ -40,30 +41,43 @@ class UserSettingsCog(Cog, name="UserSettings"):
         help="Set your personal theme song. \n"
              "Run command with \"none\" to remove your theme song. "
              "If you know your new theme song (jingle)'s code already, you can add that to the end of the command. "
+             "You can also add a search query (part of the title or filename) instead. "
              "If you're not sure yet and want to browse, run the command without additional arguments and "
              "you'll have a chance to pick your favourite new jingle interactively.",
-        usage="(jingle code/\"none\")"
+        usage="(jingle code/search query/\"none\")"
     )
-    async def cmd_set_theme_song(self, ctx: Context, prefilled_jingle_code: Optional[str] = None):
+    async def cmd_set_theme_song(self, ctx: Context, *, prefilled_jingle_code: Optional[str] = None):
+        pick_interactively = True
+        new_theme_song_id: Optional[str] = None
+        matching_jingles: Optional[List[Jingle]] = None
+
         if prefilled_jingle_code is not None:
-            # User already supplied the new theme song, check if valid
+            # User already supplied the new theme song (or a search query for it), check if valid
             prefilled_jingle_code = str(prefilled_jingle_code).strip()
 
             if prefilled_jingle_code in ["disable", "disabled", "none"]:
-                new_theme_song_id: Optional[str] = None
+                pick_interactively = False
             else:
-                new_theme_song_id: Optional[str] = sanitize_jingle_code(prefilled_jingle_code)
-                if new_theme_song_id not in jingle_manager.jingles_by_id or len(new_theme_song_id) != 5:
-                    await ctx.send(f"{Emoji.WARNING} Invalid jingle code.")
-                    return
-
-        else:
-            # Select a jingle interactively
+                found_jingle: Optional[Jingle] = jingle_manager.find_jingle(prefilled_jingle_code)
+                if found_jingle is not None:
+                    pick_interactively = False
+                    new_theme_song_id = found_jingle.id
+                else:
+                    matching_jingles = jingle_manager.search_jingles(prefilled_jingle_code, limit=SEARCH_RESULT_LIMIT)
+                    if not matching_jingles:
+                        await ctx.send(
+                            f"{Emoji.WARNING} Invalid jingle code, no jingles match `{prefilled_jingle_code}`."
+                        )
+                        return
+
+        if pick_interactively:
+            # Select a jingle interactively (from all jingles or the ones matching the query)
             pagination = Pagination(
                 channel=ctx.channel,
                 client=self._bot,
-                beginning_content=f"{Emoji.DIVIDERS} Available jingles:",
-                item_list=format_jingles_for_pagination(jingle_manager),
+                beginning_content=f"{Emoji.DIVIDERS} Available jingles:" if matching_jingles is None
+                else f"{Emoji.MAG} Jingles matching `{prefilled_jingle_code}`:",
+                item_list=format_jingles_for_pagination(jingle_manager, matching_jingles),
                 item_max_per_page=10,
                 end_content=f"\nPick a jingle to set as the default on this server and reply with its code. "
                             f"If the \"single\" mode is activated, this jingle will "
@@ -99,7 +113,8 @@ class UserSettingsCog(Cog, name="UserSettings"):
 
         if new_theme_song_id is None:
             # Disable the theme song
-            db.user_set_theme_song_jingle_id(ctx.author.id, None)
+            await db.user_set_theme_song_jingle_id(ctx.author.id, None)
+            jingle_manager.prioritise_theme_song(ctx.author.id, None)
             await ctx.send(
                 f"{Emoji.POSTAL_HORN} Your theme song has been disabled."
             )
@@ -110,5 +125,6 @@ class UserSettingsCog(Cog, name="UserSettings"):
                 await ctx.send(f"{Emoji.WARNING} Something went wrong: the jingle was picked but does not exist.")
                 return
 
-            db.user_set_theme_song_jingle_id(ctx.author.id, new_theme_song_id)
+            await db.user_set_theme_song_jingle_id(ctx.author.id, new_theme_song_id)
+            jingle_manager.prioritise_theme_song(ctx.author.id, new_theme_song_id)
             await ctx.send(f"{Emoji.POSTAL_HORN} Your new theme song is `{new_theme_song}`.")
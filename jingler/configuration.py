@@ -54,7 +54,15 @@ class DiscordJingleConfig:
         "BOT_TOKEN",
         "PREFIX",
         "USE_SERVER_WHITELIST", "SERVER_WHITELIST",
-        "MAX_JINGLE_FILESIZE_MB", "MAX_JINGLE_LENGTH_SECONDS", "MAX_JINGLE_TITLE_LENGTH"
+        "MAX_JINGLE_FILESIZE_MB", "MAX_JINGLE_LENGTH_SECONDS", "MAX_JINGLE_TITLE_LENGTH",
+        "PACKET_CACHE_MAX_BYTES", "VOICE_IDLE_TIMEOUT_SECONDS",
+        "PLAYBACK_QUEUE_MAX_DEPTH", "PLAYBACK_QUEUE_COALESCE_SECONDS", "PLAYBACK_QUEUE_MAX_AGE_SECONDS",
+        "MAX_CONCURRENT_VOICE_SESSIONS", "MAX_WAITING_VOICE_REQUESTS",
+        "GUILD_JOIN_JINGLE_BURST", "GUILD_JOIN_JINGLES_PER_MINUTE",
+        "MEMBER_JOIN_JINGLE_BURST", "MEMBER_JOIN_JINGLES_PER_MINUTE",
+        "WATCH_JINGLES_DIRECTORY", "JINGLES_DIRECTORY_POLL_INTERVAL_SECONDS",
+        "MAX_TRANSCODING_PROCESSES", "MAX_QUEUED_TRANSCODING_JOBS",
+        "MIX_OVERLAPPING_JINGLES", "MAX_MIXED_JINGLES",
     )
 
     def __init__(self, toml_config: TOMLConfig):
@@ -72,6 +80,40 @@ class DiscordJingleConfig:
         self.MAX_JINGLE_FILESIZE_MB: float = round(int(_jingles_table.get("max_jingle_filesize_kb", 1024)) / 1024, 2)
         self.MAX_JINGLE_LENGTH_SECONDS: float = float(_jingles_table.get("max_jingle_length_seconds", 10))
         self.MAX_JINGLE_TITLE_LENGTH: int = int(_jingles_table.get("max_jingle_title_length", 65))
+        self.PACKET_CACHE_MAX_BYTES: int = \
+            int(_jingles_table.get("packet_cache_size_kb", 16384, ignore_empty=True)) * 1024
+        self.VOICE_IDLE_TIMEOUT_SECONDS: float = \
+            float(_jingles_table.get("voice_idle_timeout_seconds", 30, ignore_empty=True))
+        self.PLAYBACK_QUEUE_MAX_DEPTH: int = \
+            int(_jingles_table.get("playback_queue_max_depth", 5, ignore_empty=True))
+        self.PLAYBACK_QUEUE_COALESCE_SECONDS: float = \
+            float(_jingles_table.get("playback_queue_coalesce_seconds", 3, ignore_empty=True))
+        self.PLAYBACK_QUEUE_MAX_AGE_SECONDS: float = \
+            float(_jingles_table.get("playback_queue_max_age_seconds", 15, ignore_empty=True))
+        self.MAX_CONCURRENT_VOICE_SESSIONS: int = \
+            int(_jingles_table.get("max_concurrent_voice_sessions", 25, ignore_empty=True))
+        self.MAX_WAITING_VOICE_REQUESTS: int = \
+            int(_jingles_table.get("max_waiting_voice_requests", 100, ignore_empty=True))
+        self.GUILD_JOIN_JINGLE_BURST: int = \
+            int(_jingles_table.get("guild_join_jingle_burst", 10, ignore_empty=True))
+        self.GUILD_JOIN_JINGLES_PER_MINUTE: float = \
+            float(_jingles_table.get("guild_join_jingles_per_minute", 20, ignore_empty=True))
+        self.MEMBER_JOIN_JINGLE_BURST: int = \
+            int(_jingles_table.get("member_join_jingle_burst", 2, ignore_empty=True))
+        self.MEMBER_JOIN_JINGLES_PER_MINUTE: float = \
+            float(_jingles_table.get("member_join_jingles_per_minute", 3, ignore_empty=True))
+        self.WATCH_JINGLES_DIRECTORY: bool = \
+            bool(_jingles_table.get("watch_jingles_directory", False, ignore_empty=True))
+        self.JINGLES_DIRECTORY_POLL_INTERVAL_SECONDS: float = \
+            float(_jingles_table.get("jingles_directory_poll_interval_seconds", 10, ignore_empty=True))
+        self.MAX_TRANSCODING_PROCESSES: int = \
+            int(_jingles_table.get("max_transcoding_processes", 1, ignore_empty=True))
+        self.MAX_QUEUED_TRANSCODING_JOBS: int = \
+            int(_jingles_table.get("max_queued_transcoding_jobs", 5, ignore_empty=True))
+        self.MIX_OVERLAPPING_JINGLES: bool = \
+            bool(_jingles_table.get("mix_overlapping_jingles", False, ignore_empty=True))
+        self.MAX_MIXED_JINGLES: int = \
+            int(_jingles_table.get("max_mixed_jingles", 4, ignore_empty=True))
 
     @classmethod
     def load_main_configuration(cls) -> "DiscordJingleConfig":
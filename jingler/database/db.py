@@ -1,93 +1,559 @@
+import asyncio
 import logging
 import os
 import pathlib
+import time
+from collections import OrderedDict, deque
 from sqlite3 import Connection, connect, Cursor
-from typing import Dict, Optional, Any
+from typing import Dict, Optional, Any, Tuple, Hashable, Iterable, List, Deque
 
 from jingler.configuration import DATA_DIR
+from jingler.database.worker import DatabaseWriter, DatabaseReaderPool, WriterStats
 from jingler.jingles import JingleMode
 from jingler.utilities import get_nth_with_default, Singleton
 
 log = logging.getLogger(__name__)
 
 DATABASE_NAME = "jingler.db"
+DATABASE_PATH = DATA_DIR / DATABASE_NAME
 DB_INIT_FILEPATH = pathlib.Path(os.path.dirname(__file__), "db_init.sql")
 
+# Amount of threads (each with their own read-only connection) for concurrent reads
+DATABASE_READERS = 2
+
+# Writes are group-committed: a commit happens after this many writes or after waiting this long, whichever is first
+GROUP_COMMIT_MAX_WRITES = 64
+GROUP_COMMIT_MAX_DELAY_SECONDS = 0.005
+
 
 JINGLE_MODE_INT_TO_ENUM: Dict[int, JingleMode] = {
     0: JingleMode.DISABLED,
     1: JingleMode.SINGLE,
     2: JingleMode.RANDOM,
+    3: JingleMode.SHUFFLE,
 }
 JINGLE_MODE_ENUM_TO_INT: Dict[JingleMode, int] = {
     v: k for k, v in JINGLE_MODE_INT_TO_ENUM.items()
 }
 
+# Maximum amount of users whose settings are kept in memory (least recently used are dropped first)
+USER_CACHE_MAX_SIZE = 100000
+
+# Maximum amount of (guild, user) pairs per join context query (each pair takes two of SQLite's 999 parameters)
+JOIN_CONTEXT_QUERY_MAX_PAIRS = 400
+
+JOIN_PAIR = Tuple[int, Optional[int]]
+
+# Maximum amount of IDs per "WHERE id IN (...)" query when preloading settings
+PRELOAD_QUERY_CHUNK_SIZE = 500
+
+# Plays are buffered in memory and written in batches, the oldest ones are dropped if the buffer overflows
+PLAY_HISTORY_BUFFER_SIZE = 10000
+PLAY_HISTORY_FLUSH_INTERVAL_SECONDS = 30
+
+# (guild ID, jingle ID, manual, unix timestamp)
+PLAY_HISTORY_ROW = Tuple[int, str, int, int]
+
+
+class GuildSettings:
+    """
+    In-memory copy of a guild_settings row. Attribute names match the column names.
+    """
+    __slots__ = (
+        "jingle_mode", "theme_song_mode", "default_jingle_id"
+    )
+
+    COLUMNS = "jingle_mode, theme_song_mode, default_jingle_id"
+
+    def __init__(self, jingle_mode: Optional[int], theme_song_mode: Optional[int], default_jingle_id: Optional[str]):
+        self.jingle_mode = jingle_mode
+        self.theme_song_mode = theme_song_mode
+        self.default_jingle_id = default_jingle_id
+
+    @classmethod
+    def from_row(cls, row: Tuple[Optional[int], Optional[int], Optional[str]]) -> "GuildSettings":
+        return cls(*row)
+
+    @classmethod
+    def default(cls) -> "GuildSettings":
+        """
+        Settings of a guild that doesn't have a row yet. Must match the column defaults in db_init.sql.
+        """
+        return cls(
+            jingle_mode=2,
+            theme_song_mode=1,
+            default_jingle_id=None,
+        )
+
+
+class JoinContext:
+    """
+    Everything needed to decide what to play when a member joins a voice channel.
+    """
+    __slots__ = (
+        "jingle_mode", "theme_songs_enabled", "default_jingle_id", "theme_song_jingle_id"
+    )
+
+    def __init__(
+            self, jingle_mode: JingleMode, theme_songs_enabled: bool,
+            default_jingle_id: Optional[str], theme_song_jingle_id: Optional[str]
+    ):
+        self.jingle_mode = jingle_mode
+        self.theme_songs_enabled = theme_songs_enabled
+        self.default_jingle_id = default_jingle_id
+        self.theme_song_jingle_id = theme_song_jingle_id
+
+    @classmethod
+    def from_settings(cls, guild_settings: GuildSettings, theme_song_jingle_id: Optional[str]) -> "JoinContext":
+        return cls(
+            jingle_mode=JINGLE_MODE_INT_TO_ENUM.get(guild_settings.jingle_mode)
+            if guild_settings.jingle_mode is not None else JingleMode.DISABLED,
+            theme_songs_enabled=guild_settings.theme_song_mode is not None and guild_settings.theme_song_mode != 0,
+            default_jingle_id=guild_settings.default_jingle_id,
+            theme_song_jingle_id=theme_song_jingle_id,
+        )
+
+
+def _join_context_query(pair_count: int) -> str:
+    # The statement only depends on the amount of pairs, so sqlite3's statement cache keeps it prepared
+    pairs = ", ".join(["(?, ?)"] * pair_count)
+    return f"WITH joins (guild_id, user_id) AS (VALUES {pairs}) " \
+           f"SELECT joins.guild_id, joins.user_id, guild_settings.id IS NOT NULL, " \
+           f"guild_settings.jingle_mode, guild_settings.theme_song_mode, guild_settings.default_jingle_id, " \
+           f"user_settings.theme_song_jingle_id " \
+           f"FROM joins " \
+           f"LEFT JOIN guild_settings ON guild_settings.id = joins.guild_id " \
+           f"LEFT JOIN user_settings ON user_settings.id = joins.user_id"
+
+
+def _upsert_field(con: Connection, table: str, row_id: int, field_name: str, field_value: Any):
+    # Not "INSERT ... ON CONFLICT DO UPDATE", which needs SQLite 3.24 (older Python builds ship older versions).
+    # Both statements run in the writer's transaction, so nobody sees the row with only its defaults.
+    con.execute(f"INSERT OR IGNORE INTO {table} (id) VALUES (?)", (row_id,))
+    con.execute(f"UPDATE {table} SET {field_name} = ? WHERE id = ?", (field_value, row_id))
+
+
+class _WriteTracker:
+    """
+    Tracks in-flight writes per key, so a read that raced with a write doesn't put a stale row into the cache.
+    """
+    def __init__(self):
+        self._in_flight: Dict[Hashable, int] = {}
+        self._generation: Dict[Hashable, int] = {}
+
+    def begin(self, key: Hashable):
+        self._in_flight[key] = self._in_flight.get(key, 0) + 1
+
+    def end(self, key: Hashable):
+        remaining = self._in_flight[key] - 1
+        if remaining == 0:
+            del self._in_flight[key]
+        else:
+            self._in_flight[key] = remaining
+
+        self._generation[key] = self._generation.get(key, 0) + 1
+
+    def snapshot(self, key: Hashable) -> int:
+        return self._generation.get(key, 0)
+
+    def is_unchanged(self, key: Hashable, snapshot: int) -> bool:
+        return key not in self._in_flight and self._generation.get(key, 0) == snapshot
+
+
+def _connect_writer() -> Connection:
+    # Transactions are managed explicitly by the DatabaseWriter
+    con = connect(str(DATABASE_PATH), isolation_level=None)
+
+    # WAL lets the readers run concurrently with the writer,
+    # synchronous=FULL makes every (group) commit durable before the writes' awaitables resolve
+    con.execute("PRAGMA journal_mode = WAL;")
+    con.execute("PRAGMA synchronous = FULL;")
+    con.execute("PRAGMA busy_timeout = 5000;")
+    con.execute("PRAGMA temp_store = MEMORY;")
+    return con
+
+
+def _connect_reader() -> Connection:
+    con = connect(f"{DATABASE_PATH.as_uri()}?mode=ro", uri=True)
+    con.execute("PRAGMA busy_timeout = 5000;")
+    return con
+
 
 class Database(metaclass=Singleton):
     """
-    A SQLite3 database wrapper for guild_settings and user_settings.
+    An asynchronous SQLite3 database wrapper for guild_settings and user_settings.
+
+    Writes run on a dedicated writer thread (group-committed, see DatabaseWriter),
+    reads on a small pool of read-only connections, so the event loop never waits on SQLite (or a slow fsync) directly.
+
+    Reads never write: guilds and users without a row get the db_init.sql defaults,
+    rows are only created (upserted) on the first write.
+    Settings rows are cached in memory after the first read (including guilds and users without a row)
+    and setters write through to both the database and the cache.
     """
     def __init__(self):
-        self.con: Connection = connect(str(DATA_DIR / DATABASE_NAME))
         self._ensure_tables()
 
-    def _ensure_tables(self):
+        self._writer = DatabaseWriter(_connect_writer, GROUP_COMMIT_MAX_WRITES, GROUP_COMMIT_MAX_DELAY_SECONDS)
+        self._readers = DatabaseReaderPool(_connect_reader, DATABASE_READERS)
+
+        self._guild_cache: Dict[int, GuildSettings] = {}
+        # Values are theme song jingle IDs, None is cached as well (no theme song)
+        self._user_cache: "OrderedDict[int, Optional[str]]" = OrderedDict()
+
+        self._guild_writes = _WriteTracker()
+        self._user_writes = _WriteTracker()
+
+        self._play_history: Deque[PLAY_HISTORY_ROW] = deque(maxlen=PLAY_HISTORY_BUFFER_SIZE)
+        self._play_history_flusher: Optional[asyncio.Task] = None
+        self.play_history_dropped: int = 0
+
+    @staticmethod
+    def _ensure_tables():
         """
-        Ensure the proper tables (guild_settings and user_settings) exist.
+        Ensure the proper tables (guild_settings, user_settings and play_history) exist.
+        Runs synchronously, before the worker threads are started.
         """
-        cur: Cursor = self.con.cursor()
+        con: Connection = _connect_writer()
+        cur: Cursor = con.cursor()
 
         cur.execute("SELECT name FROM sqlite_master WHERE type='table';")
         tables = cur.fetchall()
 
-        if ("guild_settings",) not in tables or ("user_settings",) not in tables:
+        if ("guild_settings",) not in tables or ("user_settings",) not in tables or ("play_history",) not in tables:
             with open(str(DB_INIT_FILEPATH), "r", encoding="utf8") as db_init_file:
                 cur.executescript(db_init_file.read())
-            self.con.commit()
+            con.commit()
 
             log.info("Ran db_init.sql.")
         else:
-            log.info("guild_settings and user_settings already exist.")
+            log.info("guild_settings, user_settings and play_history already exist.")
+
+        con.close()
+
+    def close(self):
+        """
+        Finish any queued writes (including buffered play history) and close all connections.
+        """
+        self._writer.close()
+        self._readers.close()
+
+        if self._play_history:
+            # The writer thread is gone by now, so write the remaining plays directly
+            con: Connection = _connect_writer()
+            con.execute("BEGIN")
+            self._insert_play_history(con, list(self._play_history))
+            con.execute("COMMIT")
+            con.close()
+
+            self._play_history.clear()
+
+    @property
+    def writer_stats(self) -> WriterStats:
+        return self._writer.stats
+
+    async def get_total_changes(self) -> int:
+        """
+        Return the amount of rows changed through the writer connection since startup.
+        """
+        return await self._writer.submit(lambda con: con.total_changes)
 
     #####
-    # Guild private
+    # Join context
     #####
-    def _ensure_guild(self, guild_id: int):
+    @staticmethod
+    def _select_join_contexts(
+            con: Connection, pairs: List[JOIN_PAIR]
+    ) -> Dict[JOIN_PAIR, Tuple[GuildSettings, Optional[str]]]:
+        cur: Cursor = con.cursor()
+        rows: Dict[JOIN_PAIR, Tuple[GuildSettings, Optional[str]]] = {}
+
+        for chunk_start in range(0, len(pairs), JOIN_CONTEXT_QUERY_MAX_PAIRS):
+            chunk = pairs[chunk_start:chunk_start + JOIN_CONTEXT_QUERY_MAX_PAIRS]
+            cur.execute(
+                _join_context_query(len(chunk)),
+                [value for pair in chunk for value in pair]
+            )
+
+            for guild_id, user_id, guild_exists, jingle_mode, theme_song_mode, default_jingle_id, theme_song_id \
+                    in cur.fetchall():
+                guild_settings = GuildSettings(jingle_mode, theme_song_mode, default_jingle_id) \
+                    if guild_exists else GuildSettings.default()
+                rows[(guild_id, user_id)] = (guild_settings, theme_song_id)
+
+        return rows
+
+    async def get_join_contexts(self, pairs: Iterable[JOIN_PAIR]) -> Dict[JOIN_PAIR, JoinContext]:
         """
-        Make sure the guild entry exists.
-        :param guild_id: Guild ID to ensure the existence of.
+        Resolve the join contexts of many (guild ID, user ID) pairs at once.
+        Pairs that are fully cached are resolved from memory, the rest with as few LEFT JOIN queries as possible.
+        :param pairs: (guild ID, user ID) pairs. The user ID may be None if only guild settings are needed.
+        :return: Dictionary mapping each pair to its JoinContext.
         """
-        cur: Cursor = self.con.cursor()
-        cur.execute(
-            "SELECT id FROM guild_settings where id=?;",
-            (guild_id,)
-        )
+        contexts: Dict[JOIN_PAIR, JoinContext] = {}
+        uncached_pairs: List[JOIN_PAIR] = []
 
-        if cur.fetchone() is None:
-            # Create new guild
-            cur.execute(
-                "INSERT INTO guild_settings (id) VALUES (?);",
-                (guild_id,)
+        for pair in dict.fromkeys(pairs):
+            guild_id, user_id = pair
+            guild_settings: Optional[GuildSettings] = self._guild_cache.get(guild_id)
+
+            if guild_settings is not None and (user_id is None or user_id in self._user_cache):
+                theme_song_jingle_id = self._touch_user_theme_song(user_id) if user_id is not None else None
+                contexts[pair] = JoinContext.from_settings(guild_settings, theme_song_jingle_id)
+            else:
+                uncached_pairs.append(pair)
+
+        if not uncached_pairs:
+            return contexts
+
+        guild_snapshots = {guild_id: self._guild_writes.snapshot(guild_id) for guild_id, _ in uncached_pairs}
+        user_snapshots = {
+            user_id: self._user_writes.snapshot(user_id) for _, user_id in uncached_pairs if user_id is not None
+        }
+        rows = await self._readers.submit(lambda con: self._select_join_contexts(con, uncached_pairs))
+
+        for pair, (selected_guild_settings, selected_theme_song_jingle_id) in rows.items():
+            guild_id, user_id = pair
+
+            # Anything cached in the meantime is at least as fresh as what we've just read
+            guild_settings = self._guild_cache.get(guild_id)
+            if guild_settings is None:
+                guild_settings = selected_guild_settings
+                if self._guild_writes.is_unchanged(guild_id, guild_snapshots[guild_id]):
+                    self._guild_cache[guild_id] = guild_settings
+
+            theme_song_jingle_id: Optional[str] = None
+            if user_id is not None:
+                if user_id in self._user_cache:
+                    theme_song_jingle_id = self._touch_user_theme_song(user_id)
+                else:
+                    theme_song_jingle_id = selected_theme_song_jingle_id
+                    if self._user_writes.is_unchanged(user_id, user_snapshots[user_id]):
+                        self._cache_user_theme_song(user_id, theme_song_jingle_id)
+
+            contexts[pair] = JoinContext.from_settings(guild_settings, theme_song_jingle_id)
+
+        return contexts
+
+    async def get_join_context(self, guild_id: int, user_id: Optional[int] = None) -> JoinContext:
+        """
+        Resolve the guild's jingle settings and the user's theme song in a single query (or from the cache).
+        :param guild_id: Guild ID the user joined in.
+        :param user_id: User ID that joined, or None if only guild settings are needed.
+        :return: JoinContext for the pair.
+        """
+        return (await self.get_join_contexts([(guild_id, user_id)]))[(guild_id, user_id)]
+
+    #####
+    # Preloading
+    #####
+    @staticmethod
+    def _select_rows_by_ids(con: Connection, table: str, columns: str, ids: List[int]) -> Dict[int, tuple]:
+        cur: Cursor = con.cursor()
+        rows: Dict[int, tuple] = {}
+
+        for chunk_start in range(0, len(ids), PRELOAD_QUERY_CHUNK_SIZE):
+            chunk = ids[chunk_start:chunk_start + PRELOAD_QUERY_CHUNK_SIZE]
+            placeholders = ", ".join(["?"] * len(chunk))
+            cur.execute(f"SELECT id, {columns} FROM {table} WHERE id IN ({placeholders})", chunk)
+
+            for row_id, *values in cur.fetchall():
+                rows[row_id] = tuple(values)
+
+        return rows
+
+    async def preload(self, guild_ids: Iterable[int], user_ids: Iterable[int]) -> Tuple[int, int]:
+        """
+        Warm the settings cache for many guilds and users at once (e.g. before a wave of voice joins).
+        Guilds and users without a row are cached with their defaults.
+        :param guild_ids: Guild IDs to load the settings for.
+        :param user_ids: User IDs to load the theme songs for.
+        :return: Tuple with the amount of newly cached guilds and users.
+        """
+        uncached_guild_ids = [guild_id for guild_id in dict.fromkeys(guild_ids) if guild_id not in self._guild_cache]
+        uncached_user_ids = [user_id for user_id in dict.fromkeys(user_ids) if user_id not in self._user_cache]
+        if not uncached_guild_ids and not uncached_user_ids:
+            return 0, 0
+
+        guild_snapshots = {guild_id: self._guild_writes.snapshot(guild_id) for guild_id in uncached_guild_ids}
+        user_snapshots = {user_id: self._user_writes.snapshot(user_id) for user_id in uncached_user_ids}
+
+        def select_rows(con: Connection) -> Tuple[Dict[int, tuple], Dict[int, tuple]]:
+            return (
+                self._select_rows_by_ids(con, "guild_settings", GuildSettings.COLUMNS, uncached_guild_ids),
+                self._select_rows_by_ids(con, "user_settings", "theme_song_jingle_id", uncached_user_ids),
             )
-            self.con.commit()
 
-    def _get_guild_field(self, guild_id: int, field_name: str) -> Any:
+        guild_rows, user_rows = await self._readers.submit(select_rows)
+
+        cached_guilds = 0
+        for guild_id in uncached_guild_ids:
+            if guild_id in self._guild_cache \
+                    or not self._guild_writes.is_unchanged(guild_id, guild_snapshots[guild_id]):
+                continue
+
+            row = guild_rows.get(guild_id)
+            self._guild_cache[guild_id] = GuildSettings.from_row(row) if row is not None else GuildSettings.default()
+            cached_guilds += 1
+
+        cached_users = 0
+        for user_id in uncached_user_ids:
+            if user_id in self._user_cache or not self._user_writes.is_unchanged(user_id, user_snapshots[user_id]):
+                continue
+
+            self._cache_user_theme_song(user_id, get_nth_with_default(user_rows.get(user_id, ()), 0))
+            cached_users += 1
+
+        return cached_guilds, cached_users
+
+    #####
+    # Play history
+    #####
+    @staticmethod
+    def _insert_play_history(con: Connection, rows: List[PLAY_HISTORY_ROW]):
+        con.executemany(
+            "INSERT INTO play_history (guild_id, jingle_id, manual, played_at) VALUES (?, ?, ?, ?)",
+            rows
+        )
+
+    def record_play(self, guild_id: int, jingle_id: str, manual: bool):
         """
-        Fetch a single guild field from the database.
-        :param guild_id: Guild ID to get the field for.
-        :param field_name: Field name.
-        WARNING: This field is not sanitized inside the query!
-        :return: Field value.
+        Buffer a played jingle, it is written to the database by a background task.
+        :param guild_id: Guild ID the jingle was played in.
+        :param jingle_id: Jingle ID that was played.
+        :param manual: Whether the jingle was played manually.
+        """
+        if len(self._play_history) == self._play_history.maxlen:
+            self.play_history_dropped += 1
+        self._play_history.append((guild_id, jingle_id, int(manual), int(time.time())))
+
+        if self._play_history_flusher is None or self._play_history_flusher.done():
+            self._play_history_flusher = asyncio.ensure_future(self._flush_play_history_periodically())
+
+    async def flush_play_history(self):
+        """
+        Write all buffered plays to the database in a single batch.
         """
-        cur: Cursor = self.con.cursor()
+        if not self._play_history:
+            return
+
+        # Plays recorded while the batch is being written go into a new buffer
+        buffered = self._play_history
+        self._play_history = deque(maxlen=PLAY_HISTORY_BUFFER_SIZE)
+
+        rows = list(buffered)
+        try:
+            await self._writer.submit(lambda con: self._insert_play_history(con, rows))
+        except Exception:
+            # Put the plays back in front of the new ones, so the next flush retries them
+            overflow = len(buffered) + len(self._play_history) - PLAY_HISTORY_BUFFER_SIZE
+            if overflow > 0:
+                self.play_history_dropped += overflow
+
+            buffered.extend(self._play_history)
+            self._play_history = buffered
+            raise
+
+    async def _flush_play_history_periodically(self):
+        while self._play_history:
+            await asyncio.sleep(PLAY_HISTORY_FLUSH_INTERVAL_SECONDS)
+
+            # noinspection PyBroadException
+            try:
+                await self.flush_play_history()
+            except Exception as e:
+                log.error(f"Could not write play history: {e}")
+
+    async def get_most_played_jingles(self, guild_id: Optional[int], limit: int) -> List[Tuple[str, int]]:
+        """
+        Return the most played jingles, including plays that are still buffered.
+        :param guild_id: Guild ID to get the stats for, or None for global stats.
+        :param limit: Maximum amount of jingles to return.
+        :return: List of (jingle ID, play count) tuples, most played first.
+        """
+        await self.flush_play_history()
+
+        def select_most_played(con: Connection) -> List[Tuple[str, int]]:
+            cur: Cursor = con.cursor()
+            if guild_id is not None:
+                cur.execute(
+                    "SELECT jingle_id, COUNT(*) AS plays FROM play_history WHERE guild_id = ? "
+                    "GROUP BY jingle_id ORDER BY plays DESC LIMIT ?",
+                    (guild_id, limit)
+                )
+            else:
+                cur.execute(
+                    "SELECT jingle_id, COUNT(*) AS plays FROM play_history "
+                    "GROUP BY jingle_id ORDER BY plays DESC LIMIT ?",
+                    (limit, )
+                )
+            return cur.fetchall()
+
+        return await self._readers.submit(select_most_played)
+
+    async def get_total_plays(self, guild_id: Optional[int]) -> int:
+        """
+        Return the amount of recorded plays, including plays that are still buffered.
+        :param guild_id: Guild ID to count the plays for, or None to count all plays.
+        :return: Amount of plays.
+        """
+        await self.flush_play_history()
+
+        def select_total_plays(con: Connection) -> int:
+            cur: Cursor = con.cursor()
+            if guild_id is not None:
+                cur.execute("SELECT COUNT(*) FROM play_history WHERE guild_id = ?", (guild_id, ))
+            else:
+                cur.execute("SELECT COUNT(*) FROM play_history")
+            return cur.fetchone()[0]
+
+        return await self._readers.submit(select_total_plays)
+
+    #####
+    # Guild private
+    #####
+    @staticmethod
+    def _select_guild_settings(con: Connection, guild_id: int) -> Optional[GuildSettings]:
+        cur: Cursor = con.cursor()
         cur.execute(
-            f"SELECT {field_name} FROM guild_settings WHERE id = ?",
+            f"SELECT {GuildSettings.COLUMNS} FROM guild_settings WHERE id = ?",
             (guild_id, )
         )
-        return get_nth_with_default(cur.fetchone(), 0)
 
-    def _set_guild_field(self, guild_id: int, field_name: str, field_value: Any):
+        row = cur.fetchone()
+        return GuildSettings.from_row(row) if row is not None else None
+
+    async def _get_guild_settings(self, guild_id: int) -> GuildSettings:
+        """
+        Return the guild's settings row, from the cache if possible.
+        :param guild_id: Guild ID to get the settings for.
+        :return: GuildSettings for the guild.
+        """
+        guild_settings: Optional[GuildSettings] = self._guild_cache.get(guild_id)
+        if guild_settings is not None:
+            return guild_settings
+
+        snapshot = self._guild_writes.snapshot(guild_id)
+        guild_settings = await self._readers.submit(lambda con: self._select_guild_settings(con, guild_id))
+
+        if guild_settings is None:
+            # Rows are only created on the first write, until then the guild has the default settings
+            guild_settings = GuildSettings.default()
+
+        if self._guild_writes.is_unchanged(guild_id, snapshot):
+            self._guild_cache[guild_id] = guild_settings
+        return guild_settings
+
+    async def _get_guild_field(self, guild_id: int, field_name: str) -> Any:
+        """
+        Fetch a single guild field (from the cache if possible).
+        :param guild_id: Guild ID to get the field for.
+        :param field_name: Field name (must be one of GuildSettings' attributes).
+        :return: Field value.
+        """
+        return getattr(await self._get_guild_settings(guild_id), field_name)
+
+    async def _set_guild_field(self, guild_id: int, field_name: str, field_value: Any):
         """
         Set a single guild field.
         :param guild_id: Guild ID to set the field for.
@@ -95,118 +561,122 @@ class Database(metaclass=Singleton):
         WARNING: This field is not sanitized inside the query!
         :param field_value: Field value.
         """
-        cur: Cursor = self.con.cursor()
-        cur.execute(
-            f"UPDATE guild_settings SET {field_name} = ? WHERE id = ?",
-            (field_value, guild_id)
-        )
-        self.con.commit()
+        def set_field(con: Connection):
+            _upsert_field(con, "guild_settings", guild_id, field_name, field_value)
+
+        self._guild_writes.begin(guild_id)
+        try:
+            await self._writer.submit(set_field)
+        finally:
+            self._guild_writes.end(guild_id)
+
+        # Write through to the cache
+        guild_settings: Optional[GuildSettings] = self._guild_cache.get(guild_id)
+        if guild_settings is not None:
+            setattr(guild_settings, field_name, field_value)
 
     #####
     # Guild settings
     #####
-    def guild_get_jingle_mode(self, guild_id: int, default_mode: JingleMode = JingleMode.DISABLED) -> JingleMode:
+    async def guild_get_jingle_mode(self, guild_id: int, default_mode: JingleMode = JingleMode.DISABLED) -> JingleMode:
         """
         Return the jingle mode for the current server.
         :param guild_id: Guild ID to get the setting for.
         :param default_mode: In case the jingle mode is null, return this default.
         :return: JingleMode for the guild.
         """
-        self._ensure_guild(guild_id)
-
-        guild_jingle_mode: int = self._get_guild_field(guild_id, "jingle_mode")
+        guild_jingle_mode: int = await self._get_guild_field(guild_id, "jingle_mode")
         if guild_jingle_mode is None:
             return default_mode
         else:
             return JINGLE_MODE_INT_TO_ENUM.get(guild_jingle_mode)
 
-    def guild_set_jingle_mode(self, guild_id: int, jingle_mode: JingleMode):
+    async def guild_set_jingle_mode(self, guild_id: int, jingle_mode: JingleMode):
         """
         Set the jingle mode for the current server.
         :param guild_id: Guild ID to set the jingle mode for.
         :param jingle_mode: Jingle mode to set.
         """
-        self._ensure_guild(guild_id)
-
         jingle_mode_int = JINGLE_MODE_ENUM_TO_INT.get(jingle_mode)
-        self._set_guild_field(guild_id, "jingle_mode", jingle_mode_int)
+        await self._set_guild_field(guild_id, "jingle_mode", jingle_mode_int)
 
-    def guild_get_theme_songs_mode(self, guild_id: int) -> bool:
+    async def guild_get_theme_songs_mode(self, guild_id: int) -> bool:
         """
         Get the setting that specifies whether theme songs should be played on this guild.
         :param guild_id: Guild ID to get the setting for.
         :return: Boolean indicating whether we should potentially play user-set theme songs in this guild.
         """
-        self._ensure_guild(guild_id)
-
-        theme_songs_allowed: Optional[int] = self._get_guild_field(guild_id, "theme_song_mode")
+        theme_songs_allowed: Optional[int] = await self._get_guild_field(guild_id, "theme_song_mode")
         return theme_songs_allowed is not None and theme_songs_allowed != 0
 
-    def guild_set_theme_songs_mode(self, guild_id: int, theme_songs_enabled: bool):
+    async def guild_set_theme_songs_mode(self, guild_id: int, theme_songs_enabled: bool):
         """
         Set the theme song mode (whether personal theme songs should be played).
         :param guild_id: Guild ID to set the mode for.
         :param theme_songs_enabled: Whether to enable or disable playing personal theme songs in the guild.
         """
-        self._ensure_guild(guild_id)
-        self._set_guild_field(guild_id, "theme_song_mode", int(bool(theme_songs_enabled)))
+        await self._set_guild_field(guild_id, "theme_song_mode", int(bool(theme_songs_enabled)))
 
-    def guild_get_default_jingle_id(self, guild_id: int) -> Optional[str]:
+    async def guild_get_default_jingle_id(self, guild_id: int) -> Optional[str]:
         """
         Return the default jingle ID for the current server.
         :param guild_id: Guild ID to get the setting for.
         :return: Jingle ID or None if unset.
         """
-        self._ensure_guild(guild_id)
-        return self._get_guild_field(guild_id, "default_jingle_id")
+        return await self._get_guild_field(guild_id, "default_jingle_id")
 
-    def guild_set_default_jingle_id(self, guild_id: int, jingle_id: str):
+    async def guild_set_default_jingle_id(self, guild_id: int, jingle_id: str):
         """
         Set the default jingle ID for the current server.
         :param guild_id: Guild ID to set the default jingle for.
         :param jingle_id: Jingle ID that will become the default.
         """
-        self._ensure_guild(guild_id)
-        self._set_guild_field(guild_id, "default_jingle_id", jingle_id)
+        await self._set_guild_field(guild_id, "default_jingle_id", jingle_id)
 
     #####
     # User private
     #####
-    def _ensure_user(self, user_id: int):
-        """
-        Make sure the user entry exists.
-        :param user_id: User to ensure the existence of.
-        """
-        cur: Cursor = self.con.cursor()
+    @staticmethod
+    def _select_user_theme_song(con: Connection, user_id: int) -> Optional[str]:
+        cur: Cursor = con.cursor()
         cur.execute(
-            "SELECT id FROM user_settings where id=?;",
+            "SELECT theme_song_jingle_id FROM user_settings WHERE id = ?",
             (user_id, )
         )
 
-        if cur.fetchone() is None:
-            # Create new user
-            cur.execute(
-                "INSERT INTO user_settings (id) VALUES (?);",
-                (user_id, )
-            )
-            self.con.commit()
+        # Users without a row simply don't have a theme song
+        return get_nth_with_default(cur.fetchone() or (), 0)
 
-    def _get_user_field(self, user_id: int, field_name: str) -> Any:
+    def _cache_user_theme_song(self, user_id: int, theme_song_jingle_id: Optional[str]):
+        self._user_cache[user_id] = theme_song_jingle_id
+        self._user_cache.move_to_end(user_id)
+
+        if len(self._user_cache) > USER_CACHE_MAX_SIZE:
+            self._user_cache.popitem(last=False)
+
+    def _touch_user_theme_song(self, user_id: int) -> Optional[str]:
+        self._user_cache.move_to_end(user_id)
+        return self._user_cache[user_id]
+
+    async def _get_user_theme_song(self, user_id: int) -> Optional[str]:
         """
-        Fetch a single user field from the database.
-        :param user_id: User ID to get the field for.
-        :param field_name: Field name.
-        WARNING: This field is not sanitized inside the query!
-        :return: Field value.
+        Fetch the user's theme song jingle ID (from the cache if possible).
+        :param user_id: User ID to get the theme song for.
+        :return: Theme song jingle ID or None if unset.
         """
-        cur: Cursor = self.con.cursor()
-        cur.execute(
-            f"SELECT {field_name} FROM user_settings WHERE id = ?",
-            (user_id, )
+        if user_id in self._user_cache:
+            return self._touch_user_theme_song(user_id)
+
+        snapshot = self._user_writes.snapshot(user_id)
+        theme_song_jingle_id: Optional[str] = await self._readers.submit(
+            lambda con: self._select_user_theme_song(con, user_id)
         )
-        return get_nth_with_default(cur.fetchone(), 0)
 
-    def _set_user_field(self, user_id: int, field_name: str, field_value: Any):
+        if self._user_writes.is_unchanged(user_id, snapshot):
+            self._cache_user_theme_song(user_id, theme_song_jingle_id)
+        return theme_song_jingle_id
+
+    async def _set_user_field(self, user_id: int, field_name: str, field_value: Any):
         """
         Set a single user's field.
         :param user_id: User ID to set the field for.
@@ -214,30 +684,34 @@ class Database(metaclass=Singleton):
         WARNING: This field is not sanitized inside the query!
         :param field_value: Field value.
         """
-        cur: Cursor = self.con.cursor()
-        cur.execute(
-            f"UPDATE user_settings SET {field_name} = ? WHERE id = ?",
-            (field_value, user_id)
-        )
-        self.con.commit()
+        def set_field(con: Connection):
+            _upsert_field(con, "user_settings", user_id, field_name, field_value)
+
+        self._user_writes.begin(user_id)
+        try:
+            await self._writer.submit(set_field)
+        finally:
+            self._user_writes.end(user_id)
+
+        # Write through to the cache (user_settings has a single field)
+        if field_name == "theme_song_jingle_id":
+            self._cache_user_theme_song(user_id, field_value)
 
     #####
     # User settings
     #####
-    def user_get_theme_song_jingle_id(self, user_id: int) -> Optional[str]:
+    async def user_get_theme_song_jingle_id(self, user_id: int) -> Optional[str]:
         """
         Get the user's theme song jingle ID, if set.
         :param user_id: User ID to get the theme song for.
         :return: Jingle ID that the user has for their theme song, or None if unset.
         """
-        self._ensure_user(user_id)
-        return self._get_user_field(user_id, "theme_song_jingle_id")
+        return await self._get_user_theme_song(user_id)
 
-    def user_set_theme_song_jingle_id(self, user_id: int, jingle_id: Optional[str]):
+    async def user_set_theme_song_jingle_id(self, user_id: int, jingle_id: Optional[str]):
         """
         Set the user's theme song jingle ID.
         :param user_id: User ID to set the theme song for.
         :param jingle_id: Jingle ID that will become the user's theme song.
         """
-        self._ensure_user(user_id)
-        self._set_user_field(user_id, "theme_song_jingle_id", jingle_id)
+        await self._set_user_field(user_id, "theme_song_jingle_id", jingle_id)
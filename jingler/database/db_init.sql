@@ -8,6 +8,7 @@ CREATE TABLE IF NOT EXISTS guild_settings (
        0: disabled
        1: single
        2: random
+       3: shuffle (random, but every jingle is played once before any repeats)
      */
     jingle_mode INTEGER DEFAULT 2 NOT NULL,
     /**
@@ -32,3 +33,30 @@ CREATE TABLE IF NOT EXISTS user_settings (
       */
      theme_song_jingle_id TEXT
 );
+
+
+CREATE TABLE IF NOT EXISTS play_history (
+    id INTEGER PRIMARY KEY,
+    /**
+      Guild ID the jingle was played in.
+     */
+    guild_id INTEGER NOT NULL,
+    /**
+      ID of the jingle that was played.
+     */
+    jingle_id TEXT NOT NULL,
+    /**
+      Whether the jingle was played manually (e.g. .playrandom) as opposed to on a voice channel join.
+     */
+    manual INTEGER DEFAULT 0 NOT NULL,
+    /**
+      Unix timestamp (seconds).
+     */
+    played_at INTEGER NOT NULL
+);
+
+/**
+  Covering indexes for the per-guild and global "most played" queries.
+ */
+CREATE INDEX IF NOT EXISTS play_history_guild_jingle ON play_history (guild_id, jingle_id);
+CREATE INDEX IF NOT EXISTS play_history_jingle ON play_history (jingle_id);
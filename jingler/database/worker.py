@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlite3 import Connection
+from typing import Any, Callable, List, Optional, TypeVar
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+CONNECTION_FACTORY = Callable[[], Connection]
+DATABASE_JOB = Callable[[Connection], T]
+
+
+def _set_future_result(future: asyncio.Future, result: Any):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_future_exception(future: asyncio.Future, exception: BaseException):
+    if not future.done():
+        future.set_exception(exception)
+
+
+class _WriteJob:
+    __slots__ = (
+        "function", "loop", "future"
+    )
+
+    def __init__(self, function: DATABASE_JOB, loop: asyncio.AbstractEventLoop, future: asyncio.Future):
+        self.function = function
+        self.loop = loop
+        self.future = future
+
+    def resolve(self, result: Any):
+        self.loop.call_soon_threadsafe(_set_future_result, self.future, result)
+
+    def fail(self, exception: BaseException):
+        self.loop.call_soon_threadsafe(_set_future_exception, self.future, exception)
+
+
+class WriterStats:
+    __slots__ = (
+        "batches", "jobs", "last_batch_size", "max_batch_size", "total_commit_seconds", "last_commit_seconds"
+    )
+
+    def __init__(self):
+        self.batches: int = 0
+        self.jobs: int = 0
+        self.last_batch_size: int = 0
+        self.max_batch_size: int = 0
+        self.total_commit_seconds: float = 0
+        self.last_commit_seconds: float = 0
+
+    @property
+    def average_batch_size(self) -> float:
+        return self.jobs / self.batches if self.batches > 0 else 0
+
+    @property
+    def average_commit_seconds(self) -> float:
+        return self.total_commit_seconds / self.batches if self.batches > 0 else 0
+
+    def __str__(self):
+        return f"{self.batches} commits, " \
+               f"{round(self.average_batch_size, 1)} avg./{self.max_batch_size} max. writes per commit, " \
+               f"{round(self.average_commit_seconds * 1000, 2)} ms avg./" \
+               f"{round(self.last_commit_seconds * 1000, 2)} ms last commit latency"
+
+
+class DatabaseWriter:
+    """
+    Runs write jobs on a dedicated thread that owns the only writable connection.
+
+    Jobs are group-committed: after the first job of a batch arrives, the writer waits up to `max_batch_delay`
+    seconds (or until `max_batch_size` jobs are queued) and commits all of them in a single transaction.
+    Each job runs in its own savepoint, so a failing job doesn't take the rest of the batch down with it.
+    A job's awaitable resolves only after its batch has been committed.
+
+    The connection must be opened with isolation_level=None, as transactions are managed here.
+    """
+    def __init__(self, connection_factory: CONNECTION_FACTORY, max_batch_size: int, max_batch_delay: float):
+        self.stats = WriterStats()
+
+        self._max_batch_size = max_batch_size
+        self._max_batch_delay = max_batch_delay
+
+        self._jobs: "queue.Queue[Optional[_WriteJob]]" = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, args=(connection_factory, ), name="jingler-db-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, function: DATABASE_JOB) -> "asyncio.Future[T]":
+        """
+        Queue a job for the writer thread.
+        :param function: Callable that receives the writable connection. It must not commit by itself.
+        :return: Awaitable that resolves with the job's return value once its batch has been committed.
+        """
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._jobs.put(_WriteJob(function, loop, future))
+        return future
+
+    def close(self):
+        self._jobs.put(None)
+        self._thread.join()
+
+    def _run(self, connection_factory: CONNECTION_FACTORY):
+        connection = connection_factory()
+
+        running = True
+        while running:
+            job = self._jobs.get()
+            if job is None:
+                break
+
+            batch: List[_WriteJob] = [job]
+            deadline = time.monotonic() + self._max_batch_delay
+
+            while len(batch) < self._max_batch_size:
+                try:
+                    next_job = self._jobs.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+
+                if next_job is None:
+                    running = False
+                    break
+
+                batch.append(next_job)
+
+            self._run_batch(connection, batch)
+
+        connection.close()
+
+    def _run_batch(self, connection: Connection, batch: List[_WriteJob]):
+        results = []
+
+        # noinspection PyBroadException
+        try:
+            connection.execute("BEGIN")
+
+            for job in batch:
+                connection.execute("SAVEPOINT job")
+                try:
+                    result = job.function(connection)
+                except Exception as e:
+                    connection.execute("ROLLBACK TO SAVEPOINT job")
+                    log.error(f"Database write failed: {e}")
+                    results.append((job, False, e))
+                else:
+                    results.append((job, True, result))
+
+                connection.execute("RELEASE SAVEPOINT job")
+
+            commit_start = time.perf_counter()
+            connection.execute("COMMIT")
+            commit_seconds = time.perf_counter() - commit_start
+        except Exception as e:
+            log.error(f"Database commit failed: {e}")
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+
+            for job in batch:
+                job.fail(e)
+            return
+
+        self.stats.batches += 1
+        self.stats.jobs += len(batch)
+        self.stats.last_batch_size = len(batch)
+        self.stats.max_batch_size = max(self.stats.max_batch_size, len(batch))
+        self.stats.total_commit_seconds += commit_seconds
+        self.stats.last_commit_seconds = commit_seconds
+
+        for job, succeeded, result in results:
+            if succeeded:
+                job.resolve(result)
+            else:
+                job.fail(result)
+
+
+class DatabaseReaderPool:
+    """
+    Runs read jobs on a small thread pool, each thread with its own read-only connection.
+    """
+    def __init__(self, connection_factory: CONNECTION_FACTORY, max_readers: int):
+        self._connection_factory = connection_factory
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=max_readers, thread_name_prefix="jingler-db-reader")
+
+    def submit(self, function: DATABASE_JOB) -> "asyncio.Future[T]":
+        """
+        Run a read job on one of the reader threads.
+        :param function: Callable that receives a read-only connection.
+        :return: Awaitable that resolves with the job's return value.
+        """
+        return asyncio.get_event_loop().run_in_executor(self._executor, self._run, function)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def _run(self, function: DATABASE_JOB) -> T:
+        connection: Optional[Connection] = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connection_factory()
+            self._local.connection = connection
+
+        return function(connection)
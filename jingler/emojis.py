@@ -25,6 +25,8 @@ class Emoji:
     PLACARD = ":placard:"
     MEGA = ":mega:"
     RECEIPT = ":receipt:"
+    BAR_CHART = ":bar_chart:"
+    MAG = ":mag:"
 
 
 class UnicodeEmoji:
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+from io import BytesIO
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
+from discord import Attachment
+from mutagen import File, MutagenError
+
+from jingler.configuration import config
+from jingler.jingles import JingleManager, Jingle, JINGLES_DIR, save_jingle_meta, sanitize_jingle_path
+from jingler.opus import OpusTranscodeError, get_packets_duration
+from jingler.transcoding import TranscodingService, TranscodingQueueFull
+from jingler.utilities import write_file_atomically
+
+log = logging.getLogger(__name__)
+
+jingle_manager = JingleManager()
+transcoding_service = TranscodingService()
+
+# Uploads with any of these extensions are accepted by .addjingle
+SUPPORTED_UPLOAD_EXTENSIONS = (".mp3", ".ogg", ".wav", ".flac", ".m4a")
+
+# Uploads are read in chunks of this size, so oversized ones can be aborted early
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# When reprocessing jingles, the catalog is updated after every this many jingles
+REPROCESS_BATCH_SIZE = 25
+
+PROGRESS_CALLBACK = Callable[[str], Awaitable[None]]
+
+
+class IngestError(Exception):
+    """
+    Raised when an uploaded jingle can't be added. The message is meant to be shown to the user.
+    """
+    pass
+
+
+def is_supported_upload(filename: str) -> bool:
+    return filename.lower().endswith(SUPPORTED_UPLOAD_EXTENSIONS)
+
+
+def get_max_upload_bytes() -> int:
+    return int(1024 * 1024 * config.MAX_JINGLE_FILESIZE_MB)
+
+
+async def download_attachment(attachment: Attachment, max_bytes: int) -> bytes:
+    """
+    Download an attachment into memory, aborting as soon as it turns out to be bigger than allowed.
+    :param attachment: Attachment to download.
+    :param max_bytes: Maximum size in bytes.
+    :return: Contents of the attachment.
+    """
+    # Discord already tells us the size, but don't rely on it
+    if attachment.size > max_bytes:
+        raise IngestError("File is too big.")
+
+    buffer = bytearray()
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(attachment.url) as response:
+                if response.status != 200:
+                    raise IngestError(f"Could not download the file (HTTP {response.status}).")
+
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    buffer.extend(chunk)
+                    if len(buffer) > max_bytes:
+                        raise IngestError("File is too big.")
+    except aiohttp.ClientError as e:
+        raise IngestError(f"Could not download the file: {e}")
+
+    return bytes(buffer)
+
+
+def probe_audio_length(data: bytes) -> Optional[float]:
+    """
+    Return the length of in-memory audio.
+    :param data: Contents of an audio file.
+    :return: Length in seconds, or None if the format isn't recognized.
+    """
+    try:
+        audio_file = File(BytesIO(data))
+    except MutagenError:
+        return None
+
+    if audio_file is None:
+        return None
+
+    return round(audio_file.info.length, 1)
+
+
+async def _ignore_progress(_: str):
+    pass
+
+
+async def ingest_jingle(
+        attachment: Attachment, jingle_id: str, title: str, on_progress: PROGRESS_CALLBACK = _ignore_progress
+) -> Jingle:
+    """
+    Add an uploaded jingle: download it, check its length, normalise, trim and transcode it to Opus,
+    write the audio and .meta files and add it to the catalog (without rescanning the jingles directory).
+    :param attachment: Uploaded audio file (see SUPPORTED_UPLOAD_EXTENSIONS).
+    :param jingle_id: ID for the new jingle.
+    :param title: Title for the new jingle.
+    :param on_progress: Called with a short status message whenever the next stage starts.
+    :return: The added Jingle.
+    """
+    loop = asyncio.get_event_loop()
+
+    if not is_supported_upload(attachment.filename):
+        raise IngestError(f"Unsupported file type, please upload one of: {', '.join(SUPPORTED_UPLOAD_EXTENSIONS)}.")
+
+    jingle_file: Path = sanitize_jingle_path(JINGLES_DIR, attachment.filename)
+    if jingle_file.exists():
+        raise IngestError("A file with this name already exists, please rename and try again.")
+
+    await on_progress("Downloading...")
+    data = await download_attachment(attachment, get_max_upload_bytes())
+
+    await on_progress("Checking...")
+    jingle_length = await loop.run_in_executor(None, probe_audio_length, data)
+    if jingle_length is None:
+        raise IngestError("Could not read the file, is it really an audio file?")
+    if jingle_length > config.MAX_JINGLE_LENGTH_SECONDS:
+        raise IngestError(f"File is too long (`{jingle_length} s`), please shorten and try again.")
+
+    async def on_queued(position: int):
+        await on_progress(f"Waiting for other uploads to be converted (position `{position}` in the queue)...")
+
+    async def on_started():
+        await on_progress("Converting...")
+
+    try:
+        packets: List[bytes] = await transcoding_service.transcode(data, on_queued, on_started)
+    except TranscodingQueueFull:
+        raise IngestError("Too many jingles are being added right now, please try again in a minute.")
+    except (OpusTranscodeError, OSError) as e:
+        log.error(f"Could not transcode uploaded jingle \"{attachment.filename}\": {e}")
+        raise IngestError("Could not convert the file, is it really an audio file?")
+
+    # Another upload with the same name could have finished while this one was being transcoded
+    if jingle_file.exists():
+        raise IngestError("A file with this name already exists, please rename and try again.")
+
+    def write_files():
+        write_file_atomically(jingle_file, data)
+        save_jingle_meta(jingle_file, title, jingle_id, get_packets_duration(packets))
+
+    await on_progress("Saving...")
+    try:
+        await loop.run_in_executor(None, write_files)
+        return await jingle_manager.add_jingle(jingle_file, jingle_id, title, packets)
+    except Exception:
+        # Don't leave half-added jingles behind
+        for file in (jingle_file, jingle_file.with_name(jingle_file.name + ".meta")):
+            if file.exists():
+                file.unlink()
+        raise
+
+
+async def reprocess_jingles(
+        jingles: Sequence[Jingle], on_progress: PROGRESS_CALLBACK = _ignore_progress
+) -> Tuple[int, int]:
+    """
+    Normalise, trim and transcode existing jingles again from their audio files and replace their stored audio.
+    :param jingles: Jingles to reprocess.
+    :param on_progress: Called with a short status message after every batch.
+    :return: Tuple of (reprocessed jingles, jingles that failed).
+    """
+    reprocessed = 0
+    failed = 0
+
+    async def process(jingle: Jingle) -> Optional[List[bytes]]:
+        try:
+            return await transcoding_service.transcode(jingle.path)
+        except (TranscodingQueueFull, OpusTranscodeError, OSError) as e:
+            log.error(f"Could not reprocess jingle \"{jingle}\": {e}")
+            return None
+
+    for batch_start in range(0, len(jingles), REPROCESS_BATCH_SIZE):
+        batch = jingles[batch_start:batch_start + REPROCESS_BATCH_SIZE]
+        packets_by_id: Dict[str, List[bytes]] = {}
+
+        # Never more at once than there are workers, so uploads can still be queued in the meantime
+        for chunk_start in range(0, len(batch), transcoding_service.max_workers):
+            chunk = batch[chunk_start:chunk_start + transcoding_service.max_workers]
+            for jingle, packets in zip(chunk, await asyncio.gather(*map(process, chunk))):
+                if packets is None:
+                    failed += 1
+                else:
+                    packets_by_id[jingle.id] = packets
+
+        await jingle_manager.replace_jingle_audio(packets_by_id)
+        reprocessed += len(packets_by_id)
+
+        await on_progress(f"Reprocessed `{reprocessed + failed}`/`{len(jingles)}` jingles...")
+
+    return reprocessed, failed
@@ -1,13 +1,25 @@
+import asyncio
+import itertools
 import logging
-from typing import Dict, Optional, List
-from json import load, dump
+import os
+import threading
+from types import MappingProxyType
+from typing import Dict, Optional, List, Sequence, Tuple, Set, Mapping
+from json import load, dumps, JSONDecodeError
 
 import pathvalidate
 from discord import Enum
 from mutagen import File
 from pathlib import Path
 
-from jingler.utilities import Singleton
+from jingler.configuration import config
+from jingler.catalog import JingleCatalog, CatalogUpdate, FileFingerprint
+from jingler.opus import OpusTranscodeError, OpusPacket
+from jingler.packet_cache import OpusPacketCache
+from jingler.search import JingleSearchIndex, SUBSTRING_MATCH_BONUS
+from jingler.transcoding import TranscodingService, TranscodingQueueFull
+from jingler.utilities import Singleton, sanitize_jingle_code, write_file_atomically
+from jingler.watcher import DirectoryWatcher
 
 log = logging.getLogger(__name__)
 
@@ -19,18 +31,22 @@ class JingleMode(Enum):
     DISABLED = "disabled"
     SINGLE = "single"
     RANDOM = "random"
+    SHUFFLE = "shuffle"
 
 
-def format_jingles_for_pagination(jingle_manager: "JingleManager") -> List[str]:
+def format_jingles_for_pagination(
+        jingle_manager: "JingleManager", jingles: Optional[Sequence["Jingle"]] = None
+) -> List[str]:
     """
     Generate a list of formatted jingles.
     Format: "[Jingle ID](Jingle filename) Jingle title"
     :param jingle_manager: JingleManager instance to use.
+    :param jingles: Jingles to format, all available jingles if not specified.
     :return: A list of formatted jingles.
     """
     return [
         f"[{jingle.id}]({jingle.path.name}) {jingle.title}"
-        for index, jingle in enumerate(jingle_manager.jingles_by_id.values())
+        for jingle in (jingles if jingles is not None else jingle_manager.snapshot.jingles)
     ]
 
 
@@ -47,15 +63,16 @@ def get_audio_file_length(file_path: Path) -> Optional[float]:
     return round(audio_file.info.length, 1)
 
 
-def save_jingle_meta(jingle_file: Path, jingle_title: str, jingle_id: str):
+def save_jingle_meta(jingle_file: Path, jingle_title: str, jingle_id: str, jingle_length: Optional[float] = None):
     """
     Save jingle metadata to "<jingle_audio_filename>.meta".
     :param jingle_file: A pathlib.Path to the jingle audio file.
     :param jingle_title: Desired title for the jingle.
     :param jingle_id: Jingle's new ID.
+    :param jingle_length: Jingle length in seconds, read from the audio file if not specified.
     """
-    # TODO store actual lengths instead and add 0.2 when playing if that's really needed
-    jingle_length = round(get_audio_file_length(jingle_file) + 0.2, 1)
+    if jingle_length is None:
+        jingle_length = get_audio_file_length(jingle_file)
 
     metadata = {
         "id": jingle_id,
@@ -64,9 +81,7 @@ def save_jingle_meta(jingle_file: Path, jingle_title: str, jingle_id: str):
     }
 
     jingle_meta_file = jingle_file.parent / (jingle_file.name + ".meta")
-
-    with open(str(jingle_meta_file.resolve()), "w", encoding="utf8") as jingle_meta:
-        dump(metadata, jingle_meta, indent=2, ensure_ascii=False)
+    write_file_atomically(jingle_meta_file.resolve(), dumps(metadata, indent=2, ensure_ascii=False).encode("utf8"))
 
     log.info(
         f"Saved jingle meta for: title=\"{jingle_title}\" path=\"{str(jingle_file)}\", ID=\"{jingle_id}\"."
@@ -101,47 +116,396 @@ class Jingle:
         return f"{self.title} ({self.path.name})"
 
 
+class JingleSnapshot:
+    """
+    An immutable view of all available jingles. Reloads build a new snapshot and publish it with a single swap,
+    so readers holding on to one always see a complete and consistent set of jingles.
+    The version increases with every published snapshot, caches derived from a snapshot can key on it.
+    """
+    __slots__ = (
+        "version", "jingles_by_id", "jingles"
+    )
+
+    def __init__(self, version: int, jingles_by_id: Dict[str, Jingle]):
+        self.version = version
+        self.jingles_by_id: Mapping[str, Jingle] = MappingProxyType(jingles_by_id)
+        self.jingles: Tuple[Jingle, ...] = tuple(jingles_by_id.values())
+
+    def __len__(self) -> int:
+        return len(self.jingles)
+
+    def __contains__(self, jingle_id: str) -> bool:
+        return jingle_id in self.jingles_by_id
+
+    def get(self, jingle_id: Optional[str]) -> Optional[Jingle]:
+        return self.jingles_by_id.get(jingle_id)
+
+
+class _JingleReload:
+    """
+    Result of changing the catalog, applied to the JingleManager on the event loop.
+    """
+    __slots__ = (
+        "snapshot", "changed_ids", "catalog_rebuilt"
+    )
+
+    def __init__(self, snapshot: JingleSnapshot, changed_ids: Set[str], catalog_rebuilt: bool):
+        self.snapshot = snapshot
+        self.changed_ids = changed_ids
+        self.catalog_rebuilt = catalog_rebuilt
+
+
+class _ReloadPlan:
+    """
+    Changes found by scanning the jingles directory against the catalog.
+    Audio updates are missing their packets until the audio has been transcoded.
+    """
+    __slots__ = (
+        "metadata_updates", "audio_updates", "removed_ids"
+    )
+
+    def __init__(self):
+        self.metadata_updates: List[CatalogUpdate] = []
+        self.audio_updates: List[CatalogUpdate] = []
+        self.removed_ids: Set[str] = set()
+
+
+# .meta part of the fingerprint of a jingle without a .meta file
+_MISSING_META_FINGERPRINT = (0, 0)
+
+
+def _get_meta_fingerprint(meta_file: Path) -> Tuple[int, int]:
+    try:
+        meta_stat = meta_file.stat()
+    except FileNotFoundError:
+        return _MISSING_META_FINGERPRINT
+
+    return meta_stat.st_mtime_ns, meta_stat.st_size
+
+
+def _read_jingle_meta(meta_file: Path) -> Optional[Tuple[str, str]]:
+    """
+    Read a jingle's .meta file.
+    :param meta_file: Path to the .meta file.
+    :return: Tuple of (jingle ID, title), None if the file is unreadable or incomplete.
+    """
+    try:
+        with open(str(meta_file), "r", encoding="utf8") as meta_file_obj:
+            meta = load(meta_file_obj)
+    except (OSError, JSONDecodeError) as e:
+        log.warning(f"Could not read meta file \"{meta_file}\", skipping: {e}")
+        return None
+
+    meta_id = meta.get("id")
+    meta_title = meta.get("title")
+    if meta_id is None:
+        log.warning(f"Meta file \"{meta_file}\" is missing the \"id\" field.")
+        return None
+    if meta_title is None:
+        log.warning(f"Meta file \"{meta_file}\" is missing the \"title\" field.")
+        return None
+
+    return meta_id, meta_title
+
+
 class JingleManager(metaclass=Singleton):
     def __init__(self):
-        self.jingles_by_id: Dict[str, Jingle] = {}
-        self.reload_available_jingles()
-
-    def reload_available_jingles(self):
-        # Reset jingles
-        self.jingles_by_id = {}
-
-        jingles_loaded = 0
-
-        for meta_file in filter(lambda file: file.suffix == ".meta", JINGLES_DIR.iterdir()):
-            # For each .meta file, make sure the corresponding jingle exists
-            jingle_file = JINGLES_DIR / meta_file.name.rstrip(".meta")
-
-            if not jingle_file.exists():
-                log.warning(f"Meta file \"{jingle_file}\" does not have a corresponding jingle file, skipping.")
-                continue
-
-            # Load .meta JSON file
-            with open(str(meta_file), "r", encoding="utf8") as meta_file_obj:
-                meta = load(meta_file_obj)
-
-            meta_id = meta.get("id")
-            meta_title = meta.get("title")
-            meta_length = float(meta.get("length"))
-            if meta_id is None:
-                log.warning(f"Meta file \"{jingle_file}\" is missing the \"id\" field.")
-                continue
-            if meta_title is None:
-                log.warning(f"Meta file \"{jingle_file}\" is missing the \"title\" field.")
-                continue
-            if meta_length is None:
-                log.warning(f"Meta file \"{jingle_file}\" is missing the \"length\" field.")
-                continue
-
-            jingle: Jingle = Jingle(jingle_file, meta_id, meta_title, meta_length)
-            self.jingles_by_id[jingle.id] = jingle
-            jingles_loaded += 1
-
-        log.info(f"Loaded {jingles_loaded} jingles.")
+        self.snapshot = JingleSnapshot(0, {})
+        self.catalog = JingleCatalog()
+        self.packet_cache = OpusPacketCache(config.PACKET_CACHE_MAX_BYTES)
+        self.search_index = JingleSearchIndex()
+        self.transcoding_service = TranscodingService()
+        self.watcher = DirectoryWatcher(
+            JINGLES_DIR, self.reload_available_jingles_async, config.JINGLES_DIRECTORY_POLL_INTERVAL_SECONDS
+        )
+
+        # Serialises changes to the catalog, every snapshot is built from the catalog while holding it
+        self._reload_lock = threading.Lock()
+        self._snapshot_versions = itertools.count(1)
+        # One directory reload at a time, otherwise overlapping reloads would transcode the same jingles twice.
+        # Created on first use, so it belongs to the running event loop.
+        self._directory_reload_lock: Optional[asyncio.Lock] = None
+
+        # Catalog reads in progress, by jingle ID: (packet cache generation when started, future)
+        self._packet_loads: Dict[str, Tuple[int, "asyncio.Future[Sequence[OpusPacket]]"]] = {}
+
+        # The catalog is the source of truth, .meta files are only read again on reload
+        self._apply_reload(self._load_catalog())
+
+    @property
+    def jingles_by_id(self) -> Mapping[str, Jingle]:
+        """
+        Read-only mapping of all available jingles (of the current snapshot).
+        """
+        return self.snapshot.jingles_by_id
+
+    @property
+    def needs_import(self) -> bool:
+        """
+        Whether the .meta files still have to be imported into the catalog by a reload
+        (on the first start, or if the catalog predates storing metadata).
+        """
+        return self.catalog.version == 1 or len(self.catalog) == 0
+
+    async def reload_available_jingles_async(self):
+        """
+        Pick up added, changed and removed jingles without blocking the event loop.
+        New or changed audio is transcoded by the TranscodingService, the catalog is updated on an executor thread.
+        """
+        loop = asyncio.get_event_loop()
+        if self._directory_reload_lock is None:
+            self._directory_reload_lock = asyncio.Lock()
+
+        async with self._directory_reload_lock:
+            plan = await loop.run_in_executor(None, self._scan_jingles)
+            # Process new or changed jingles once here, so playing them never has to spawn FFmpeg
+            await self._transcode_updates(plan.audio_updates)
+            reload = await loop.run_in_executor(None, self._commit_reload, plan)
+
+            self._apply_reload(reload)
+
+    def start_watching(self):
+        """
+        Start reloading jingles automatically whenever the jingles directory changes.
+        """
+        self.watcher.start()
+
+    def _load_catalog(self) -> _JingleReload:
+        with self._reload_lock:
+            reload = self._build_reload(set(self.catalog.entries.keys()), catalog_rebuilt=False)
+
+        log.info(f"Loaded {len(reload.snapshot)} jingles from the catalog.")
+        return reload
+
+    def _build_reload(self, changed_ids: Set[str], catalog_rebuilt: bool) -> _JingleReload:
+        # Must hold _reload_lock, so the snapshot always matches the catalog
+        jingles_by_id: Dict[str, Jingle] = {
+            # Durations are stored as float32
+            entry.id: Jingle(JINGLES_DIR / entry.filename, entry.id, entry.title, round(entry.duration, 2))
+            for entry in self.catalog.entries.values()
+            # Entries of a version 1 catalog only get a filename once their .meta file is imported
+            if entry.filename is not None
+        }
+
+        return _JingleReload(
+            JingleSnapshot(next(self._snapshot_versions), jingles_by_id), changed_ids, catalog_rebuilt
+        )
+
+    async def _transcode_updates(self, updates: List[CatalogUpdate]):
+        async def transcode(update: CatalogUpdate):
+            try:
+                update.packets = await self.transcoding_service.transcode(JINGLES_DIR / update.filename)
+            except (TranscodingQueueFull, OpusTranscodeError, OSError) as e:
+                # The catalog entry is left as it is, so the next reload tries again
+                log.error(f"Could not transcode jingle \"{update.filename}\" to Opus, skipping: {e}")
+
+        # Never more at once than there are workers, so uploads can still be queued in the meantime
+        max_workers = self.transcoding_service.max_workers
+        for chunk_start in range(0, len(updates), max_workers):
+            await asyncio.gather(*map(transcode, updates[chunk_start:chunk_start + max_workers]))
+
+    def _scan_jingles(self) -> _ReloadPlan:
+        # Runs on an executor thread. Starts from the catalog: a jingle is only removed once its audio file is gone,
+        # a missing .meta file just means there is nothing to update the title from.
+        with self._reload_lock:
+            plan = _ReloadPlan()
+            entries_by_filename = {
+                entry.filename: entry for entry in self.catalog.entries.values() if entry.filename is not None
+            }
+            # Jingles found in the directory that aren't in the catalog (yet) under that filename and ID:
+            # (audio file, its stat result, .meta fingerprint, jingle ID, title)
+            new_jingles: List[Tuple[Path, os.stat_result, Tuple[int, int], str, str]] = []
+            kept_ids: Set[str] = set()
+
+            for filename, entry in entries_by_filename.items():
+                jingle_file = JINGLES_DIR / filename
+                try:
+                    jingle_stat = jingle_file.stat()
+                except FileNotFoundError:
+                    plan.removed_ids.add(entry.id)
+                    continue
+
+                meta_fingerprint = _get_meta_fingerprint(jingle_file.with_name(filename + ".meta"))
+                fingerprint: FileFingerprint = (*meta_fingerprint, jingle_stat.st_mtime_ns, jingle_stat.st_size)
+                if fingerprint == entry.fingerprint:
+                    kept_ids.add(entry.id)
+                    continue
+
+                jingle_id, title = entry.id, entry.title
+                if meta_fingerprint != _MISSING_META_FINGERPRINT and meta_fingerprint != entry.fingerprint[:2]:
+                    meta = _read_jingle_meta(jingle_file.with_name(filename + ".meta"))
+                    if meta is not None:
+                        jingle_id, title = meta
+
+                if jingle_id != entry.id:
+                    # The ID was changed in the .meta file, add the jingle under its new ID below
+                    plan.removed_ids.add(entry.id)
+                    new_jingles.append((jingle_file, jingle_stat, meta_fingerprint, jingle_id, title))
+                    continue
+
+                kept_ids.add(entry.id)
+                update = CatalogUpdate(entry.id, title, filename, fingerprint, None)
+                if entry.has_source(jingle_stat.st_mtime_ns, jingle_stat.st_size):
+                    # Only the metadata changed, keep the already encoded frames
+                    plan.metadata_updates.append(update)
+                else:
+                    plan.audio_updates.append(update)
+
+            for meta_file in filter(lambda file: file.suffix == ".meta", JINGLES_DIR.iterdir()):
+                jingle_file = meta_file.with_suffix("")
+                if jingle_file.name in entries_by_filename:
+                    continue
+
+                try:
+                    jingle_stat = jingle_file.stat()
+                except FileNotFoundError:
+                    log.warning(f"Meta file \"{jingle_file}\" does not have a corresponding jingle file, skipping.")
+                    continue
+
+                meta = _read_jingle_meta(meta_file)
+                if meta is not None:
+                    new_jingles.append((jingle_file, jingle_stat, _get_meta_fingerprint(meta_file), *meta))
+
+            for jingle_file, jingle_stat, meta_fingerprint, jingle_id, title in new_jingles:
+                if jingle_id in kept_ids:
+                    log.warning(
+                        f"Jingle \"{jingle_file.name}\" has the ID \"{jingle_id}\" of another jingle, skipping."
+                    )
+                    continue
+                kept_ids.add(jingle_id)
+
+                fingerprint = (*meta_fingerprint, jingle_stat.st_mtime_ns, jingle_stat.st_size)
+                update = CatalogUpdate(jingle_id, title, jingle_file.name, fingerprint, None)
+
+                entry = self.catalog.get_entry(jingle_id)
+                if entry is not None and entry.filename is None \
+                        and entry.has_source(jingle_stat.st_mtime_ns, jingle_stat.st_size):
+                    # Imported into a version 1 catalog, only the metadata was missing
+                    plan.metadata_updates.append(update)
+                else:
+                    plan.audio_updates.append(update)
+
+            # Drop version 1 entries that no .meta file was imported for,
+            # the ID of a removed jingle that another jingle took over is replaced instead
+            plan.removed_ids.update(
+                entry.id for entry in self.catalog.entries.values() if entry.filename is None
+            )
+            plan.removed_ids.difference_update(kept_ids)
+            return plan
+
+    def _commit_reload(self, plan: _ReloadPlan) -> _JingleReload:
+        # Runs on an executor thread
+        with self._reload_lock:
+            updates = plan.metadata_updates + [update for update in plan.audio_updates if update.packets is not None]
+            self.catalog.append(updates)
+
+            # Drop removed jingles (and frames of replaced jingles) from the catalog
+            catalog_rebuilt = False
+            if plan.removed_ids or self.catalog.file_size > 2 * self.catalog.data_size + 4096:
+                self.catalog.rebuild(
+                    [jingle_id for jingle_id in self.catalog.entries if jingle_id not in plan.removed_ids]
+                )
+                catalog_rebuilt = True
+
+            changed_ids = {update.id for update in updates} | plan.removed_ids
+            reload = self._build_reload(changed_ids, catalog_rebuilt)
+
+            log.info(
+                f"Loaded {len(reload.snapshot)} jingles ({len(updates)} added or changed, "
+                f"{len(plan.removed_ids)} removed, "
+                f"{sum(1 for update in updates if update.packets is not None)} newly encoded)."
+            )
+            return reload
+
+    async def add_jingle(self, jingle_file: Path, jingle_id: str, title: str, packets: Sequence[OpusPacket]) -> Jingle:
+        """
+        Add a single new jingle (whose audio and .meta files have already been written) without rescanning
+        the jingles directory. The catalog is updated on an executor thread.
+        :param jingle_file: Path to the jingle's audio file.
+        :param jingle_id: Jingle ID.
+        :param title: Jingle title.
+        :param packets: The jingle's Opus packets.
+        :return: The added Jingle.
+        """
+        reload = await asyncio.get_event_loop().run_in_executor(
+            None, self._add_to_catalog, jingle_file, jingle_id, title, packets
+        )
+        self._apply_reload(reload)
+        return reload.snapshot.jingles_by_id[jingle_id]
+
+    def _add_to_catalog(
+            self, jingle_file: Path, jingle_id: str, title: str, packets: Sequence[OpusPacket]
+    ) -> _JingleReload:
+        with self._reload_lock:
+            meta_file = jingle_file.with_name(jingle_file.name + ".meta")
+            meta_stat = meta_file.stat()
+            jingle_stat = jingle_file.stat()
+            fingerprint: FileFingerprint = (
+                meta_stat.st_mtime_ns, meta_stat.st_size, jingle_stat.st_mtime_ns, jingle_stat.st_size
+            )
+
+            self.catalog.append([
+                CatalogUpdate(jingle_id, title, jingle_file.name, fingerprint, packets)
+            ])
+
+            reload = self._build_reload({jingle_id}, catalog_rebuilt=False)
+            log.info(f"Added jingle \"{reload.snapshot.get(jingle_id)}\" to the catalog.")
+            return reload
+
+    async def replace_jingle_audio(self, packets_by_id: Mapping[str, Sequence[OpusPacket]]):
+        """
+        Replace the stored audio of existing jingles (e.g. after processing them again).
+        The catalog is updated on an executor thread.
+        :param packets_by_id: New Opus packets for each jingle ID. Jingles that no longer exist are skipped.
+        """
+        reload = await asyncio.get_event_loop().run_in_executor(None, self._replace_in_catalog, packets_by_id)
+        self._apply_reload(reload)
+
+    def _replace_in_catalog(self, packets_by_id: Mapping[str, Sequence[OpusPacket]]) -> _JingleReload:
+        with self._reload_lock:
+            catalog_updates: List[CatalogUpdate] = []
+
+            for jingle_id, packets in packets_by_id.items():
+                entry = self.catalog.get_entry(jingle_id)
+                if entry is None or entry.filename is None:
+                    continue
+
+                # The source files didn't change, so neither does the fingerprint
+                catalog_updates.append(
+                    CatalogUpdate(entry.id, entry.title, entry.filename, entry.fingerprint, packets)
+                )
+
+            self.catalog.append(catalog_updates)
+
+            # The replaced frames are garbage now
+            catalog_rebuilt = False
+            if self.catalog.file_size > 2 * self.catalog.data_size + 4096:
+                self.catalog.rebuild(list(self.catalog.entries.keys()))
+                catalog_rebuilt = True
+
+            log.info(f"Replaced the audio of {len(catalog_updates)} jingles in the catalog.")
+            return self._build_reload({update.id for update in catalog_updates}, catalog_rebuilt)
+
+    def _apply_reload(self, reload: _JingleReload):
+        if reload.changed_ids and reload.snapshot.version > self.snapshot.version:
+            # Single reference swap, if nothing changed the current snapshot (and anything keyed on its version) stays
+            self.snapshot = reload.snapshot
+
+        # Snapshots are built from the catalog in version order, so if a newer one has already been published,
+        # it includes this reload's changes as well
+        for jingle_id in reload.changed_ids:
+            jingle = self.snapshot.get(jingle_id)
+            if jingle is None:
+                self.search_index.remove(jingle_id)
+            else:
+                self.search_index.add(jingle.id, jingle.title, jingle.path.name)
+
+        if reload.catalog_rebuilt:
+            # Every jingle moved, drop the packets pointing into the old mapping
+            self.packet_cache.clear()
+        else:
+            for jingle_id in reload.changed_ids:
+                self.packet_cache.invalidate(jingle_id)
 
     def get_jingle_by_id(self, jingle_id: str) -> Optional[Jingle]:
         """
@@ -149,4 +513,96 @@ class JingleManager(metaclass=Singleton):
         :param jingle_id: Jingle ID to find.
         :return: Jingle or None if not found.
         """
-        return self.jingles_by_id.get(jingle_id)
+        return self.snapshot.get(jingle_id)
+
+    def search_jingles(self, query: str, limit: int = 10) -> List[Jingle]:
+        """
+        Fuzzy search jingles by code, title and filename.
+        :param query: Search query.
+        :param limit: Maximum amount of results.
+        :return: List of matching jingles, best match first.
+        """
+        snapshot = self.snapshot
+        return [
+            snapshot.jingles_by_id[jingle_id]
+            for jingle_id, _ in self.search_index.search(query, limit)
+            if jingle_id in snapshot
+        ]
+
+    def find_jingle(self, query: str) -> Optional[Jingle]:
+        """
+        Return the jingle a query unambiguously refers to: either by its code
+        or by being the only jingle whose code, title or filename contains the query.
+        :param query: Jingle code or search query.
+        :return: Jingle or None if there is no such jingle (or the query is ambiguous).
+        """
+        snapshot = self.snapshot
+
+        jingle = snapshot.get(sanitize_jingle_code(query))
+        if jingle is not None:
+            return jingle
+
+        containing_ids = [
+            jingle_id for jingle_id, score in self.search_index.search(query, limit=2)
+            if score >= SUBSTRING_MATCH_BONUS
+        ]
+        return snapshot.get(containing_ids[0]) if len(containing_ids) == 1 else None
+
+    def get_jingle_packets(self, jingle: Jingle) -> Sequence[OpusPacket]:
+        """
+        Return the jingle's pre-encoded Opus packets, from memory if possible.
+        :param jingle: Jingle to get the packets for.
+        :return: A sequence of Opus packets.
+        """
+        return self.packet_cache.get(jingle.id, lambda: self.catalog.get_packets(jingle.id))
+
+    async def load_jingle_packets(self, jingle: Jingle) -> Sequence[OpusPacket]:
+        """
+        Return the jingle's pre-encoded Opus packets, reading them from the catalog on an executor thread
+        if they aren't in memory yet (so a cold read doesn't block the event loop).
+        :param jingle: Jingle to get the packets for.
+        :return: A sequence of Opus packets.
+        """
+        packets = self.packet_cache.get_cached(jingle.id)
+        if packets is not None:
+            return packets
+
+        # Joins a read that is already in progress, unless a reload has replaced the packets since it started
+        generation = self.packet_cache.generation
+        load = self._packet_loads.get(jingle.id)
+        if load is None or load[0] != generation:
+            future = asyncio.get_event_loop().run_in_executor(None, self.catalog.get_packets, jingle.id)
+            load = (generation, future)
+            self._packet_loads[jingle.id] = load
+            future.add_done_callback(lambda _: self._finish_packet_load(jingle.id, load))
+
+        # One caller giving up must not cancel the read for everyone else waiting on it
+        return await asyncio.shield(load[1])
+
+    def _finish_packet_load(self, jingle_id: str, load: Tuple[int, "asyncio.Future[Sequence[OpusPacket]]"]):
+        generation, future = load
+        if self._packet_loads.get(jingle_id) is load:
+            del self._packet_loads[jingle_id]
+
+        if future.cancelled() or future.exception() is not None:
+            return
+
+        # Don't cache packets a reload has replaced while they were being read
+        if self.packet_cache.generation == generation:
+            self.packet_cache.put(jingle_id, future.result())
+
+    def prioritise_guild_default_jingle(self, guild_id: int, jingle_id: Optional[str]):
+        """
+        Keep the guild's default jingle in memory over other jingles, in place of its previous default jingle.
+        :param guild_id: Guild ID.
+        :param jingle_id: ID of the guild's default jingle, None if it has none.
+        """
+        self.packet_cache.prioritise(("guild", guild_id), jingle_id)
+
+    def prioritise_theme_song(self, user_id: int, jingle_id: Optional[str]):
+        """
+        Keep the user's theme song in memory over other jingles, in place of their previous theme song.
+        :param user_id: User ID.
+        :param jingle_id: ID of the user's theme song, None if they have none.
+        """
+        self.packet_cache.prioritise(("user", user_id), jingle_id)
@@ -0,0 +1,251 @@
+import logging
+import threading
+import time
+from typing import Callable, List, Optional, Sequence
+
+from discord import AudioSource
+from discord.opus import Decoder, OpusError, OpusNotLoaded
+
+from jingler.opus import OpusPacket, OPUS_FRAME_LENGTH_SECONDS
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+log = logging.getLogger(__name__)
+
+# Whether numpy is installed, without it jingles are never mixed
+MIXING_AVAILABLE = numpy is not None
+
+# Samples (per channel) in a 20 ms frame of 48 kHz stereo PCM, which is what discord.py expects from read()
+FRAME_SAMPLES = Decoder.SAMPLES_PER_FRAME
+FRAME_CHANNELS = Decoder.CHANNELS
+FRAME_BYTES = Decoder.FRAME_SIZE
+
+# Mixed audio is brought back into the 16-bit range by a limiter instead of being clipped:
+# loud frames are attenuated right away, the attenuation is then released gradually over this many seconds
+LIMITER_RELEASE_SECONDS = 0.2
+_LIMITER_RELEASE_PER_FRAME = OPUS_FRAME_LENGTH_SECONDS / LIMITER_RELEASE_SECONDS
+_MAX_SAMPLE = 32767
+
+# Called with a boolean indicating whether the stream was played to the end
+STREAM_FINISHED_CALLBACK = Callable[[bool], None]
+
+
+def db_to_gain(decibels: float) -> float:
+    return 10 ** (decibels / 20)
+
+
+class MixerStream:
+    """
+    A single jingle being mixed: its packets, its own Opus decoder (decoders are stateful) and its gain.
+    """
+    __slots__ = (
+        "packets", "index", "gain", "decoder", "on_finished"
+    )
+
+    def __init__(self, packets: Sequence[OpusPacket], gain: float, on_finished: Optional[STREAM_FINISHED_CALLBACK]):
+        self.packets = packets
+        self.index = 0
+        self.gain = gain
+        # Only created once the stream has to be mixed (see JingleMixer.add)
+        self.decoder: Optional[Decoder] = None
+        self.on_finished = on_finished
+
+    @property
+    def remaining_seconds(self) -> float:
+        return (len(self.packets) - self.index) * OPUS_FRAME_LENGTH_SECONDS
+
+    def next_packet(self) -> Optional[OpusPacket]:
+        """
+        :return: The next Opus packet or None if the stream has ended.
+        """
+        if self.index >= len(self.packets):
+            return None
+
+        packet = self.packets[self.index]
+        self.index += 1
+        return packet
+
+    def decode_next(self) -> Optional[bytes]:
+        """
+        :return: The next 20 ms of PCM or None if the stream has ended.
+        """
+        packet = self.next_packet()
+        if packet is None:
+            return None
+
+        return self.decoder.decode(bytes(packet))
+
+
+class JingleMixer(AudioSource):
+    """
+    An AudioSource that decodes any number of jingles to PCM and plays them on top of each other.
+
+    Streams can be added while the mixer is playing (from the event loop, while the audio player thread reads).
+    Each stream is scaled by its own gain, the sum is kept from clipping by a limiter.
+    Once every stream has ended the mixer returns an empty frame, which stops the audio player,
+    after that it no longer accepts new streams.
+
+    As long as a single stream (at its original volume) is playing, its Opus packets are passed through as they are.
+    Decoding and mixing only starts once a second stream overlaps it and then continues until the mixer finishes,
+    so the volume doesn't jump when the overlap ends.
+
+    Requires numpy (see MIXING_AVAILABLE), mixing also needs libopus.
+    """
+    def __init__(self, max_streams: int):
+        if not MIXING_AVAILABLE:
+            raise RuntimeError("Mixing jingles requires numpy.")
+
+        self.max_streams = max_streams
+
+        self._streams: List[MixerStream] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._mixing = False
+        # Whether the frame returned by the last read() is Opus, is_opus() is asked right after every read()
+        self._frame_is_opus = True
+        self._limiter_gain = 1.0
+        self._mix_buffer = numpy.zeros(FRAME_SAMPLES * FRAME_CHANNELS, dtype=numpy.float32)
+
+        # time.monotonic() of when the audio player read the first frame
+        self.first_packet_at: Optional[float] = None
+
+    @property
+    def active_streams(self) -> int:
+        return len(self._streams)
+
+    @property
+    def remaining_seconds(self) -> float:
+        """
+        How long the mixer will keep playing if no more streams are added.
+        """
+        with self._lock:
+            return max((stream.remaining_seconds for stream in self._streams), default=0)
+
+    def add(
+            self, packets: Sequence[OpusPacket], gain_db: float = 0,
+            on_finished: Optional[STREAM_FINISHED_CALLBACK] = None
+    ) -> bool:
+        """
+        Start mixing in a jingle.
+        :param packets: The jingle's Opus packets.
+        :param gain_db: Gain to apply to the jingle, in dB.
+        :param on_finished: Called (from the audio player thread) once the jingle has ended, with a boolean
+                            indicating whether it was played to the end (False if playback was stopped).
+        :return: Boolean indicating whether the jingle was added, False if the mixer has already finished,
+                 is mixing max_streams jingles or can't mix at all (libopus is not loaded).
+        """
+        with self._lock:
+            if self._closed or len(self._streams) >= self.max_streams:
+                return False
+
+            stream = MixerStream(packets, db_to_gain(gain_db), on_finished)
+            if self._streams or stream.gain != 1.0:
+                # This one can't be passed through, so from now on every stream is decoded.
+                # Starting to decode a stream halfway through only costs a few milliseconds of decoder warm-up.
+                try:
+                    for mixed_stream in (*self._streams, stream):
+                        if mixed_stream.decoder is None:
+                            mixed_stream.decoder = Decoder()
+                except OpusNotLoaded:
+                    log.warning("Can't mix jingles, libopus is not loaded.")
+                    return False
+
+            self._streams.append(stream)
+            return True
+
+    def read(self) -> bytes:
+        if self.first_packet_at is None:
+            self.first_packet_at = time.monotonic()
+
+        with self._lock:
+            if not self._streams:
+                self._closed = True
+                return b""
+
+            streams = list(self._streams)
+            if len(streams) > 1 or streams[0].gain != 1.0:
+                self._mixing = True
+
+        if not self._mixing:
+            packet = streams[0].next_packet()
+            if packet is not None:
+                self._frame_is_opus = True
+                return packet
+
+            self._finish_streams([streams[0]], [])
+            return self.read()
+
+        self._frame_is_opus = False
+        mixed = self._mix_buffer
+        mixed.fill(0)
+
+        finished: List[MixerStream] = []
+        failed: List[MixerStream] = []
+        for stream in streams:
+            try:
+                pcm = stream.decode_next()
+            except OpusError as e:
+                log.warning(f"Could not decode a packet, dropping the stream: {e}")
+                failed.append(stream)
+                continue
+
+            if pcm is None:
+                finished.append(stream)
+                continue
+
+            samples = numpy.frombuffer(pcm, dtype=numpy.int16)
+            # Decoded frames should always be exactly 20 ms, but don't trust that blindly
+            length = min(len(samples), len(mixed))
+            mixed[:length] += samples[:length] * stream.gain
+
+        if finished or failed:
+            self._finish_streams(finished, failed)
+            if len(finished) + len(failed) == len(streams):
+                # Nothing was decoded, don't pad the end with a frame of silence
+                return self.read()
+
+        self._limit(mixed)
+        return mixed.astype(numpy.int16).tobytes()
+
+    def is_opus(self) -> bool:
+        return self._frame_is_opus
+
+    def _finish_streams(self, finished: List[MixerStream], failed: List[MixerStream]):
+        with self._lock:
+            self._streams = [
+                stream for stream in self._streams if stream not in finished and stream not in failed
+            ]
+
+        for stream in finished:
+            if stream.on_finished is not None:
+                stream.on_finished(True)
+        for stream in failed:
+            if stream.on_finished is not None:
+                stream.on_finished(False)
+
+    def _limit(self, mixed: "numpy.ndarray"):
+        peak = float(numpy.abs(mixed).max())
+
+        # Attack instantly, release gradually so the gain doesn't jump back up between frames
+        required_gain = _MAX_SAMPLE / peak if peak > _MAX_SAMPLE else 1.0
+        self._limiter_gain = min(required_gain, self._limiter_gain + _LIMITER_RELEASE_PER_FRAME, 1.0)
+
+        if self._limiter_gain < 1.0:
+            mixed *= self._limiter_gain
+
+        # Rounding can still nudge a sample over the edge
+        numpy.clip(mixed, -_MAX_SAMPLE - 1, _MAX_SAMPLE, out=mixed)
+
+    def cleanup(self):
+        # The player stopped (finished, stopped or disconnected), let anyone waiting for a stream know
+        with self._lock:
+            self._closed = True
+            streams = self._streams
+            self._streams = []
+
+        for stream in streams:
+            if stream.on_finished is not None:
+                stream.on_finished(False)
@@ -0,0 +1,130 @@
+import logging
+import struct
+import subprocess
+import time
+from io import BytesIO
+from pathlib import Path
+from typing import List, Optional, Sequence, Union
+
+from discord import AudioSource
+from discord.oggparse import OggStream
+
+log = logging.getLogger(__name__)
+
+# Discord expects 20 ms Opus frames, which is also what libopus encodes by default
+OPUS_FRAME_LENGTH_SECONDS = 0.02
+OPUS_BITRATE_KBPS = 128
+
+# Stored packets are a flat sequence of <uint16 little-endian length><packet bytes> records
+_PACKET_LENGTH = struct.Struct("<H")
+
+OpusPacket = Union[bytes, memoryview]
+
+
+class OpusTranscodeError(Exception):
+    pass
+
+
+def transcode_to_opus_packets(
+        audio: Union[Path, bytes], executable: str = "ffmpeg", audio_filter: Optional[str] = None
+) -> List[bytes]:
+    """
+    Transcode audio into a list of 20 ms Opus packets, ready to be sent to Discord as-is.
+    Uses the same encoder settings as discord.FFmpegOpusAudio.
+    :param audio: Path to the source audio file, or the contents of one (piped into FFmpeg).
+    :param executable: FFmpeg executable to use.
+    :param audio_filter: FFmpeg audio filter graph (-af) to apply before encoding.
+    :return: A list of Opus packets (without the OpusHead/OpusTags header packets).
+    """
+    input_data: Optional[bytes] = audio if isinstance(audio, bytes) else None
+
+    ffmpeg_process = subprocess.run(
+        [
+            executable,
+            "-i", "pipe:0" if input_data is not None else str(audio.absolute()),
+            *(("-af", audio_filter) if audio_filter is not None else ()),
+            "-map_metadata", "-1",
+            "-f", "opus",
+            "-c:a", "libopus",
+            "-ar", "48000",
+            "-ac", "2",
+            "-b:a", f"{OPUS_BITRATE_KBPS}k",
+            "-loglevel", "warning",
+            "pipe:1",
+        ],
+        input=input_data if input_data is not None else b"",
+        capture_output=True,
+    )
+
+    if ffmpeg_process.returncode != 0:
+        raise OpusTranscodeError(
+            f"FFmpeg exited with code {ffmpeg_process.returncode}: {ffmpeg_process.stderr.decode(errors='replace')}"
+        )
+
+    return [
+        packet for packet in OggStream(BytesIO(ffmpeg_process.stdout)).iter_packets()
+        if not packet.startswith((b"OpusHead", b"OpusTags"))
+    ]
+
+
+def get_packets_duration(packets: Sequence[OpusPacket]) -> float:
+    """
+    :param packets: Opus packets (20 ms each).
+    :return: Duration of the packets in seconds.
+    """
+    return round(len(packets) * OPUS_FRAME_LENGTH_SECONDS, 2)
+
+
+def encode_packet_records(packets: Sequence[OpusPacket]) -> bytes:
+    """
+    Encode Opus packets as a flat sequence of length-prefixed records.
+    :param packets: Opus packets to encode.
+    :return: Encoded records.
+    """
+    return b"".join(
+        _PACKET_LENGTH.pack(len(packet)) + bytes(packet) for packet in packets
+    )
+
+
+def split_packet_records(records: memoryview, packet_count: int) -> List[memoryview]:
+    """
+    Split length-prefixed packet records into separate packets without copying them.
+    :param records: A memoryview of encoded records.
+    :param packet_count: Number of packets in the records.
+    :return: A list of memoryviews, one per Opus packet.
+    """
+    packets: List[memoryview] = []
+    offset = 0
+    for _ in range(packet_count):
+        (packet_length,) = _PACKET_LENGTH.unpack_from(records, offset)
+        offset += _PACKET_LENGTH.size
+        packets.append(records[offset:offset + packet_length])
+        offset += packet_length
+
+    return packets
+
+
+class OpusPacketAudio(AudioSource):
+    """
+    An AudioSource that plays pre-encoded Opus packets, without spawning any subprocesses.
+    """
+    def __init__(self, packets: Sequence[OpusPacket]):
+        self._packets = packets
+        self._index = 0
+
+        # time.monotonic() of when the audio player read the first packet
+        self.first_packet_at: Optional[float] = None
+
+    def read(self) -> OpusPacket:
+        if self._index >= len(self._packets):
+            return b""
+
+        if self._index == 0:
+            self.first_packet_at = time.monotonic()
+
+        packet = self._packets[self._index]
+        self._index += 1
+        return packet
+
+    def is_opus(self) -> bool:
+        return True
@@ -0,0 +1,171 @@
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Sequence
+
+from jingler.opus import OpusPacket
+
+log = logging.getLogger(__name__)
+
+
+class PacketCacheStats:
+    __slots__ = (
+        "hits", "misses", "evictions"
+    )
+
+    def __init__(self):
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def __str__(self):
+        return f"{self.hits} hits, {self.misses} misses, {self.evictions} evictions"
+
+
+class _CacheEntry:
+    __slots__ = (
+        "packets", "size"
+    )
+
+    def __init__(self, packets: Sequence[OpusPacket]):
+        self.packets = packets
+        self.size = sum(len(packet) for packet in packets)
+
+
+class OpusPacketCache:
+    """
+    A memory-bounded LRU cache of Opus packets, keyed by jingle ID.
+
+    Prioritised keys (guild default jingles and user theme songs) are only evicted
+    once there are no unprioritised entries left to evict. Each owner (e.g. a guild) prioritises
+    at most one key, a key stays prioritised as long as any owner prioritises it.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.stats = PacketCacheStats()
+
+        self._entries: "OrderedDict[Hashable, _CacheEntry]" = OrderedDict()
+        # Prioritised key of each owner and how many owners prioritise each key
+        self._priority_owners: Dict[Hashable, Hashable] = {}
+        self._prioritised: Dict[Hashable, int] = {}
+        self._size: int = 0
+
+        # Bumped whenever entries are invalidated, packets loaded elsewhere in the meantime may be outdated
+        self.generation: int = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, loader: Callable[[], Sequence[OpusPacket]]) -> Sequence[OpusPacket]:
+        """
+        Return the cached packets for the key, loading (and caching) them on a miss.
+        :param key: Cache key (usually a jingle ID).
+        :param loader: Callable that loads the packets if they are not cached yet.
+        :return: A sequence of Opus packets.
+        """
+        packets = self.get_cached(key)
+        if packets is None:
+            packets = loader()
+            self.put(key, packets)
+
+        return packets
+
+    def get_cached(self, key: Hashable) -> Optional[Sequence[OpusPacket]]:
+        """
+        Return the cached packets for the key, without loading them on a miss.
+        :param key: Cache key (usually a jingle ID).
+        :return: A sequence of Opus packets or None if not cached.
+        """
+        entry: Optional[_CacheEntry] = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry.packets
+
+    def put(self, key: Hashable, packets: Sequence[OpusPacket]):
+        """
+        Cache packets loaded after a miss in get_cached.
+        :param key: Cache key (usually a jingle ID).
+        :param packets: Packets to cache.
+        """
+        self._insert(key, _CacheEntry(packets))
+
+    def prioritise(self, owner: Hashable, key: Optional[Hashable]):
+        """
+        Mark the key as prioritised - its packets will be kept in memory over any unprioritised entries.
+        Replaces the key the owner prioritised before, if any.
+        :param owner: Whoever the key is prioritised for (e.g. a guild for its default jingle).
+        :param key: Cache key to prioritise, None to stop prioritising anything for the owner.
+        """
+        previous_key = self._priority_owners.get(owner)
+        if previous_key == key:
+            return
+
+        if previous_key is not None:
+            del self._priority_owners[owner]
+            self._prioritised[previous_key] -= 1
+            if self._prioritised[previous_key] == 0:
+                del self._prioritised[previous_key]
+
+        if key is not None:
+            self._priority_owners[owner] = key
+            self._prioritised[key] = self._prioritised.get(key, 0) + 1
+
+    def invalidate(self, key: Hashable):
+        """
+        Remove a single entry from the cache, if present.
+        :param key: Cache key to remove.
+        """
+        self.generation += 1
+        self._remove(key)
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+        self._size = 0
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+
+    def _insert(self, key: Hashable, entry: _CacheEntry):
+        if entry.size > self.max_bytes:
+            # Would never fit, don't bother evicting everything else
+            log.debug(f"Packet cache: entry \"{key}\" ({entry.size} bytes) exceeds the budget, not caching.")
+            return
+
+        # The key may already be cached (e.g. put twice after concurrent misses), replace its entry
+        self._remove(key)
+        self._entries[key] = entry
+        self._size += entry.size
+
+        while self._size > self.max_bytes:
+            if not self._evict_one(exclude=key):
+                break
+
+    def _evict_one(self, exclude: Hashable) -> bool:
+        """
+        Evict the least recently used unprioritised entry, or the least recently used prioritised one
+        if there are no unprioritised entries.
+        :param exclude: Key that must not be evicted (the entry being inserted).
+        :return: Boolean indicating whether an entry was evicted, False if there was nothing left to evict.
+        """
+        victim = next(
+            (k for k in self._entries if k != exclude and k not in self._prioritised),
+            None
+        )
+        if victim is None:
+            victim = next((k for k in self._entries if k != exclude), None)
+            if victim is None:
+                return False
+
+        self._remove(victim)
+        self.stats.evictions += 1
+        return True
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+from discord import VoiceChannel
+
+from jingler.jingles import Jingle
+from jingler.scheduler import PlaybackPriority
+
+log = logging.getLogger(__name__)
+
+# (channel, jingle, fail_silently, priority, requested_at)
+PLAY_CALLABLE = Callable[[VoiceChannel, Jingle, bool, PlaybackPriority, float], Awaitable[bool]]
+
+
+class PlaybackQueueStats:
+    __slots__ = (
+        "enqueued", "played", "coalesced", "dropped_stale", "dropped_overflow"
+    )
+
+    def __init__(self):
+        self.enqueued: int = 0
+        self.played: int = 0
+        self.coalesced: int = 0
+        self.dropped_stale: int = 0
+        self.dropped_overflow: int = 0
+
+    @property
+    def dropped(self) -> int:
+        return self.coalesced + self.dropped_stale + self.dropped_overflow
+
+    def __str__(self):
+        return f"{self.enqueued} queued, {self.played} played, {self.coalesced} coalesced, " \
+               f"{self.dropped_stale} stale, {self.dropped_overflow} overflowed"
+
+
+class PlaybackRequest:
+    __slots__ = (
+        "channel", "jingle", "fail_silently", "priority", "created_at", "future"
+    )
+
+    def __init__(
+            self, channel: VoiceChannel, jingle: Jingle, fail_silently: bool, priority: PlaybackPriority,
+            created_at: Optional[float] = None
+    ):
+        self.channel = channel
+        self.jingle = jingle
+        self.fail_silently = fail_silently
+        self.priority = priority
+        self.created_at: float = created_at if created_at is not None else time.monotonic()
+        self.future: asyncio.Future = asyncio.get_event_loop().create_future()
+
+    def drop(self):
+        if not self.future.done():
+            self.future.set_result(False)
+
+
+class GuildPlaybackQueue:
+    """
+    Pending jingles for a single guild, played one after another by a worker task.
+    """
+    def __init__(self, guild_id: int, play: PLAY_CALLABLE, stats: PlaybackQueueStats,
+                 max_depth: int, coalesce_window: float, max_age: float):
+        self.guild_id = guild_id
+        self._play = play
+        self._stats = stats
+        self._max_depth = max_depth
+        self._coalesce_window = coalesce_window
+        self._max_age = max_age
+
+        self._pending: Deque[PlaybackRequest] = deque()
+        self._worker: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def enqueue(self, request: PlaybackRequest):
+        self._stats.enqueued += 1
+
+        # Coalesce bursts: a newer join in the same channel replaces the pending one
+        for index, pending in enumerate(self._pending):
+            if pending.channel.id == request.channel.id \
+                    and pending.priority == request.priority \
+                    and request.created_at - pending.created_at <= self._coalesce_window:
+                log.debug(f"Coalescing jingle \"{pending.jingle}\" into \"{request.jingle}\" in guild {self.guild_id}.")
+                self._pending[index] = request
+                pending.drop()
+                self._stats.coalesced += 1
+                break
+        else:
+            if len(self._pending) >= self._max_depth:
+                # Drop the oldest automatic request, or the oldest request if there are none
+                dropped = next(
+                    (pending for pending in self._pending if pending.priority == PlaybackPriority.AUTOMATIC),
+                    self._pending[0]
+                )
+                self._pending.remove(dropped)
+                dropped.drop()
+                self._stats.dropped_overflow += 1
+                log.info(f"Playback queue for guild {self.guild_id} is full, dropped \"{dropped.jingle}\".")
+
+            if request.priority == PlaybackPriority.MANUAL:
+                # Manual requests go ahead of any pending automatic ones
+                insert_at = next(
+                    (index for index, pending in enumerate(self._pending) if pending.priority != request.priority),
+                    len(self._pending)
+                )
+                self._pending.insert(insert_at, request)
+            else:
+                self._pending.append(request)
+
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while self._pending:
+            request = self._pending.popleft()
+
+            if time.monotonic() - request.created_at > self._max_age:
+                request.drop()
+                self._stats.dropped_stale += 1
+                log.info(f"Dropped stale jingle \"{request.jingle}\" in guild {self.guild_id}.")
+                continue
+
+            # noinspection PyBroadException
+            try:
+                did_play = await self._play(
+                    request.channel, request.jingle, request.fail_silently, request.priority, request.created_at
+                )
+            except Exception as e:
+                if not request.future.done():
+                    request.future.set_exception(e)
+                continue
+
+            if did_play:
+                self._stats.played += 1
+            if not request.future.done():
+                request.future.set_result(did_play)
+
+
+class PlaybackQueueManager:
+    """
+    Per-guild playback queues with bounded depth and join-burst coalescing.
+    """
+    def __init__(self, play: PLAY_CALLABLE, max_depth: int, coalesce_window: float, max_age: float):
+        self.stats = PlaybackQueueStats()
+
+        self._play = play
+        self._max_depth = max_depth
+        self._coalesce_window = coalesce_window
+        self._max_age = max_age
+        self._queues: Dict[int, GuildPlaybackQueue] = {}
+
+    @property
+    def depth(self) -> int:
+        """
+        Total amount of pending jingles across all guilds.
+        """
+        return sum(len(queue) for queue in self._queues.values())
+
+    def get_guild_depth(self, guild_id: int) -> int:
+        queue = self._queues.get(guild_id)
+        return len(queue) if queue is not None else 0
+
+    def enqueue(
+            self, channel: VoiceChannel, jingle: Jingle, fail_silently: bool = True,
+            priority: PlaybackPriority = PlaybackPriority.AUTOMATIC, requested_at: Optional[float] = None
+    ) -> asyncio.Future:
+        """
+        Queue a jingle to be played in a voice channel.
+        :param channel: Voice channel to play the jingle in.
+        :param jingle: Jingle to play.
+        :param fail_silently: Passed on to the play callable.
+        :param priority: Manual requests are queued ahead of automatic ones.
+        :param requested_at: time.monotonic() of the join (or command) that triggered the jingle, defaults to now.
+        :return: Future that resolves to a boolean indicating whether the jingle was played
+                 (False if it failed or was dropped from the queue).
+        """
+        guild_id = channel.guild.id
+
+        queue = self._queues.get(guild_id)
+        if queue is None:
+            queue = GuildPlaybackQueue(
+                guild_id, self._play, self.stats, self._max_depth, self._coalesce_window, self._max_age
+            )
+            self._queues[guild_id] = queue
+
+        request = PlaybackRequest(channel, jingle, fail_silently, priority, requested_at)
+        queue.enqueue(request)
+        return request.future
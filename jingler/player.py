@@ -1,80 +1,314 @@
 import asyncio
 import logging
+import time
 import traceback
 from random import choice
-from typing import Optional
+from typing import Optional, Any, Callable, Dict, Sequence, Tuple
 
-from discord import VoiceChannel, VoiceClient, ClientException, FFmpegOpusAudio, Guild
+from discord import VoiceChannel, VoiceClient, ClientException, Guild, AudioSource
 
-from jingler.database.db import Database
+from jingler.configuration import config
+from jingler.database.db import Database, JoinContext
 from jingler.jingles import Jingle, JingleManager, JingleMode
+from jingler.mixer import JingleMixer, MIXING_AVAILABLE
+from jingler.opus import OpusPacketAudio, OpusPacket
+from jingler.playback_queue import PlaybackQueueManager
+from jingler.rate_limit import TokenBucketRegistry
+from jingler.scheduler import PlaybackPriority, VoiceSchedulerOverloaded
+from jingler.shuffle_bag import ShuffleBagRegistry
+from jingler.voice_sessions import VoiceSessionManager
 
 log = logging.getLogger(__name__)
 
 jingle_manager = JingleManager()
 database = Database()
+voice_sessions = VoiceSessionManager()
+shuffle_bags = ShuffleBagRegistry()
 
+# How much longer than the jingle itself playback may take before we give up on waiting for it
+PLAYBACK_TIMEOUT_GRACE_SECONDS = 5
 
-async def get_guild_jingle(guild: Guild, override_mode: Optional[JingleMode] = None) -> Optional[Jingle]:
+# Jingles layered on top of one that is already playing are a bit quieter, so the original stays audible
+LAYERED_JINGLE_GAIN_DB = -3.0
+
+if config.MIX_OVERLAPPING_JINGLES and not MIXING_AVAILABLE:
+    log.warning("mix_overlapping_jingles is enabled, but numpy is not installed, overlapping jingles will be queued.")
+
+# Guild ID: (voice channel ID, mixer) of jingles currently being mixed, see _layer_jingle
+_active_mixers: Dict[int, Tuple[int, JingleMixer]] = {}
+
+
+class PlaybackLatencyStats:
+    """
+    Time from a member joining (or a command being sent) to the first packet of its jingle being played.
+    """
+    __slots__ = (
+        "samples", "total_seconds", "max_seconds", "last_seconds"
+    )
+
+    def __init__(self):
+        self.samples: int = 0
+        self.total_seconds: float = 0
+        self.max_seconds: float = 0
+        self.last_seconds: float = 0
+
+    @property
+    def average_seconds(self) -> float:
+        return self.total_seconds / self.samples if self.samples > 0 else 0
+
+    def record(self, seconds: float):
+        self.samples += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.last_seconds = seconds
+
+    def __str__(self):
+        return f"{round(self.average_seconds * 1000)} ms avg./{round(self.max_seconds * 1000)} ms max./" \
+               f"{round(self.last_seconds * 1000)} ms last join-to-first-packet latency"
+
+
+latency_stats = PlaybackLatencyStats()
+
+
+async def get_guild_jingle(
+        guild: Guild, override_mode: Optional[JingleMode] = None, join_context: Optional[JoinContext] = None
+) -> Optional[Jingle]:
     """
     Return the guild jingle depending on current mode.
 
     :param guild: Guild to choose a jingle for.
     :param override_mode: If specified, overrides the guild jingle mode.
+    :param join_context: Already resolved JoinContext for the guild, fetched if not specified.
     :return:
         If set to `disabled`, return None.
         If set to `single`, return the default jingle.
         If set to `random`, return a random jingle.
+        If set to `shuffle`, return the next jingle from the guild's shuffle bag.
     """
-    guild_jingle_mode: JingleMode = database.guild_get_jingle_mode(guild.id)
-    guild_default_jingle_id: Optional[str] = database.guild_get_default_jingle_id(guild.id)
+    if join_context is None:
+        join_context = await database.get_join_context(guild.id)
+
+    guild_jingle_mode: JingleMode = override_mode if override_mode is not None else join_context.jingle_mode
+    guild_default_jingle_id: Optional[str] = join_context.default_jingle_id
     guild_default_jingle: Optional[Jingle] = jingle_manager.get_jingle_by_id(guild_default_jingle_id)
+    jingle_manager.prioritise_guild_default_jingle(guild.id, guild_default_jingle_id)
 
-    if guild_jingle_mode == JingleMode.SINGLE or override_mode == JingleMode.SINGLE:
+    if guild_jingle_mode == JingleMode.SINGLE:
         return guild_default_jingle
-    elif guild_jingle_mode == JingleMode.RANDOM or override_mode == JingleMode.RANDOM:
-        return choice(list(jingle_manager.jingles_by_id.values()))
-    elif guild_jingle_mode == JingleMode.DISABLED or override_mode == JingleMode.DISABLED:
+    elif guild_jingle_mode == JingleMode.RANDOM:
+        # Hold on to one snapshot, a reload might publish a new one at any await
+        available_jingles = jingle_manager.snapshot.jingles
+        return choice(available_jingles) if available_jingles else None
+    elif guild_jingle_mode == JingleMode.SHUFFLE:
+        return shuffle_bags.next(guild.id, jingle_manager.snapshot)
+    elif guild_jingle_mode == JingleMode.DISABLED:
         return None
     else:
         raise ValueError(f"Invalid jingle mode: {guild_jingle_mode}!")
 
 
-async def play_jingle(channel: VoiceChannel, jingle: Jingle, fail_silently: bool = True) -> bool:
-    # If already playing, don't try to connect
-    if channel.guild.voice_client is not None:
-        # Already playing somewhere, ignore
-        log.info(f"Wanted to play a jingle in \"{channel.name}\", but already connected somewhere.")
+async def play_until_finished(
+        connection: VoiceClient, audio: AudioSource, timeout: float,
+        get_remaining_seconds: Optional[Callable[[], float]] = None
+) -> bool:
+    """
+    Play the audio source and wait until the player reports it has finished.
+    :param connection: VoiceClient to play on.
+    :param audio: AudioSource to play.
+    :param timeout: Maximum amount of seconds to wait for, after which playback is stopped.
+    :param get_remaining_seconds: For audio that can grow while playing (JingleMixer), returns how much is left.
+                                  Once the timeout runs out, waiting continues as long as playback is progressing.
+    :return: Boolean indicating whether the audio played to the end without errors.
+    """
+    loop = asyncio.get_event_loop()
+    finished: asyncio.Future = loop.create_future()
+
+    def resolve(error: Optional[Any]):
+        if not finished.done():
+            finished.set_result(error)
+
+    def after(error: Optional[Any]):
+        # Called from the audio player thread, so hand the result over to the event loop
+        loop.call_soon_threadsafe(resolve, error)
+
+    connection.play(audio, after=after)
+
+    previous_remaining_seconds = float("inf")
+    while True:
+        done, _ = await asyncio.wait({finished}, timeout=timeout)
+        if done:
+            break
+
+        remaining_seconds = get_remaining_seconds() if get_remaining_seconds is not None else 0
+        if remaining_seconds <= 0 or remaining_seconds >= previous_remaining_seconds:
+            log.warning(f"Playback did not finish in {round(timeout, 1)} seconds, stopping.")
+            connection.stop()
+            return False
+
+        previous_remaining_seconds = remaining_seconds
+        timeout = remaining_seconds + PLAYBACK_TIMEOUT_GRACE_SECONDS
+
+    playback_error = finished.result()
+
+    if playback_error is not None:
+        log.error(f"Error while playing audio: {playback_error}")
         return False
 
-    try:
-        # noinspection PyTypeChecker
-        connection: VoiceClient = await channel.connect()
-    except ClientException:
+    return True
+
+
+async def play_jingle(
+        channel: VoiceChannel, jingle: Jingle, fail_silently: bool = True,
+        priority: PlaybackPriority = PlaybackPriority.AUTOMATIC, requested_at: Optional[float] = None
+) -> bool:
+    """
+    Queue the jingle in the guild's playback queue and wait until it has been played.
+    :param channel: Voice channel to play the jingle in.
+    :param jingle: Jingle to play.
+    :param fail_silently: If False, raise connection errors instead of returning False.
+    :param priority: Manual requests are played (and get voice connections) ahead of automatic ones.
+    :param requested_at: time.monotonic() of the join (or command) that triggered the jingle, defaults to now.
+                         Used for measuring latency.
+    :return: Boolean indicating whether the jingle was played (False if it failed or was dropped).
+    """
+    did_play: Optional[bool] = None
+    if config.MIX_OVERLAPPING_JINGLES and MIXING_AVAILABLE:
+        did_play = await _layer_jingle(channel, jingle)
+
+    if did_play is None:
+        did_play = await playback_queue.enqueue(channel, jingle, fail_silently, priority, requested_at)
+
+    if did_play:
+        database.record_play(channel.guild.id, jingle.id, manual=priority == PlaybackPriority.MANUAL)
+
+    return did_play
+
+
+async def _layer_jingle(channel: VoiceChannel, jingle: Jingle) -> Optional[bool]:
+    """
+    Mix the jingle into the one already playing in the channel, if there is one.
+    :return: Boolean indicating whether the jingle was played, or None if it couldn't be layered
+             (nothing playing in the channel, or already mixing the maximum amount of jingles).
+    """
+    active = _active_mixers.get(channel.guild.id)
+    if active is None or active[0] != channel.id:
+        return None
+
+    packets = await jingle_manager.load_jingle_packets(jingle)
+
+    loop = asyncio.get_event_loop()
+    finished: asyncio.Future = loop.create_future()
+
+    def resolve(played: bool):
+        if not finished.done():
+            finished.set_result(played)
+
+    def on_finished(played: bool):
+        # Called from the audio player thread
+        loop.call_soon_threadsafe(resolve, played)
+
+    # The mixer may have finished (or been replaced) while the packets were loading
+    active = _active_mixers.get(channel.guild.id)
+    if active is None or active[0] != channel.id \
+            or not active[1].add(packets, LAYERED_JINGLE_GAIN_DB, on_finished):
+        return None
+
+    log.info(f"Mixing jingle \"{jingle.path.name}\" into the one playing in \"{channel.name}\".")
+    return await finished
+
+
+def _create_audio(channel: VoiceChannel, packets: Sequence[OpusPacket]) -> AudioSource:
+    if not config.MIX_OVERLAPPING_JINGLES or not MIXING_AVAILABLE:
+        return OpusPacketAudio(packets)
+
+    # Passes the packets through like OpusPacketAudio until another jingle is layered on top
+    mixer = JingleMixer(config.MAX_MIXED_JINGLES)
+    mixer.add(packets)
+
+    # Jingles triggered in the same channel while this one is playing are mixed into it
+    _active_mixers[channel.guild.id] = (channel.id, mixer)
+    return mixer
+
+
+async def _play_jingle_now(
+        channel: VoiceChannel, jingle: Jingle, fail_silently: bool, priority: PlaybackPriority, requested_at: float
+) -> bool:
+    # The playback queue plays one jingle per guild at a time, but make sure anyway
+    if voice_sessions.is_busy(channel.guild):
+        log.warning(f"Wanted to play a jingle in \"{channel.name}\", but already playing somewhere.")
+        return False
+
+    # Load the packets while the voice handshake is happening, so the first one is ready as soon as we're connected
+    started_at = time.monotonic()
+    connection, packets = await asyncio.gather(
+        voice_sessions.acquire(channel, priority),
+        jingle_manager.load_jingle_packets(jingle),
+        return_exceptions=True
+    )
+    ready_at = time.monotonic()
+
+    if isinstance(connection, VoiceSchedulerOverloaded):
+        log.warning(f"Not playing a jingle in \"{channel.name}\" ({channel.guild.name}): {connection}")
+        return False
+    elif isinstance(connection, ClientException):
         log.warning(
-            f"Already connected to voice channel \"{channel.name}\" in \"{channel.guild.name}\"!"
+            f"Could not connect to voice channel \"{channel.name}\" in \"{channel.guild.name}\"!"
         )
 
         if fail_silently:
             return False
         else:
-            raise
+            raise connection
+    elif isinstance(connection, BaseException):
+        raise connection
 
     # noinspection PyBroadException
     try:
-        audio = FFmpegOpusAudio(source=str(jingle.path.absolute()))
+        if isinstance(packets, BaseException):
+            raise packets
 
-        # Delay playback very slightly
-        await asyncio.sleep(0.2)
+        audio = _create_audio(channel, packets)
+        get_remaining_seconds = (lambda: audio.remaining_seconds) if isinstance(audio, JingleMixer) else None
 
-        # Todo add a way to better detect when the playback has stopped (after can't be a coroutine)
         log.info(f"Playing jingle \"{jingle.path.name}\" in \"{channel.name}\"")
-        connection.play(audio)
+        did_play = await play_until_finished(
+            connection, audio, timeout=jingle.length + PLAYBACK_TIMEOUT_GRACE_SECONDS,
+            get_remaining_seconds=get_remaining_seconds
+        )
 
-        await asyncio.sleep(jingle.length)
-        await connection.disconnect(force=True)
-        return True
+        if audio.first_packet_at is not None:
+            latency_stats.record(audio.first_packet_at - requested_at)
+            log.info(
+                f"Join-to-first-packet latency in \"{channel.name}\": "
+                f"{round((audio.first_packet_at - requested_at) * 1000)} ms "
+                f"(queued {round((started_at - requested_at) * 1000)} ms, "
+                f"connecting/loading {round((ready_at - started_at) * 1000)} ms, "
+                f"starting {round((audio.first_packet_at - ready_at) * 1000)} ms)."
+            )
+
+        return did_play
     except Exception:
         log.error(f"Exception while loading/playing jingle:\n{traceback.format_exc()}")
-        await connection.disconnect(force=True)
+        await voice_sessions.disconnect(channel.guild)
         return False
+    finally:
+        _active_mixers.pop(channel.guild.id, None)
+
+        # Stay connected for a while in case another jingle comes along
+        voice_sessions.release(channel.guild)
+
+
+playback_queue = PlaybackQueueManager(
+    _play_jingle_now,
+    max_depth=config.PLAYBACK_QUEUE_MAX_DEPTH,
+    coalesce_window=config.PLAYBACK_QUEUE_COALESCE_SECONDS,
+    max_age=config.PLAYBACK_QUEUE_MAX_AGE_SECONDS,
+)
+
+# Rate limits for automatic jingles when members join voice channels, see JinglePlayerCog.on_voice_state_update
+guild_join_limiter = TokenBucketRegistry(
+    config.GUILD_JOIN_JINGLE_BURST, config.GUILD_JOIN_JINGLES_PER_MINUTE / 60
+)
+member_join_limiter = TokenBucketRegistry(
+    config.MEMBER_JOIN_JINGLE_BURST, config.MEMBER_JOIN_JINGLES_PER_MINUTE / 60
+)
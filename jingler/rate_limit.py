@@ -0,0 +1,98 @@
+import time
+from typing import Dict, Hashable, Iterable, Tuple
+
+
+class TokenBucket:
+    __slots__ = (
+        "tokens", "updated_at"
+    )
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+
+class TokenBucketRegistry:
+    """
+    Token buckets keyed by an arbitrary key (e.g. a guild or member ID).
+    Each bucket holds up to `capacity` tokens and refills at `refill_per_second` tokens per second.
+    """
+    # Above this amount of buckets, full (inactive) buckets get pruned
+    PRUNE_THRESHOLD = 4096
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.limited: int = 0
+
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def has_tokens(self, key: Hashable, amount: float = 1) -> bool:
+        """
+        Check whether the key's bucket has enough tokens, without taking any.
+        :param key: Bucket key.
+        :param amount: Amount of tokens needed.
+        :return: Boolean indicating whether there are enough tokens.
+        """
+        return self._get_bucket(key).tokens >= amount
+
+    def try_consume(self, key: Hashable, amount: float = 1) -> bool:
+        """
+        Try to take tokens from the key's bucket.
+        :param key: Bucket key.
+        :param amount: Amount of tokens to take.
+        :return: Boolean indicating whether there were enough tokens (if not, nothing is taken).
+        """
+        bucket = self._get_bucket(key)
+        if bucket.tokens < amount:
+            self.limited += 1
+            return False
+
+        bucket.tokens -= amount
+        return True
+
+    def _get_bucket(self, key: Hashable) -> TokenBucket:
+        # Returns the key's bucket, refilled up to now
+        now = time.monotonic()
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.PRUNE_THRESHOLD:
+                self._prune(now)
+
+            bucket = TokenBucket(self.capacity, now)
+            self._buckets[key] = bucket
+        else:
+            bucket.tokens = min(self.capacity, bucket.tokens + (now - bucket.updated_at) * self.refill_per_second)
+            bucket.updated_at = now
+
+        return bucket
+
+    def _prune(self, now: float):
+        # Buckets that would be full again are indistinguishable from new ones
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if bucket.tokens + (now - bucket.updated_at) * self.refill_per_second < self.capacity
+        }
+
+
+def try_consume_all(buckets: Iterable[Tuple[TokenBucketRegistry, Hashable]], amount: float = 1) -> bool:
+    """
+    Take tokens from several buckets at once, but only if every one of them has enough.
+    :param buckets: (registry, key) pairs of the buckets to take from.
+    :param amount: Amount of tokens to take from each bucket.
+    :return: Boolean indicating whether all buckets had enough tokens (if not, nothing is taken from any of them).
+    """
+    buckets = list(buckets)
+    for registry, key in buckets:
+        if not registry.has_tokens(key, amount):
+            registry.limited += 1
+            return False
+
+    for registry, key in buckets:
+        registry.try_consume(key, amount)
+
+    return True
@@ -0,0 +1,144 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from enum import Enum
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class PlaybackPriority(Enum):
+    # Lower values are served first
+    MANUAL = 0
+    AUTOMATIC = 1
+
+
+class VoiceSchedulerOverloaded(Exception):
+    pass
+
+
+class VoiceSchedulerStats:
+    __slots__ = (
+        "granted", "waited", "shed"
+    )
+
+    def __init__(self):
+        self.granted: int = 0
+        self.waited: int = 0
+        self.shed: int = 0
+
+    def __str__(self):
+        return f"{self.granted} granted, {self.waited} waited, {self.shed} shed"
+
+
+# (priority, last time the guild was granted a slot, sequence number, guild ID, future)
+_WaitingEntry = Tuple[int, float, int, int, asyncio.Future]
+
+
+class VoiceSlotScheduler:
+    """
+    Caps the amount of concurrent voice sessions across all guilds.
+
+    Each guild holds at most one slot (for as long as it is connected to voice).
+    When all slots are taken, requests wait ordered by priority first and by how long ago their guild
+    was last served second, so a single busy guild can't starve the rest.
+    When too many requests are waiting, new automatic requests are shed (and manual ones
+    push out the newest waiting automatic request).
+    """
+    def __init__(self, max_slots: int, max_waiting: int):
+        self.max_slots = max_slots
+        self.max_waiting = max_waiting
+        self.stats = VoiceSchedulerStats()
+
+        # Called (and not awaited) whenever a request has to wait, useful for freeing up idle slots
+        self.on_pressure: Optional[Callable[[], Awaitable[None]]] = None
+
+        self._active: Set[int] = set()
+        self._waiting: List[_WaitingEntry] = []
+        self._last_granted: Dict[int, float] = {}
+        self._sequence = itertools.count()
+
+    @property
+    def active(self) -> int:
+        return len(self._active)
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for entry in self._waiting if not entry[4].done())
+
+    def holds_slot(self, guild_id: int) -> bool:
+        return guild_id in self._active
+
+    async def acquire(self, guild_id: int, priority: PlaybackPriority):
+        """
+        Wait for a voice session slot for the guild. Returns immediately if the guild already holds one.
+        :param guild_id: Guild ID to acquire the slot for.
+        :param priority: Priority of the request.
+        :raises VoiceSchedulerOverloaded: If the request was shed due to load.
+        """
+        if guild_id in self._active:
+            return
+
+        if len(self._active) < self.max_slots and self.waiting == 0:
+            self._grant(guild_id)
+            return
+
+        if self.waiting >= self.max_waiting:
+            if priority == PlaybackPriority.AUTOMATIC or not self._shed_newest_automatic():
+                self.stats.shed += 1
+                raise VoiceSchedulerOverloaded(f"Too many voice requests waiting ({self.waiting}).")
+
+        future: asyncio.Future = asyncio.get_event_loop().create_future()
+        heapq.heappush(
+            self._waiting,
+            (priority.value, self._last_granted.get(guild_id, 0.0), next(self._sequence), guild_id, future)
+        )
+        self.stats.waited += 1
+
+        if self.on_pressure is not None:
+            asyncio.ensure_future(self.on_pressure())
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was granted just as we were cancelled, give it back
+                self.release(guild_id)
+            raise
+
+    def release(self, guild_id: int):
+        """
+        Give back the guild's voice session slot and wake up the next waiting request.
+        :param guild_id: Guild ID to release the slot for.
+        """
+        self._active.discard(guild_id)
+
+        while self._waiting and len(self._active) < self.max_slots:
+            *_, waiting_guild_id, future = heapq.heappop(self._waiting)
+            if future.done():
+                # Cancelled or shed in the meantime
+                continue
+
+            self._grant(waiting_guild_id)
+            future.set_result(None)
+
+    def _grant(self, guild_id: int):
+        self._active.add(guild_id)
+        self._last_granted[guild_id] = time.monotonic()
+        self.stats.granted += 1
+
+    def _shed_newest_automatic(self) -> bool:
+        automatic_entries = [
+            entry for entry in self._waiting
+            if entry[0] == PlaybackPriority.AUTOMATIC.value and not entry[4].done()
+        ]
+        if not automatic_entries:
+            return False
+
+        *_, guild_id, future = max(automatic_entries, key=lambda entry: entry[2])
+        future.set_exception(VoiceSchedulerOverloaded("Shed in favour of a manual request."))
+        self.stats.shed += 1
+        log.info(f"Shed a waiting automatic voice request in guild {guild_id}.")
+        return True
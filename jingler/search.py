@@ -0,0 +1,161 @@
+import heapq
+import re
+import unicodedata
+from typing import Dict, FrozenSet, List, Set, Tuple
+
+# Amount of results shown for search queries (.searchjingle, .setdefault, .setthemesong)
+SEARCH_RESULT_LIMIT = 10
+
+# Posting lists (rarest first) are added to the candidates until there are at least this many candidates per result
+CANDIDATES_PER_RESULT = 4
+
+# Added to the score of jingles that contain the whole query. Similarity never exceeds 1,
+# so any of them ranks above every partial match
+SUBSTRING_MATCH_BONUS = 2
+
+_NON_ALPHANUMERIC = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Lowercase the text, strip accents and replace anything that isn't a letter or a digit with a single space.
+    :param text: Text to normalize.
+    :return: Normalized text.
+    """
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    without_accents = "".join(character for character in decomposed if not unicodedata.combining(character))
+    return _NON_ALPHANUMERIC.sub(" ", without_accents).strip()
+
+
+def get_trigrams(normalized_text: str) -> FrozenSet[str]:
+    """
+    Return the trigrams of every word in the text. Words are padded with spaces,
+    so short words and word boundaries produce trigrams as well.
+    :param normalized_text: Text, normalized with normalize_text.
+    :return: Set of trigrams.
+    """
+    trigrams: Set[str] = set()
+    for word in normalized_text.split():
+        padded = f"  {word} "
+        trigrams.update(padded[index:index + 3] for index in range(len(padded) - 2))
+    return frozenset(trigrams)
+
+
+def get_substring_trigrams(normalized_query: str) -> FrozenSet[str]:
+    """
+    Return the trigrams (see get_trigrams) of every text that contains the query.
+    Unlike the query's own trigrams, these don't assume the query starts or ends at a word boundary.
+    :param normalized_query: Query, normalized with normalize_text.
+    :return: Set of trigrams, empty for single words shorter than three characters.
+    """
+    words = normalized_query.split()
+
+    trigrams: Set[str] = set()
+    for word_index, word in enumerate(words):
+        # Only the words in the middle of the query are known to be whole words
+        padded = ("  " if word_index > 0 else "") + word + (" " if word_index < len(words) - 1 else "")
+        trigrams.update(padded[index:index + 3] for index in range(len(padded) - 2))
+    return frozenset(trigrams)
+
+
+class JingleSearchIndex:
+    """
+    Trigram inverted index over jingle IDs, titles and filenames for fuzzy search.
+    Results are ranked by the Dice coefficient of the query's and the jingle's trigrams,
+    with a bonus for exact substring matches.
+    """
+    def __init__(self):
+        self._postings: Dict[str, Set[str]] = {}
+        self._documents: Dict[str, Tuple[str, FrozenSet[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def __contains__(self, jingle_id: str) -> bool:
+        return jingle_id in self._documents
+
+    def add(self, jingle_id: str, *texts: str):
+        """
+        Index a jingle (replaces it if already indexed).
+        :param jingle_id: Jingle ID, searchable as well.
+        :param texts: Any text the jingle should be found by (e.g. title and filename).
+        """
+        self.remove(jingle_id)
+
+        document = normalize_text(" ".join((jingle_id, ) + texts))
+        trigrams = get_trigrams(document)
+        self._documents[jingle_id] = (document, trigrams)
+
+        for trigram in trigrams:
+            postings = self._postings.get(trigram)
+            if postings is None:
+                postings = set()
+                self._postings[trigram] = postings
+            postings.add(jingle_id)
+
+    def remove(self, jingle_id: str):
+        """
+        Remove a jingle from the index, does nothing if it isn't indexed.
+        :param jingle_id: Jingle ID to remove.
+        """
+        indexed = self._documents.pop(jingle_id, None)
+        if indexed is None:
+            return
+
+        for trigram in indexed[1]:
+            postings = self._postings[trigram]
+            postings.discard(jingle_id)
+            if not postings:
+                del self._postings[trigram]
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, float]]:
+        """
+        Find the jingles most similar to the query.
+        :param query: Search query.
+        :param limit: Maximum amount of results.
+        :return: List of (jingle ID, score) tuples, best match first.
+                 Jingles containing the whole query score at least SUBSTRING_MATCH_BONUS.
+        """
+        normalized_query = normalize_text(query)
+        query_trigrams = get_trigrams(normalized_query)
+        if not query_trigrams:
+            return []
+
+        # Jingles containing the whole query: all of them are in the rarest posting list of the trigrams
+        # such jingles must have, so check every jingle in it against the other lists
+        substring_trigrams = get_substring_trigrams(normalized_query)
+        if substring_trigrams:
+            required_postings = sorted((self._postings.get(trigram, set()) for trigram in substring_trigrams), key=len)
+            substring_ids = {
+                jingle_id for jingle_id in required_postings[0]
+                if all(jingle_id in postings for postings in required_postings[1:])
+                and normalized_query in self._documents[jingle_id][0]
+            }
+        else:
+            # Too short to narrow down by trigrams
+            substring_ids = {
+                jingle_id for jingle_id, (document, _) in self._documents.items() if normalized_query in document
+            }
+
+        # Partial matches: whole posting lists of the query's trigrams, rarest first, until there are enough
+        candidates: Set[str] = set(substring_ids)
+        for postings in sorted((postings for postings in map(self._postings.get, query_trigrams) if postings), key=len):
+            if len(candidates) >= limit * CANDIDATES_PER_RESULT:
+                break
+            candidates.update(postings)
+
+        # Jingle codes are always a match
+        exact_id = query.strip().upper()
+        if exact_id in self._documents:
+            candidates.add(exact_id)
+
+        # Dice coefficient over all trigrams, plus a bonus for containing the query as is
+        results: List[Tuple[str, float]] = []
+        for jingle_id in candidates:
+            document_trigrams = self._documents[jingle_id][1]
+            score = 2 * len(query_trigrams & document_trigrams) / (len(query_trigrams) + len(document_trigrams))
+            if jingle_id in substring_ids:
+                score += SUBSTRING_MATCH_BONUS
+            results.append((jingle_id, score))
+
+        return heapq.nlargest(limit, results, key=lambda result: result[1])
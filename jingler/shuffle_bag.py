@@ -0,0 +1,76 @@
+from array import array
+from random import randrange
+from typing import Dict, Optional
+
+from jingler.jingles import Jingle, JingleSnapshot
+
+
+class ShuffleBag:
+    """
+    Plays every jingle of a snapshot once (in random order) before repeating any of them.
+
+    Stored as a permutation of indices into the snapshot's jingles plus a cursor:
+    everything before the cursor has already been played this round. The permutation is shuffled lazily,
+    one Fisher-Yates step per pick, so creating a bag is just filling an array.
+    """
+    __slots__ = (
+        "version", "permutation", "cursor"
+    )
+
+    def __init__(self, snapshot: JingleSnapshot):
+        self.version = snapshot.version
+        self.permutation = array("I", range(len(snapshot)))
+        self.cursor = 0
+
+    def next(self, snapshot: JingleSnapshot) -> Optional[Jingle]:
+        """
+        Pick the next jingle from the bag.
+        :param snapshot: Snapshot the bag was created for (see ShuffleBag.version).
+        :return: Jingle or None if the snapshot is empty.
+        """
+        size = len(self.permutation)
+        if size == 0:
+            return None
+
+        if self.cursor >= size:
+            # Round finished, start a new one, but don't repeat the jingle that was just played
+            last_index = self.permutation[size - 1]
+            self.cursor = 0
+
+            pick = randrange(size)
+            if size > 1 and self.permutation[pick] == last_index:
+                pick = (pick + 1) % size
+        else:
+            pick = randrange(self.cursor, size)
+
+        permutation = self.permutation
+        permutation[self.cursor], permutation[pick] = permutation[pick], permutation[self.cursor]
+        jingle_index = permutation[self.cursor]
+        self.cursor += 1
+
+        return snapshot.jingles[jingle_index]
+
+
+class ShuffleBagRegistry:
+    """
+    One shuffle bag per guild. Bags are recreated whenever a new jingle snapshot has been published.
+    """
+    def __init__(self):
+        self._bags: Dict[int, ShuffleBag] = {}
+
+    def __len__(self) -> int:
+        return len(self._bags)
+
+    def next(self, guild_id: int, snapshot: JingleSnapshot) -> Optional[Jingle]:
+        """
+        Pick the guild's next jingle.
+        :param guild_id: Guild ID to pick the jingle for.
+        :param snapshot: Current jingle snapshot.
+        :return: Jingle or None if there are no jingles available.
+        """
+        bag = self._bags.get(guild_id)
+        if bag is None or bag.version != snapshot.version:
+            bag = ShuffleBag(snapshot)
+            self._bags[guild_id] = bag
+
+        return bag.next(snapshot)
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional, Union
+
+from jingler.configuration import config
+from jingler.audio_processing import process_to_opus_packets
+from jingler.utilities import Singleton
+
+log = logging.getLogger(__name__)
+
+# Transcoding processes (and the FFmpeg processes they spawn) run at a lower priority than the bot itself,
+# so uploads never take CPU time away from playing jingles
+TRANSCODING_NICENESS = 10
+
+
+class TranscodingQueueFull(Exception):
+    pass
+
+
+def _lower_priority():
+    # Runs in every worker process when it starts, children (FFmpeg) inherit the niceness
+    if hasattr(os, "nice"):
+        os.nice(TRANSCODING_NICENESS)
+
+
+class TranscodingService(metaclass=Singleton):
+    """
+    Processes and transcodes audio to Opus packets on a pool of worker processes.
+
+    At most `max_workers` jobs run at once, up to `max_queued_jobs` more wait for a free worker
+    and anything beyond that is rejected with TranscodingQueueFull.
+    """
+    def __init__(self):
+        self.max_workers = max(1, config.MAX_TRANSCODING_PROCESSES)
+        self.max_queued_jobs = max(0, config.MAX_QUEUED_TRANSCODING_JOBS)
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._worker_slots: Optional[asyncio.Semaphore] = None
+        self._pending_jobs = 0
+
+    @property
+    def queued_jobs(self) -> int:
+        return max(0, self._pending_jobs - self.max_workers)
+
+    async def transcode(
+            self, audio: Union[Path, bytes],
+            on_queued: Optional[Callable[[int], Awaitable[None]]] = None,
+            on_started: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> List[bytes]:
+        """
+        Normalise, trim and transcode audio to Opus packets on a worker process (see process_to_opus_packets).
+        :param audio: Path to an audio file or the contents of one, in any format FFmpeg understands.
+        :param on_queued: Called with the position in the queue (starting at 1)
+                          if the job has to wait for a free worker.
+        :param on_started: Called once the job gets a worker.
+        :return: A list of Opus packets.
+        """
+        if self._pending_jobs >= self.max_workers + self.max_queued_jobs:
+            raise TranscodingQueueFull(f"{self._pending_jobs} transcoding jobs are already pending.")
+
+        if self._executor is None:
+            # Started lazily, so the bot doesn't keep idle worker processes around if nobody uploads anything
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_lower_priority)
+            self._worker_slots = asyncio.Semaphore(self.max_workers)
+
+        self._pending_jobs += 1
+        try:
+            if self._worker_slots.locked() and on_queued is not None:
+                await on_queued(self.queued_jobs)
+
+            async with self._worker_slots:
+                if on_started is not None:
+                    await on_started()
+
+                return await asyncio.get_event_loop().run_in_executor(
+                    self._executor, process_to_opus_packets, audio
+                )
+        finally:
+            self._pending_jobs -= 1
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -1,4 +1,6 @@
+import os
 import uuid
+from pathlib import Path
 from typing import Any, Union
 
 
@@ -49,6 +51,26 @@ def get_nth_with_default(list_: Union[list, tuple], n: int, default: Any = None)
         return list_[n]
 
 
+def write_file_atomically(file_path: Path, data: bytes):
+    """
+    Write a file so that it either doesn't exist or is complete: write to a temporary file next to it,
+    flush it to disk and rename it over the target.
+    :param file_path: Path to write to.
+    :param data: Contents of the file.
+    """
+    temporary_path = file_path.with_name(f".{file_path.name}.tmp")
+    try:
+        with open(str(temporary_path), "wb") as temporary_file:
+            temporary_file.write(data)
+            temporary_file.flush()
+            os.fsync(temporary_file.fileno())
+
+        os.replace(str(temporary_path), str(file_path))
+    finally:
+        if temporary_path.exists():
+            temporary_path.unlink()
+
+
 class Singleton(type):
     _instances = {}
 
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from discord import Guild, VoiceChannel, VoiceClient
+
+from jingler.configuration import config
+from jingler.scheduler import VoiceSlotScheduler, PlaybackPriority
+from jingler.utilities import Singleton
+
+log = logging.getLogger(__name__)
+
+
+class VoiceSession:
+    __slots__ = (
+        "guild_id", "client", "busy", "idle_task"
+    )
+
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+        self.client: Optional[VoiceClient] = None
+        self.busy: bool = False
+        self.idle_task: Optional[asyncio.Task] = None
+
+    def cancel_idle_disconnect(self):
+        if self.idle_task is not None:
+            self.idle_task.cancel()
+            self.idle_task = None
+
+
+class VoiceSessionManager(metaclass=Singleton):
+    """
+    Keeps a single voice connection per guild alive for a while after playback,
+    so consecutive jingles can skip the voice handshake (or just move to a different channel).
+    The amount of concurrently connected sessions is capped by a VoiceSlotScheduler.
+    """
+    def __init__(self):
+        self._sessions: Dict[int, VoiceSession] = {}
+
+        self.scheduler = VoiceSlotScheduler(
+            max_slots=config.MAX_CONCURRENT_VOICE_SESSIONS,
+            max_waiting=config.MAX_WAITING_VOICE_REQUESTS,
+        )
+        self.scheduler.on_pressure = self.disconnect_idle_sessions
+
+    def _get_session(self, guild: Guild) -> VoiceSession:
+        session = self._sessions.get(guild.id)
+        if session is None:
+            session = VoiceSession(guild.id)
+            self._sessions[guild.id] = session
+
+        return session
+
+    def is_busy(self, guild: Guild) -> bool:
+        """
+        Check whether something is currently being played (or connected for) in the guild.
+        :param guild: Guild to check.
+        :return: Boolean indicating whether the guild's voice session is in use.
+        """
+        session = self._sessions.get(guild.id)
+        return session is not None and session.busy
+
+    @property
+    def connected_sessions(self) -> int:
+        return sum(1 for session in self._sessions.values() if session.client is not None)
+
+    async def acquire(
+            self, channel: VoiceChannel, priority: PlaybackPriority = PlaybackPriority.AUTOMATIC
+    ) -> VoiceClient:
+        """
+        Get a voice connection in the given channel, reusing (and moving) the guild's lingering connection if possible.
+        The session is marked as busy until released with `release`.
+        :param channel: Voice channel to connect to.
+        :param priority: Priority for getting a voice session slot if the guild isn't connected yet.
+        :raises VoiceSchedulerOverloaded: If there were no free slots and the request was shed.
+        :return: A connected VoiceClient.
+        """
+        session = self._get_session(channel.guild)
+        session.busy = True
+        session.cancel_idle_disconnect()
+
+        try:
+            await self.scheduler.acquire(channel.guild.id, priority)
+            # noinspection PyTypeChecker
+            client: Optional[VoiceClient] = session.client or channel.guild.voice_client
+            if client is not None and not client.is_connected():
+                # Stale connection (e.g. we were kicked from the channel), start over
+                await client.disconnect(force=True)
+                client = None
+
+            if client is None:
+                # noinspection PyTypeChecker
+                client = await channel.connect()
+                log.debug(f"Connected to \"{channel.name}\" in \"{channel.guild.name}\".")
+            elif client.channel is None or client.channel.id != channel.id:
+                await client.move_to(channel)
+                log.debug(f"Moved to \"{channel.name}\" in \"{channel.guild.name}\".")
+        except BaseException:
+            session.busy = False
+            if session.client is None:
+                self.scheduler.release(channel.guild.id)
+            raise
+
+        session.client = client
+        return client
+
+    def release(self, guild: Guild):
+        """
+        Mark the guild's voice session as no longer busy and disconnect after the configured idle timeout.
+        :param guild: Guild to release the session for.
+        """
+        session = self._get_session(guild)
+        session.busy = False
+        session.cancel_idle_disconnect()
+
+        if session.client is not None:
+            session.idle_task = asyncio.ensure_future(
+                self._disconnect_after(session, config.VOICE_IDLE_TIMEOUT_SECONDS)
+            )
+
+    async def disconnect(self, guild: Guild):
+        """
+        Immediately disconnect the guild's voice session, if it has one.
+        :param guild: Guild to disconnect in.
+        """
+        session = self._sessions.get(guild.id)
+        if session is None:
+            return
+
+        session.cancel_idle_disconnect()
+        await self._disconnect(session)
+
+    async def disconnect_idle_sessions(self):
+        """
+        Disconnect all lingering sessions that aren't currently playing anything, freeing up their slots.
+        """
+        idle_sessions = [
+            session for session in self._sessions.values()
+            if session.client is not None and not session.busy
+        ]
+
+        for session in idle_sessions:
+            # Disconnecting the previous ones took a while, this one may be in use again
+            if session.busy:
+                continue
+
+            session.cancel_idle_disconnect()
+            await self._disconnect(session)
+
+    async def _disconnect_after(self, session: VoiceSession, delay: float):
+        await asyncio.sleep(delay)
+
+        # Only one idle task per session, no need to cancel it any more
+        session.idle_task = None
+        await self._disconnect(session)
+
+    async def _disconnect(self, session: VoiceSession):
+        client = session.client
+        if client is None:
+            return
+
+        # Give up the slot before awaiting anything: an acquire in the meantime has to get a slot of its own,
+        # otherwise it would keep using this one and have it released from under its new connection
+        session.client = None
+        self.scheduler.release(session.guild_id)
+
+        await client.disconnect(force=True)
+        log.debug(f"Disconnected voice session in guild {session.guild_id}.")
@@ -0,0 +1,173 @@
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Awaitable, Callable, FrozenSet, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# (file name, mtime in nanoseconds, size)
+_DirectorySnapshot = FrozenSet[Tuple[str, int, int]]
+
+
+class DirectoryWatcher:
+    """
+    Calls `on_change` whenever files in a directory are created, changed, moved or deleted.
+    Uses inotify on Linux and falls back to polling the directory every `poll_interval` seconds elsewhere.
+    Changes are debounced, so copying in a bunch of files results in a single call.
+    """
+    def __init__(
+            self, directory: Path, on_change: Callable[[], Awaitable[None]],
+            poll_interval: float, debounce: float = 1
+    ):
+        self.directory = directory
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+
+        self._inotify_fd: Optional[int] = None
+        self._poll_task: Optional[asyncio.Task] = None
+        self._debounce_handle: Optional[asyncio.TimerHandle] = None
+        self._callback_task: Optional[asyncio.Task] = None
+        self._rerun_callback = False
+
+    @property
+    def running(self) -> bool:
+        return self._inotify_fd is not None or self._poll_task is not None
+
+    def start(self):
+        """
+        Start watching the directory. Does nothing if already watching.
+        """
+        if self.running:
+            return
+
+        if sys.platform.startswith("linux"):
+            # noinspection PyBroadException
+            try:
+                self._start_inotify()
+                log.info(f"Watching \"{self.directory}\" with inotify.")
+                return
+            except Exception as e:
+                log.warning(f"Could not watch \"{self.directory}\" with inotify, polling instead: {e}")
+
+        self._poll_task = asyncio.ensure_future(self._poll())
+        log.info(f"Polling \"{self.directory}\" for changes every {self.poll_interval} seconds.")
+
+    def stop(self):
+        if self._inotify_fd is not None:
+            asyncio.get_event_loop().remove_reader(self._inotify_fd)
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            self._poll_task = None
+
+        if self._debounce_handle is not None:
+            self._debounce_handle.cancel()
+            self._debounce_handle = None
+
+    #####
+    # inotify
+    #####
+    def _start_inotify(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+
+        if libc.inotify_add_watch(fd, os.fsencode(str(self.directory)), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, os.strerror(errno))
+
+        self._inotify_fd = fd
+        asyncio.get_event_loop().add_reader(fd, self._on_inotify_readable)
+
+    def _on_inotify_readable(self):
+        # We don't care which files changed, the callback figures that out, so just drain the events
+        while True:
+            try:
+                if not os.read(self._inotify_fd, 65536):
+                    break
+            except BlockingIOError:
+                break
+
+        self._schedule_callback()
+
+    #####
+    # Polling
+    #####
+    def _snapshot(self) -> _DirectorySnapshot:
+        with os.scandir(str(self.directory)) as entries:
+            return frozenset(
+                (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+                for entry in entries if entry.is_file()
+            )
+
+    async def _poll(self):
+        loop = asyncio.get_event_loop()
+        previous_snapshot = await loop.run_in_executor(None, self._snapshot)
+
+        while True:
+            await asyncio.sleep(self.poll_interval)
+
+            try:
+                snapshot = await loop.run_in_executor(None, self._snapshot)
+            except OSError as e:
+                log.warning(f"Could not poll \"{self.directory}\": {e}")
+                continue
+
+            if snapshot != previous_snapshot:
+                previous_snapshot = snapshot
+                self._schedule_callback()
+
+    #####
+    # Callback
+    #####
+    def _schedule_callback(self):
+        if self._debounce_handle is not None:
+            self._debounce_handle.cancel()
+
+        self._debounce_handle = asyncio.get_event_loop().call_later(self.debounce, self._run_callback)
+
+    def _run_callback(self):
+        self._debounce_handle = None
+
+        if self._callback_task is not None and not self._callback_task.done():
+            # Changes came in while the callback was running, run it again once it finishes
+            self._rerun_callback = True
+            return
+
+        self._callback_task = asyncio.ensure_future(self._call_on_change())
+
+    async def _call_on_change(self):
+        while True:
+            self._rerun_callback = False
+
+            # noinspection PyBroadException
+            try:
+                await self.on_change()
+            except Exception as e:
+                log.error(f"Error while handling changes in \"{self.directory}\": {e}")
+
+            if not self._rerun_callback:
+                break
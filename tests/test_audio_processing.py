@@ -0,0 +1,77 @@
+import unittest
+
+from jingler.audio_processing import _parse_duration, _parse_silence, SILENCE_PADDING_SECONDS
+
+# stderr of the analysis pass (see analyse_audio), trimmed to what the parser reads.
+# Since FFmpeg 5, silencedetect also logs a silence_end once the stream ends in silence.
+TRAILING_SILENCE_OUTPUT = (
+    "Input #0, wav, from 'pipe:0':\n"
+    "  Duration: N/A, bitrate: 1411 kb/s\n"
+    "  Stream #0:0: Audio: pcm_s16le ([1][0][0][0] / 0x0001), 44100 Hz, 2 channels, s16, 1411 kb/s\n"
+    "[silencedetect @ 0x5581c1a4e6c0] silence_start: 0\n"
+    "[silencedetect @ 0x5581c1a4e6c0] silence_end: 0.412154 | silence_duration: 0.412154\n"
+    "size=N/A time=00:00:01.48 bitrate=N/A speed=29.6x    \r"
+    "[silencedetect @ 0x5581c1a4e6c0] silence_start: 2.30576\n"
+    "[silencedetect @ 0x5581c1a4e6c0] silence_end: 3.5 | silence_duration: 1.19424\n"
+    "size=N/A time=00:00:03.50 bitrate=N/A speed=31.2x    \n"
+    "[Parsed_loudnorm_1 @ 0x5581c1a4f100] \n"
+    "{\n"
+    "\t\"input_i\" : \"-23.71\",\n"
+    "\t\"input_tp\" : \"-4.02\"\n"
+    "}\n"
+)
+
+ALL_SILENT_OUTPUT = (
+    "[silencedetect @ 0x55f3d2b8a6c0] silence_start: 0\n"
+    "[silencedetect @ 0x55f3d2b8a6c0] silence_end: 2 | silence_duration: 2\n"
+    "size=N/A time=00:00:02.00 bitrate=N/A speed=40.1x    \n"
+    "[Parsed_loudnorm_1 @ 0x55f3d2b8b100] \n"
+    "{\n"
+    "\t\"input_i\" : \"-inf\",\n"
+    "\t\"input_tp\" : \"-inf\"\n"
+    "}\n"
+)
+
+# Older FFmpeg versions leave out the silence_end if the stream ends in silence
+NO_SILENCE_END_OUTPUT = (
+    "[silencedetect @ 0x55b9e07356c0] silence_start: 1.20159\n"
+    "size=N/A time=00:00:02.00 bitrate=N/A speed=38.7x    \n"
+)
+
+
+class ParseDurationTest(unittest.TestCase):
+    def test_last_progress_time(self):
+        self.assertAlmostEqual(_parse_duration(TRAILING_SILENCE_OUTPUT), 3.5)
+
+    def test_no_stats(self):
+        self.assertIsNone(_parse_duration("[silencedetect @ 0x1] silence_start: 0\n"))
+
+
+class ParseSilenceTest(unittest.TestCase):
+    def test_trailing_silence_ending_with_the_stream(self):
+        start, end = _parse_silence(TRAILING_SILENCE_OUTPUT, _parse_duration(TRAILING_SILENCE_OUTPUT))
+
+        self.assertAlmostEqual(start, 0.412154 - SILENCE_PADDING_SECONDS)
+        self.assertAlmostEqual(end, 2.30576 + SILENCE_PADDING_SECONDS)
+
+    def test_all_silent(self):
+        self.assertEqual(_parse_silence(ALL_SILENT_OUTPUT, _parse_duration(ALL_SILENT_OUTPUT)), (0.0, None))
+
+    def test_trailing_silence_without_end(self):
+        start, end = _parse_silence(NO_SILENCE_END_OUTPUT, _parse_duration(NO_SILENCE_END_OUTPUT))
+
+        self.assertEqual(start, 0.0)
+        self.assertAlmostEqual(end, 1.20159 + SILENCE_PADDING_SECONDS)
+
+    def test_silence_in_the_middle_is_kept(self):
+        output = (
+            "[silencedetect @ 0x1] silence_start: 0.8\n"
+            "[silencedetect @ 0x1] silence_end: 1.1 | silence_duration: 0.3\n"
+            "size=N/A time=00:00:02.00 bitrate=N/A speed=38.7x    \n"
+        )
+
+        self.assertEqual(_parse_silence(output, _parse_duration(output)), (0.0, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+import struct
+import tempfile
+import unittest
+from pathlib import Path
+
+from jingler.catalog import JingleCatalog, CatalogUpdate, CATALOG_MAGIC, CATALOG_VERSION
+from jingler.opus import encode_packet_records
+
+PACKETS = [b"\xfc" + bytes(range(10)), b"\xfc\x01\x02", b"\xfc" + b"\xff" * 100]
+OTHER_PACKETS = [b"\xfc\x03", b"\xfc\x04\x05"]
+FINGERPRINT = (1_600_000_000_123_456_789, 52, 1_600_000_000_987_654_321, 48_000)
+
+_HEADER = struct.Struct("<4sHxxQI")
+DATA_LENGTH = len(encode_packet_records(PACKETS))
+
+
+class CatalogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.catalog_file = Path(self.directory.name) / "jingles.catalog"
+
+    def get_catalog_files(self):
+        return sorted(file.name for file in self.catalog_file.parent.iterdir())
+
+
+class AppendTest(CatalogTestCase):
+    def test_round_trip(self):
+        catalog = JingleCatalog(self.catalog_file)
+        catalog.append([CatalogUpdate("a", "Jingle A", "a.mp3", FINGERPRINT, PACKETS)])
+
+        reopened = JingleCatalog(self.catalog_file)
+        entry = reopened.get_entry("a")
+
+        self.assertEqual(reopened.version, CATALOG_VERSION)
+        self.assertEqual((entry.title, entry.filename, entry.fingerprint), ("Jingle A", "a.mp3", FINGERPRINT))
+        self.assertEqual(entry.frame_count, len(PACKETS))
+        self.assertAlmostEqual(entry.duration, 0.06)
+        self.assertEqual([bytes(packet) for packet in reopened.get_packets("a")], PACKETS)
+
+    def test_metadata_only_update_keeps_frames(self):
+        catalog = JingleCatalog(self.catalog_file)
+        catalog.append([CatalogUpdate("a", "Jingle A", "a.mp3", FINGERPRINT, PACKETS)])
+        offset = catalog.get_entry("a").offset
+
+        catalog.append([CatalogUpdate("a", "Renamed", "a.mp3", FINGERPRINT, None)])
+
+        self.assertEqual(catalog.get_entry("a").title, "Renamed")
+        self.assertEqual(catalog.get_entry("a").offset, offset)
+        self.assertEqual([bytes(packet) for packet in catalog.get_packets("a")], PACKETS)
+
+    def test_handed_out_packets_survive_appends(self):
+        catalog = JingleCatalog(self.catalog_file)
+        catalog.append([CatalogUpdate("a", "Jingle A", "a.mp3", FINGERPRINT, PACKETS)])
+        packets = catalog.get_packets("a")
+
+        catalog.append([CatalogUpdate("b", "Jingle B", "b.mp3", FINGERPRINT, OTHER_PACKETS)])
+
+        self.assertEqual([bytes(packet) for packet in packets], PACKETS)
+
+
+class RebuildTest(CatalogTestCase):
+    def test_rebuild_drops_entries_and_garbage(self):
+        catalog = JingleCatalog(self.catalog_file)
+        catalog.append([
+            CatalogUpdate("a", "Jingle A", "a.mp3", FINGERPRINT, PACKETS),
+            CatalogUpdate("b", "Jingle B", "b.mp3", FINGERPRINT, OTHER_PACKETS),
+        ])
+        catalog.append([CatalogUpdate("a", "Jingle A", "a.mp3", FINGERPRINT, OTHER_PACKETS)])
+        size_before = catalog.file_size
+
+        catalog.rebuild(["a"])
+
+        self.assertEqual(list(catalog.entries), ["a"])
+        self.assertLess(catalog.file_size, size_before)
+        self.assertEqual([bytes(packet) for packet in catalog.get_packets("a")], OTHER_PACKETS)
+
+    def test_rebuild_switches_to_a_new_generation_file(self):
+        catalog = JingleCatalog(self.catalog_file)
+        catalog.append([CatalogUpdate("a", "Jingle A", "a.mp3", FINGERPRINT, PACKETS)])
+        packets = catalog.get_packets("a")
+
+        catalog.rebuild(["a"])
+        catalog.rebuild(["a"])
+
+        # The mapped file is never replaced, the old generations are removed once possible
+        self.assertEqual(catalog.path.name, "jingles.catalog.2")
+        self.assertEqual(self.get_catalog_files(), ["jingles.catalog.2"])
+        self.assertEqual([bytes(packet) for packet in packets], PACKETS)
+
+        reopened = JingleCatalog(self.catalog_file)
+        self.assertEqual(reopened.generation, 2)
+        self.assertEqual([bytes(packet) for packet in reopened.get_packets("a")], PACKETS)
+
+    def test_stale_generations_are_removed_on_open(self):
+        catalog = JingleCatalog(self.catalog_file)
+        catalog.append([CatalogUpdate("a", "Jingle A", "a.mp3", FINGERPRINT, PACKETS)])
+        # E.g. left behind on Windows because the old generation was still mapped
+        (self.catalog_file.parent / "jingles.catalog.1").write_bytes(self.catalog_file.read_bytes())
+        self.catalog_file.write_bytes(b"stale")
+
+        reopened = JingleCatalog(self.catalog_file)
+
+        self.assertIn("a", reopened)
+        self.assertEqual(self.get_catalog_files(), ["jingles.catalog.1"])
+
+
+class OlderVersionsTest(CatalogTestCase):
+    def write_catalog(self, version: int, record: bytes, packets):
+        frames = encode_packet_records(packets)
+        index_offset = _HEADER.size + len(frames)
+
+        self.catalog_file.write_bytes(
+            _HEADER.pack(CATALOG_MAGIC, version, index_offset, 1) + frames + record
+            + struct.pack("<B", 1) + b"a" + struct.pack("<H", 8) + b"Jingle A"
+            + (struct.pack("<H", 5) + b"a.mp3" if version != 1 else b"")
+        )
+        return _HEADER.size, len(frames)
+
+    def test_version_1(self):
+        offset, data_length = self.write_catalog(
+            1, struct.pack("<QIIfd", _HEADER.size, len(PACKETS), DATA_LENGTH, 0.06, 1600000000.5),
+            PACKETS
+        )
+
+        catalog = JingleCatalog(self.catalog_file)
+        entry = catalog.get_entry("a")
+
+        self.assertEqual(catalog.version, 1)
+        self.assertIsNone(entry.filename)
+        self.assertEqual((entry.offset, entry.data_length), (offset, data_length))
+        # Only the float mtime is known, the size isn't
+        self.assertTrue(entry.has_source(1_600_000_000_500_000_000, 12345))
+        self.assertFalse(entry.has_source(1_600_000_001_500_000_000, 12345))
+
+    def test_version_2_is_upgraded_on_write(self):
+        self.write_catalog(
+            2, struct.pack(
+                "<QIIfdqqqq", _HEADER.size, len(PACKETS), DATA_LENGTH, 0.06, 1600000000.9876543,
+                *FINGERPRINT
+            ),
+            PACKETS
+        )
+
+        catalog = JingleCatalog(self.catalog_file)
+        self.assertEqual(catalog.version, 2)
+        self.assertEqual(catalog.get_entry("a").fingerprint, FINGERPRINT)
+        self.assertTrue(catalog.get_entry("a").has_source(FINGERPRINT[2], FINGERPRINT[3]))
+        self.assertFalse(catalog.get_entry("a").has_source(FINGERPRINT[2], FINGERPRINT[3] + 1))
+
+        catalog.append([CatalogUpdate("b", "Jingle B", "b.mp3", FINGERPRINT, OTHER_PACKETS)])
+
+        reopened = JingleCatalog(self.catalog_file)
+        self.assertEqual(reopened.version, CATALOG_VERSION)
+        self.assertEqual(reopened.get_entry("a").fingerprint, FINGERPRINT)
+        self.assertEqual([bytes(packet) for packet in reopened.get_packets("a")], PACKETS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+try:
+    from jingler.database import db
+    from jingler.jingles import JingleMode
+except FileNotFoundError:
+    raise unittest.SkipTest("The database needs data/configuration.toml (see configuration.EXAMPLE.toml).")
+
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        patcher = patch.object(db, "DATABASE_PATH", Path(directory.name) / "jingler.db")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def create_database() -> "db.Database":
+        # A fresh database (with empty caches) instead of the shared singleton
+        return type.__call__(db.Database)
+
+
+class SettingsTest(DatabaseTestCase):
+    def test_settings_rows_are_created_on_the_first_write(self):
+        async def write():
+            database = self.create_database()
+            await database.guild_set_default_jingle_id(1, "AAAAA")
+            await database.guild_set_jingle_mode(1, JingleMode.SINGLE)
+            await database.user_set_theme_song_jingle_id(2, "BBBBB")
+            await database.user_set_theme_song_jingle_id(2, None)
+            database.close()
+
+        async def read():
+            database = self.create_database()
+            try:
+                return (
+                    await database.guild_get_jingle_mode(1),
+                    await database.guild_get_theme_songs_mode(1),
+                    await database.guild_get_default_jingle_id(1),
+                    await database.user_get_theme_song_jingle_id(2),
+                    await database.guild_get_jingle_mode(3, JingleMode.RANDOM),
+                )
+            finally:
+                database.close()
+
+        asyncio.run(write())
+
+        # Setting one field keeps the other fields' defaults
+        self.assertEqual(asyncio.run(read()), (JingleMode.SINGLE, True, "AAAAA", None, JingleMode.RANDOM))
+
+
+if __name__ == "__main__":
+    unittest.main()
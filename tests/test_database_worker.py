@@ -0,0 +1,130 @@
+import asyncio
+import sqlite3
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from jingler.database.worker import DatabaseReaderPool, DatabaseWriter
+
+
+class DatabaseWorkerTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        self.database_path = Path(directory.name) / "test.db"
+        with sqlite3.connect(str(self.database_path)) as con:
+            con.execute("CREATE TABLE numbers (number INTEGER PRIMARY KEY)")
+            con.execute("INSERT INTO numbers VALUES (1)")
+        con.close()
+
+    def connect_reader(self) -> sqlite3.Connection:
+        return sqlite3.connect(f"{self.database_path.as_uri()}?mode=ro", uri=True)
+
+    def connect_writer(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.database_path), isolation_level=None)
+
+    def get_numbers(self):
+        con = self.connect_reader()
+        try:
+            return [number for number, in con.execute("SELECT number FROM numbers ORDER BY number")]
+        finally:
+            con.close()
+
+    @staticmethod
+    def insert(number: int):
+        def job(con: sqlite3.Connection) -> int:
+            con.execute("INSERT INTO numbers VALUES (?)", (number, ))
+            return number
+
+        return job
+
+
+class DatabaseReaderPoolTest(DatabaseWorkerTestCase):
+    def test_each_reader_thread_reuses_its_connection(self):
+        connections = []
+
+        def connect() -> sqlite3.Connection:
+            connections.append(threading.current_thread().name)
+            return self.connect_reader()
+
+        def read(con: sqlite3.Connection):
+            return threading.current_thread().name, con.execute("SELECT number FROM numbers").fetchone()[0]
+
+        async def run():
+            pool = DatabaseReaderPool(connect, max_readers=2)
+            try:
+                return await asyncio.gather(*(pool.submit(read) for _ in range(20)))
+            finally:
+                pool.close()
+
+        results = asyncio.run(run())
+
+        self.assertEqual({number for _, number in results}, {1})
+        self.assertTrue(all(name.startswith("jingler-db-reader") for name, _ in results))
+        # At most one connection per thread, no matter how many reads
+        self.assertLessEqual(len(connections), 2)
+        self.assertEqual(len(connections), len(set(connections)))
+
+    def test_errors_reach_the_caller(self):
+        async def run():
+            pool = DatabaseReaderPool(self.connect_reader, max_readers=1)
+            try:
+                with self.assertRaises(sqlite3.OperationalError):
+                    await pool.submit(lambda con: con.execute("INSERT INTO numbers VALUES (2)"))
+
+                # The connection is still usable afterwards
+                return await pool.submit(lambda con: con.execute("SELECT COUNT(*) FROM numbers").fetchone()[0])
+            finally:
+                pool.close()
+
+        self.assertEqual(asyncio.run(run()), 1)
+
+
+class DatabaseWriterTest(DatabaseWorkerTestCase):
+    def run_jobs(self, writer: DatabaseWriter, jobs):
+        async def run():
+            try:
+                return await asyncio.gather(*(writer.submit(job) for job in jobs), return_exceptions=True)
+            finally:
+                writer.close()
+
+        return asyncio.run(run())
+
+    def test_concurrent_writes_are_committed_together(self):
+        writer = DatabaseWriter(self.connect_writer, max_batch_size=5, max_batch_delay=1.0)
+
+        results = self.run_jobs(writer, [self.insert(number) for number in range(2, 7)])
+
+        self.assertEqual(results, [2, 3, 4, 5, 6])
+        # Resolved only once committed, so a separate connection already sees every write
+        self.assertEqual(self.get_numbers(), [1, 2, 3, 4, 5, 6])
+        self.assertEqual((writer.stats.batches, writer.stats.jobs, writer.stats.max_batch_size), (1, 5, 5))
+
+    def test_batches_are_capped(self):
+        writer = DatabaseWriter(self.connect_writer, max_batch_size=2, max_batch_delay=0.05)
+
+        self.run_jobs(writer, [self.insert(number) for number in range(2, 7)])
+
+        self.assertEqual(self.get_numbers(), [1, 2, 3, 4, 5, 6])
+        self.assertEqual((writer.stats.batches, writer.stats.max_batch_size, writer.stats.last_batch_size), (3, 2, 1))
+
+    def test_failing_job_only_rolls_back_itself(self):
+        def failing_job(con: sqlite3.Connection):
+            con.execute("INSERT INTO numbers VALUES (10)")
+            raise ValueError("Failed halfway through.")
+
+        writer = DatabaseWriter(self.connect_writer, max_batch_size=3, max_batch_delay=1.0)
+
+        results = self.run_jobs(writer, [self.insert(2), failing_job, self.insert(3)])
+
+        self.assertEqual(results[0], 2)
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2], 3)
+        self.assertEqual(self.get_numbers(), [1, 2, 3])
+        self.assertEqual(writer.stats.batches, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+from typing import List
+from unittest.mock import patch
+
+from jingler.catalog import JingleCatalog
+
+try:
+    from jingler import jingles
+except FileNotFoundError:
+    raise unittest.SkipTest("The jingle manager needs data/configuration.toml (see configuration.EXAMPLE.toml).")
+
+
+class ReloadTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        self.jingles_dir = Path(directory.name) / "jingles"
+        self.jingles_dir.mkdir()
+        self.catalog_file = Path(directory.name) / "jingles.catalog"
+        self.transcoded: List[str] = []
+
+        patchers = [
+            patch.object(jingles, "JINGLES_DIR", self.jingles_dir),
+            patch.object(jingles, "JingleCatalog", lambda: JingleCatalog(self.catalog_file)),
+            patch.object(jingles, "TranscodingService", lambda: self),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    # Stands in for the TranscodingService
+    max_workers = 2
+
+    async def transcode(self, jingle_file: Path) -> List[bytes]:
+        self.transcoded.append(jingle_file.name)
+        return [b"\xfc" + jingle_file.read_bytes()]
+
+    def write_jingle(self, filename: str, jingle_id: str, title: str, audio: bytes = b"audio"):
+        jingle_file = self.jingles_dir / filename
+        jingle_file.write_bytes(audio)
+        jingles.save_jingle_meta(jingle_file, title, jingle_id, 1.0)
+
+    def create_manager(self) -> "jingles.JingleManager":
+        # A fresh manager instead of the shared singleton
+        manager = type.__call__(jingles.JingleManager)
+        if manager.needs_import:
+            self.reload(manager)
+
+        return manager
+
+    @staticmethod
+    def reload(manager: "jingles.JingleManager"):
+        asyncio.run(manager.reload_available_jingles_async())
+
+    def get_titles(self, manager: "jingles.JingleManager"):
+        return {jingle.id: jingle.title for jingle in manager.snapshot.jingles}
+
+    def test_first_start_imports_meta_files(self):
+        self.write_jingle("a.wav", "AAAAA", "Jingle A")
+        self.write_jingle("b.wav", "BBBBB", "Jingle B")
+
+        manager = type.__call__(jingles.JingleManager)
+        self.assertTrue(manager.needs_import)
+        self.assertEqual(len(manager.snapshot), 0)
+
+        self.reload(manager)
+
+        self.assertEqual(self.get_titles(manager), {"AAAAA": "Jingle A", "BBBBB": "Jingle B"})
+        self.assertEqual(sorted(self.transcoded), ["a.wav", "b.wav"])
+        self.assertEqual([bytes(packet) for packet in manager.get_jingle_packets(manager.snapshot.get("AAAAA"))],
+                         [b"\xfcaudio"])
+
+    def test_deleted_meta_files_keep_their_jingles(self):
+        self.write_jingle("a.wav", "AAAAA", "Jingle A")
+        self.write_jingle("b.wav", "BBBBB", "Jingle B")
+        manager = self.create_manager()
+
+        (self.jingles_dir / "a.wav.meta").unlink()
+        (self.jingles_dir / "b.wav.meta").unlink()
+        self.reload(manager)
+
+        self.assertEqual(self.get_titles(manager), {"AAAAA": "Jingle A", "BBBBB": "Jingle B"})
+        self.assertEqual(self.get_titles(self.create_manager()), {"AAAAA": "Jingle A", "BBBBB": "Jingle B"})
+        self.assertEqual(len(self.transcoded), 2)
+
+    def test_deleted_audio_file_removes_the_jingle(self):
+        self.write_jingle("a.wav", "AAAAA", "Jingle A")
+        self.write_jingle("b.wav", "BBBBB", "Jingle B")
+        manager = self.create_manager()
+
+        (self.jingles_dir / "a.wav").unlink()
+        self.reload(manager)
+
+        self.assertEqual(self.get_titles(manager), {"BBBBB": "Jingle B"})
+        self.assertNotIn("AAAAA", manager.catalog)
+        self.assertEqual(manager.search_jingles("Jingle A"), [manager.snapshot.get("BBBBB")])
+
+    def test_changed_meta_file_only_updates_the_title(self):
+        self.write_jingle("a.wav", "AAAAA", "Jingle A")
+        manager = self.create_manager()
+
+        jingles.save_jingle_meta(self.jingles_dir / "a.wav", "Renamed jingle", "AAAAA", 1.0)
+        self.reload(manager)
+
+        self.assertEqual(self.get_titles(manager), {"AAAAA": "Renamed jingle"})
+        self.assertEqual(self.transcoded, ["a.wav"])
+
+    def test_changed_audio_file_is_transcoded_again(self):
+        self.write_jingle("a.wav", "AAAAA", "Jingle A")
+        manager = self.create_manager()
+        manager.get_jingle_packets(manager.snapshot.get("AAAAA"))
+
+        (self.jingles_dir / "a.wav").write_bytes(b"new audio")
+        self.reload(manager)
+
+        self.assertEqual(self.transcoded, ["a.wav", "a.wav"])
+        self.assertEqual([bytes(packet) for packet in manager.get_jingle_packets(manager.snapshot.get("AAAAA"))],
+                         [b"\xfcnew audio"])
+
+    def test_new_jingles_are_added(self):
+        self.write_jingle("a.wav", "AAAAA", "Jingle A")
+        manager = self.create_manager()
+
+        self.write_jingle("b.wav", "BBBBB", "Jingle B")
+        self.reload(manager)
+
+        self.assertEqual(self.get_titles(manager), {"AAAAA": "Jingle A", "BBBBB": "Jingle B"})
+        self.assertEqual(manager.find_jingle("jingle b"), manager.snapshot.get("BBBBB"))
+
+    def test_new_jingle_with_a_taken_id_is_skipped(self):
+        self.write_jingle("a.wav", "AAAAA", "Jingle A")
+        manager = self.create_manager()
+
+        self.write_jingle("b.wav", "AAAAA", "Jingle B")
+        self.reload(manager)
+
+        self.assertEqual(self.get_titles(manager), {"AAAAA": "Jingle A"})
+        self.assertEqual(manager.snapshot.get("AAAAA").path.name, "a.wav")
+
+    def test_changed_id(self):
+        self.write_jingle("a.wav", "AAAAA", "Jingle A")
+        manager = self.create_manager()
+
+        self.write_jingle("a.wav", "CCCCC", "Jingle A")
+        self.reload(manager)
+
+        self.assertEqual(self.get_titles(manager), {"CCCCC": "Jingle A"})
+        self.assertNotIn("AAAAA", manager.catalog)
+
+    def test_reload_applied_out_of_order_keeps_its_changes(self):
+        self.write_jingle("a.wav", "AAAAA", "Jingle A")
+        self.write_jingle("b.wav", "BBBBB", "Jingle B")
+        manager = self.create_manager()
+        manager.get_jingle_packets(manager.snapshot.get("AAAAA"))
+
+        jingles.save_jingle_meta(self.jingles_dir / "a.wav", "Renamed jingle", "AAAAA", 1.0)
+        older_reload = manager._commit_reload(manager._scan_jingles())
+        newer_reload = manager._replace_in_catalog({"BBBBB": [b"\xfcnew audio"]})
+        manager._apply_reload(newer_reload)
+        manager._apply_reload(older_reload)
+
+        self.assertIs(manager.snapshot, newer_reload.snapshot)
+        self.assertEqual(self.get_titles(manager), {"AAAAA": "Renamed jingle", "BBBBB": "Jingle B"})
+        self.assertEqual(manager.search_jingles("renamed"), [manager.snapshot.get("AAAAA")])
+        self.assertIsNone(manager.packet_cache.get_cached("AAAAA"))
+
+    def test_packets_read_during_a_reload_are_not_cached(self):
+        self.write_jingle("a.wav", "AAAAA", "Jingle A")
+        manager = self.create_manager()
+        jingle = manager.snapshot.get("AAAAA")
+
+        async def load():
+            outdated_load = asyncio.ensure_future(manager.load_jingle_packets(jingle))
+            await asyncio.sleep(0)
+            manager.packet_cache.invalidate("AAAAA")
+
+            # Doesn't join the read that started before the invalidation
+            return await asyncio.gather(outdated_load, manager.load_jingle_packets(jingle))
+
+        outdated_packets, packets = asyncio.run(load())
+
+        self.assertEqual([bytes(packet) for packet in packets], [b"\xfcaudio"])
+        self.assertIs(manager.packet_cache.get_cached("AAAAA"), packets)
+        self.assertIsNot(outdated_packets, packets)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+from typing import List
+from unittest.mock import patch
+
+from discord.opus import OpusNotLoaded
+
+from jingler import mixer
+from jingler.mixer import JingleMixer, FRAME_BYTES, MIXING_AVAILABLE
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class FakeDecoder:
+    """
+    "Decodes" a packet to a frame where every sample is the packet's first byte times 100.
+    """
+    def decode(self, data: bytes) -> bytes:
+        return numpy.full(FRAME_BYTES // 2, data[0] * 100, dtype=numpy.int16).tobytes()
+
+
+def get_samples(frame: bytes) -> List[int]:
+    return sorted(set(numpy.frombuffer(frame, dtype=numpy.int16).tolist()))
+
+
+@unittest.skipUnless(MIXING_AVAILABLE, "Mixing requires numpy.")
+class JingleMixerTest(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(mixer, "Decoder", FakeDecoder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.finished: List[bool] = []
+
+    def read_all(self, jingle_mixer: JingleMixer):
+        frames = []
+        while True:
+            frame = jingle_mixer.read()
+            if not frame:
+                return frames
+
+            frames.append((frame, jingle_mixer.is_opus()))
+
+    def test_single_jingle_is_passed_through(self):
+        jingle_mixer = JingleMixer(max_streams=2)
+        jingle_mixer.add([b"\x01", b"\x02"], on_finished=self.finished.append)
+
+        self.assertEqual(self.read_all(jingle_mixer), [(b"\x01", True), (b"\x02", True)])
+        self.assertEqual(self.finished, [True])
+        # Finished mixers don't take new jingles
+        self.assertFalse(jingle_mixer.add([b"\x03"]))
+
+    def test_overlapping_jingle_is_mixed(self):
+        jingle_mixer = JingleMixer(max_streams=2)
+        jingle_mixer.add([b"\x01", b"\x01", b"\x01"], on_finished=self.finished.append)
+        self.assertEqual(jingle_mixer.read(), b"\x01")
+
+        self.assertTrue(jingle_mixer.add([b"\x02"], on_finished=self.finished.append))
+        frames = self.read_all(jingle_mixer)
+
+        self.assertEqual([is_opus for _, is_opus in frames], [False, False])
+        self.assertEqual(get_samples(frames[0][0]), [300])
+        # Once mixing, it keeps decoding until the end
+        self.assertEqual(get_samples(frames[1][0]), [100])
+        self.assertEqual(self.finished, [True, True])
+
+    def test_quieter_jingle_is_never_passed_through(self):
+        jingle_mixer = JingleMixer(max_streams=2)
+        jingle_mixer.add([b"\x02"], gain_db=-6.0206)
+
+        frame = jingle_mixer.read()
+
+        self.assertFalse(jingle_mixer.is_opus())
+        self.assertEqual(get_samples(frame), [100])
+
+    def test_max_streams(self):
+        jingle_mixer = JingleMixer(max_streams=2)
+
+        self.assertTrue(jingle_mixer.add([b"\x01"]))
+        self.assertTrue(jingle_mixer.add([b"\x01"]))
+        self.assertFalse(jingle_mixer.add([b"\x01"]))
+
+    def test_limiter_keeps_samples_in_range(self):
+        jingle_mixer = JingleMixer(max_streams=2)
+        jingle_mixer.add([b"\xc8"])
+        jingle_mixer.add([b"\xc8"])
+
+        # 2 * 200 * 100 would clip, the limiter scales it down
+        self.assertEqual(get_samples(jingle_mixer.read()), [32767])
+
+    def test_no_mixing_without_libopus(self):
+        def decoder():
+            raise OpusNotLoaded()
+
+        jingle_mixer = JingleMixer(max_streams=2)
+        jingle_mixer.add([b"\x01", b"\x02"])
+
+        with patch.object(mixer, "Decoder", decoder):
+            self.assertFalse(jingle_mixer.add([b"\x03"]))
+
+        # The jingle that was already playing just carries on
+        self.assertEqual(self.read_all(jingle_mixer), [(b"\x01", True), (b"\x02", True)])
+
+
+if __name__ == "__main__":
+    unittest.main()
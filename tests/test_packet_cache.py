@@ -0,0 +1,101 @@
+import unittest
+
+from jingler.packet_cache import OpusPacketCache
+
+
+def packets(size: int):
+    return [b"\xfc" * size]
+
+
+class OpusPacketCacheTest(unittest.TestCase):
+    def test_get_loads_once(self):
+        cache = OpusPacketCache(max_bytes=100)
+        loads = []
+
+        def loader():
+            loads.append("a")
+            return packets(10)
+
+        cache.get("a", loader)
+        cache.get("a", loader)
+
+        self.assertEqual(loads, ["a"])
+        self.assertEqual((cache.stats.hits, cache.stats.misses), (1, 1))
+        self.assertEqual(cache.size, 10)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = OpusPacketCache(max_bytes=30)
+        cache.put("a", packets(10))
+        cache.put("b", packets(10))
+        cache.put("c", packets(10))
+        cache.get_cached("a")
+
+        cache.put("d", packets(10))
+
+        self.assertIsNone(cache.get_cached("b"))
+        self.assertIsNotNone(cache.get_cached("a"))
+        self.assertEqual(cache.stats.evictions, 1)
+        self.assertEqual(cache.size, 30)
+
+    def test_prioritised_entries_are_evicted_last(self):
+        cache = OpusPacketCache(max_bytes=30)
+        cache.prioritise("guild", "a")
+        cache.put("a", packets(10))
+        cache.put("b", packets(10))
+        cache.put("c", packets(10))
+
+        cache.put("d", packets(10))
+        cache.put("e", packets(10))
+
+        self.assertEqual(set(cache._entries), {"a", "d", "e"})
+
+        # Only prioritised entries left, the least recently used one goes
+        cache.prioritise("user 1", "d")
+        cache.prioritise("user 2", "e")
+        cache.put("f", packets(10))
+
+        self.assertEqual(set(cache._entries), {"d", "e", "f"})
+
+    def test_key_stays_prioritised_while_any_owner_prioritises_it(self):
+        cache = OpusPacketCache(max_bytes=20)
+        cache.prioritise("guild 1", "a")
+        cache.prioritise("guild 2", "a")
+        cache.put("a", packets(10))
+        cache.put("b", packets(10))
+
+        # Guild 1 switches to another default jingle, guild 2 still uses "a"
+        cache.prioritise("guild 1", "b")
+        cache.prioritise("guild 1", None)
+        cache.put("c", packets(10))
+
+        self.assertEqual(list(cache._entries), ["a", "c"])
+
+        cache.prioritise("guild 2", None)
+        cache.put("d", packets(10))
+        self.assertEqual(list(cache._entries), ["c", "d"])
+
+    def test_oversized_entries_are_not_cached(self):
+        cache = OpusPacketCache(max_bytes=20)
+        cache.put("a", packets(10))
+
+        cache.put("b", packets(30))
+
+        self.assertIsNone(cache.get_cached("b"))
+        self.assertIsNotNone(cache.get_cached("a"))
+
+    def test_invalidation_bumps_the_generation(self):
+        cache = OpusPacketCache(max_bytes=100)
+        cache.put("a", packets(10))
+        cache.put("b", packets(10))
+        generation = cache.generation
+
+        cache.invalidate("a")
+        self.assertIsNone(cache.get_cached("a"))
+        self.assertEqual((cache.size, cache.generation), (10, generation + 1))
+
+        cache.clear()
+        self.assertEqual((len(cache), cache.size, cache.generation), (0, 0, generation + 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from typing import List
+from unittest.mock import patch
+
+from jingler.scheduler import PlaybackPriority
+
+try:
+    from jingler.playback_queue import PlaybackQueueManager
+except FileNotFoundError:
+    raise unittest.SkipTest("The playback queue needs data/configuration.toml (see configuration.EXAMPLE.toml).")
+
+GUILD = SimpleNamespace(id=1)
+CHANNEL = SimpleNamespace(id=10, guild=GUILD)
+OTHER_CHANNEL = SimpleNamespace(id=11, guild=GUILD)
+
+
+class PlaybackQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = patch("jingler.playback_queue.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.played: List[str] = []
+
+    async def play(self, channel, jingle, fail_silently, priority, requested_at) -> bool:
+        self.played.append(jingle)
+        # Gives the test a chance to queue more jingles while this one "plays"
+        await asyncio.sleep(0)
+        return True
+
+    def create_queue(self, max_depth: int = 10) -> PlaybackQueueManager:
+        return PlaybackQueueManager(self.play, max_depth=max_depth, coalesce_window=2.0, max_age=30.0)
+
+    def test_join_burst_is_coalesced(self):
+        async def run():
+            queue = self.create_queue()
+            futures = [queue.enqueue(CHANNEL, "first")]
+            await asyncio.sleep(0)
+            for jingle in ("second", "third", "fourth"):
+                self.now += 0.5
+                futures.append(queue.enqueue(CHANNEL, jingle))
+
+            return queue, await asyncio.gather(*futures)
+
+        queue, results = asyncio.run(run())
+
+        # The first one was already playing, the rest collapsed into the newest join
+        self.assertEqual(self.played, ["first", "fourth"])
+        self.assertEqual(results, [True, False, False, True])
+        self.assertEqual((queue.stats.coalesced, queue.stats.played, queue.depth), (2, 2, 0))
+
+    def test_only_close_joins_in_the_same_channel_are_coalesced(self):
+        async def run():
+            queue = self.create_queue()
+            futures = [queue.enqueue(CHANNEL, "playing")]
+            await asyncio.sleep(0)
+            futures.append(queue.enqueue(CHANNEL, "first"))
+            self.now += 3
+            futures.append(queue.enqueue(CHANNEL, "later"))
+            futures.append(queue.enqueue(OTHER_CHANNEL, "other channel"))
+            futures.append(queue.enqueue(CHANNEL, "manual", priority=PlaybackPriority.MANUAL))
+            self.assertEqual(queue.get_guild_depth(GUILD.id), 4)
+
+            await asyncio.gather(*futures)
+            return queue
+
+        queue = asyncio.run(run())
+
+        # Manual requests skip ahead of the pending automatic ones
+        self.assertEqual(self.played, ["playing", "manual", "first", "later", "other channel"])
+        self.assertEqual(queue.stats.coalesced, 0)
+
+    def test_full_queue_drops_the_oldest_automatic_request(self):
+        async def run():
+            queue = self.create_queue(max_depth=2)
+            futures = [queue.enqueue(CHANNEL, "playing")]
+            await asyncio.sleep(0)
+            futures.append(queue.enqueue(CHANNEL, "manual", priority=PlaybackPriority.MANUAL))
+            futures.append(queue.enqueue(OTHER_CHANNEL, "oldest automatic"))
+            futures.append(queue.enqueue(OTHER_CHANNEL, "newest", priority=PlaybackPriority.MANUAL))
+
+            return queue, await asyncio.gather(*futures)
+
+        queue, results = asyncio.run(run())
+
+        self.assertEqual(self.played, ["playing", "manual", "newest"])
+        self.assertEqual(results, [True, True, False, True])
+        self.assertEqual(queue.stats.dropped_overflow, 1)
+
+    def test_stale_requests_are_dropped(self):
+        async def play(channel, jingle, fail_silently, priority, requested_at) -> bool:
+            self.played.append(jingle)
+            # Playing takes so long the pending jingle goes stale
+            self.now += 60
+            return True
+
+        async def run():
+            queue = PlaybackQueueManager(play, max_depth=10, coalesce_window=2.0, max_age=30.0)
+            futures = [queue.enqueue(CHANNEL, "slow"), queue.enqueue(OTHER_CHANNEL, "stale")]
+
+            return queue, await asyncio.gather(*futures)
+
+        queue, results = asyncio.run(run())
+
+        self.assertEqual(self.played, ["slow"])
+        self.assertEqual(results, [True, False])
+        self.assertEqual(queue.stats.dropped_stale, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
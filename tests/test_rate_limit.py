@@ -0,0 +1,93 @@
+import unittest
+from unittest.mock import patch
+
+from jingler.rate_limit import TokenBucketRegistry, try_consume_all
+
+
+class RateLimitTestCase(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = patch("jingler.rate_limit.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TokenBucketRegistryTest(RateLimitTestCase):
+    def test_burst_then_limited(self):
+        registry = TokenBucketRegistry(capacity=2, refill_per_second=1)
+
+        self.assertTrue(registry.try_consume("a"))
+        self.assertTrue(registry.try_consume("a"))
+        self.assertFalse(registry.try_consume("a"))
+        self.assertEqual(registry.limited, 1)
+
+        # Other keys have their own bucket
+        self.assertTrue(registry.try_consume("b"))
+
+    def test_refill(self):
+        registry = TokenBucketRegistry(capacity=2, refill_per_second=0.5)
+        registry.try_consume("a", 2)
+
+        self.now += 1
+        self.assertFalse(registry.try_consume("a"))
+        self.now += 1
+        self.assertTrue(registry.try_consume("a"))
+
+    def test_refill_is_capped_at_capacity(self):
+        registry = TokenBucketRegistry(capacity=2, refill_per_second=1)
+        registry.try_consume("a")
+
+        self.now += 60
+        self.assertTrue(registry.try_consume("a", 2))
+        self.assertFalse(registry.try_consume("a"))
+
+    def test_has_tokens_takes_nothing(self):
+        registry = TokenBucketRegistry(capacity=1, refill_per_second=1)
+
+        self.assertTrue(registry.has_tokens("a"))
+        self.assertTrue(registry.has_tokens("a"))
+        self.assertTrue(registry.try_consume("a"))
+        self.assertFalse(registry.has_tokens("a"))
+        self.assertEqual(registry.limited, 0)
+
+    def test_full_buckets_are_pruned(self):
+        registry = TokenBucketRegistry(capacity=1, refill_per_second=1)
+        with patch.object(TokenBucketRegistry, "PRUNE_THRESHOLD", 3):
+            registry.try_consume(0)
+            registry.try_consume(1)
+            self.now += 0.6
+            registry.try_consume(2)
+            self.now += 0.5
+            registry.try_consume("new")
+
+        # Keys 0 and 1 are full again, key 2 is still refilling
+        self.assertEqual(len(registry), 2)
+        self.assertFalse(registry.try_consume(2))
+
+
+class TryConsumeAllTest(RateLimitTestCase):
+    def test_takes_from_every_bucket(self):
+        members = TokenBucketRegistry(capacity=2, refill_per_second=1)
+        guilds = TokenBucketRegistry(capacity=2, refill_per_second=1)
+
+        self.assertTrue(try_consume_all([(members, "member"), (guilds, "guild")]))
+
+        self.assertTrue(members.try_consume("member"))
+        self.assertFalse(members.try_consume("member"))
+        self.assertTrue(guilds.try_consume("guild"))
+        self.assertFalse(guilds.try_consume("guild"))
+
+    def test_rejection_takes_nothing(self):
+        members = TokenBucketRegistry(capacity=1, refill_per_second=1)
+        guilds = TokenBucketRegistry(capacity=1, refill_per_second=1)
+        guilds.try_consume("guild")
+
+        self.assertFalse(try_consume_all([(members, "member"), (guilds, "guild")]))
+
+        # The member isn't charged for a join the guild limit dropped
+        self.assertTrue(members.has_tokens("member"))
+        self.assertEqual((members.limited, guilds.limited), (0, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
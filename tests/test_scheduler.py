@@ -0,0 +1,133 @@
+import asyncio
+import unittest
+from typing import List
+from unittest.mock import patch
+
+from jingler.scheduler import VoiceSlotScheduler, PlaybackPriority, VoiceSchedulerOverloaded
+
+
+class VoiceSlotSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = patch("jingler.scheduler.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.granted: List[int] = []
+
+    async def acquire(self, scheduler: VoiceSlotScheduler, guild_id: int,
+                      priority: PlaybackPriority = PlaybackPriority.AUTOMATIC):
+        await scheduler.acquire(guild_id, priority)
+        self.granted.append(guild_id)
+
+    @staticmethod
+    async def settle():
+        for _ in range(3):
+            await asyncio.sleep(0)
+
+    def test_slots_are_granted_until_full(self):
+        async def run():
+            scheduler = VoiceSlotScheduler(max_slots=2, max_waiting=10)
+            await self.acquire(scheduler, 1)
+            await self.acquire(scheduler, 2)
+            # A guild holding a slot doesn't need another one
+            await self.acquire(scheduler, 1)
+
+            waiting = asyncio.ensure_future(self.acquire(scheduler, 3))
+            await self.settle()
+            self.assertEqual((scheduler.active, scheduler.waiting), (2, 1))
+
+            scheduler.release(1)
+            await waiting
+            self.assertTrue(scheduler.holds_slot(3))
+            self.assertFalse(scheduler.holds_slot(1))
+
+        asyncio.run(run())
+        self.assertEqual(self.granted, [1, 2, 1, 3])
+
+    def test_recently_served_guilds_wait_behind_the_rest(self):
+        async def run():
+            scheduler = VoiceSlotScheduler(max_slots=1, max_waiting=10)
+            await self.acquire(scheduler, 1)
+            scheduler.release(1)
+            self.now += 1
+            await self.acquire(scheduler, 2)
+
+            # Guild 1 asks first, but guild 3 has never been served
+            waiting = [asyncio.ensure_future(self.acquire(scheduler, 1))]
+            await self.settle()
+            waiting.append(asyncio.ensure_future(self.acquire(scheduler, 3)))
+            await self.settle()
+
+            for guild_id in (2, 3):
+                self.now += 1
+                scheduler.release(guild_id)
+                await self.settle()
+            await asyncio.gather(*waiting)
+
+        asyncio.run(run())
+        self.assertEqual(self.granted, [1, 2, 3, 1])
+
+    def test_manual_requests_go_first(self):
+        async def run():
+            scheduler = VoiceSlotScheduler(max_slots=1, max_waiting=10)
+            await self.acquire(scheduler, 1)
+
+            waiting = [asyncio.ensure_future(self.acquire(scheduler, 2))]
+            await self.settle()
+            waiting.append(asyncio.ensure_future(self.acquire(scheduler, 3, PlaybackPriority.MANUAL)))
+            await self.settle()
+
+            scheduler.release(1)
+            await self.settle()
+            scheduler.release(3)
+            await asyncio.gather(*waiting)
+
+        asyncio.run(run())
+        self.assertEqual(self.granted, [1, 3, 2])
+
+    def test_overload_sheds_automatic_requests(self):
+        async def run():
+            scheduler = VoiceSlotScheduler(max_slots=1, max_waiting=1)
+            await self.acquire(scheduler, 1)
+            automatic = asyncio.ensure_future(self.acquire(scheduler, 2))
+            await self.settle()
+
+            with self.assertRaises(VoiceSchedulerOverloaded):
+                await self.acquire(scheduler, 3)
+
+            # A manual request takes the place of the newest waiting automatic one
+            manual = asyncio.ensure_future(self.acquire(scheduler, 4, PlaybackPriority.MANUAL))
+            await self.settle()
+            with self.assertRaises(VoiceSchedulerOverloaded):
+                await automatic
+
+            scheduler.release(1)
+            await manual
+            self.assertEqual(scheduler.stats.shed, 2)
+
+        asyncio.run(run())
+        self.assertEqual(self.granted, [1, 4])
+
+    def test_cancelled_request_is_skipped(self):
+        async def run():
+            scheduler = VoiceSlotScheduler(max_slots=1, max_waiting=10)
+            await self.acquire(scheduler, 1)
+            cancelled = asyncio.ensure_future(self.acquire(scheduler, 2))
+            waiting = asyncio.ensure_future(self.acquire(scheduler, 3))
+            await self.settle()
+
+            cancelled.cancel()
+            await self.settle()
+            scheduler.release(1)
+            await waiting
+
+            self.assertFalse(scheduler.holds_slot(2))
+            self.assertEqual((scheduler.active, scheduler.waiting), (1, 0))
+
+        asyncio.run(run())
+        self.assertEqual(self.granted, [1, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+from jingler.search import JingleSearchIndex, normalize_text, get_trigrams, SUBSTRING_MATCH_BONUS
+
+
+def get_ids(results):
+    return [jingle_id for jingle_id, _ in results]
+
+
+class NormalizeTextTest(unittest.TestCase):
+    def test_normalize_text(self):
+        self.assertEqual(normalize_text("  Ćao, Žiga! (Remix)_v2.mp3 "), "cao ziga remix v2 mp3")
+
+    def test_short_words_have_trigrams(self):
+        self.assertEqual(get_trigrams("a"), frozenset({"  a", " a "}))
+
+
+class JingleSearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = JingleSearchIndex()
+        self.index.add("AAAAA", "Hello there", "hello_there.mp3")
+        self.index.add("BBBBB", "Yellow submarine", "yellow.mp3")
+        self.index.add("CCCCC", "General Kenobi", "kenobi.wav")
+
+    def test_substring_matches_rank_first(self):
+        results = self.index.search("ello")
+
+        self.assertEqual(sorted(get_ids(results[:2])), ["AAAAA", "BBBBB"])
+        self.assertTrue(all(score >= SUBSTRING_MATCH_BONUS for _, score in results[:2]))
+        self.assertNotIn("CCCCC", get_ids(results))
+
+    def test_query_spanning_words(self):
+        self.assertEqual(get_ids(self.index.search("lo the"))[0], "AAAAA")
+
+    def test_typos_still_match(self):
+        results = self.index.search("kenoby")
+
+        self.assertEqual(get_ids(results)[0], "CCCCC")
+        self.assertLess(results[0][1], SUBSTRING_MATCH_BONUS)
+
+    def test_short_queries(self):
+        self.assertEqual(get_ids(self.index.search("ke")), ["CCCCC"])
+        self.assertEqual(self.index.search("?!"), [])
+
+    def test_exact_id(self):
+        self.assertEqual(get_ids(self.index.search("ccccc"))[0], "CCCCC")
+
+    def test_replace_and_remove(self):
+        self.index.add("AAAAA", "Goodbye", "goodbye.mp3")
+        self.assertNotIn("AAAAA", get_ids(self.index.search("hello")))
+        self.assertEqual(get_ids(self.index.search("goodbye"))[0], "AAAAA")
+
+        self.index.remove("AAAAA")
+        self.index.remove("AAAAA")
+        self.assertNotIn("AAAAA", get_ids(self.index.search("goodbye")))
+        self.assertNotIn("AAAAA", self.index)
+        self.assertEqual(len(self.index), 2)
+
+    def test_substring_match_among_many_partial_matches(self):
+        # Lots of jingles share most of the query's trigrams, only one contains the query
+        for number in range(200):
+            self.index.add(f"X{number:04}", f"Hello theater {number}")
+
+        results = self.index.search("hello there", limit=3)
+
+        self.assertEqual(get_ids(results)[0], "AAAAA")
+        self.assertEqual(len(results), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()